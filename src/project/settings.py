@@ -43,6 +43,70 @@ SITE_ID = 1
 # See: https://github.com/jalMogo/mgmt/issues/112
 API_CACHE_TIMEOUT = 1
 
+# Whether to gzip rendered API responses before storing them in the cache.
+# Compressed responses are served as-is to clients that accept gzip.
+API_CACHE_COMPRESS = False
+
+# How long to keep the entity tag of each cached response within a dataset.
+# Tags are invalidated along with the dataset's responses, so they can be kept
+# much longer than the responses themselves; this lets clients revalidate
+# (and get a 304) without the response being rendered again.
+API_CACHE_ETAG_TIMEOUT = 24 * 60 * 60
+
+# Only one request at a time rebuilds an expired response within a dataset.
+# Other requests for the same response are served the previous response if it
+# expired less than API_CACHE_STALE_TIMEOUT seconds ago (views may override
+# the stale timeout). Otherwise they wait up to API_CACHE_LOCK_WAIT seconds for
+# the rebuilt response, and then render it themselves.
+# A waiting request holds its worker (polling the cache) for the whole wait, so
+# on sync workers a burst of waiting requests can stall the pool. Keep the wait
+# short, and prefer serving stale responses.
+API_CACHE_LOCK_TIMEOUT = 30
+API_CACHE_LOCK_WAIT = 0.5
+API_CACHE_STALE_TIMEOUT = 10
+
+# Datasets (along with their permissions, keys and origins) are also cached in
+# each worker's memory for a short time, as long as the dataset's cache
+# generation does not change.
+API_LOCAL_CACHE_SIZE = 256
+API_LOCAL_CACHE_TIMEOUT = min(5, API_CACHE_TIMEOUT)
+
+# How long to keep each dataset's list of data index definitions. The list is
+# cleared whenever the indexes change, so this only bounds how long a missed
+# invalidation could last.
+API_INDEX_CACHE_TIMEOUT = 5 * 60
+
+# How often (in seconds) each worker should log its cache metrics. If None,
+# the metrics are only available from the cache-metrics utility route.
+API_CACHE_METRICS_LOG_INTERVAL = None
+
+# After a change to a dataset, re-render the API_CACHE_WARM_REQUESTS most
+# popular anonymous responses in the dataset in the background. Requests are
+# counted in fixed windows of API_CACHE_WARM_WINDOW seconds; the current
+# window is used first, then the previous one. Each window keeps at most
+# API_CACHE_WARM_TRACKED_REQUESTS distinct requests, dropping the least
+# popular ones to make room for new ones. Changes are batched for
+# API_CACHE_WARM_DELAY seconds before warming. Set the number to 0 to disable
+# warming; requests are not counted then.
+# Warming is also disabled unless API_CACHE_TIMEOUT is longer than
+# API_CACHE_WARM_DELAY, since warmed responses would mostly expire before
+# anyone reads them.
+API_CACHE_WARM_REQUESTS = 0
+API_CACHE_WARM_WINDOW = 24 * 60 * 60
+API_CACHE_WARM_TRACKED_REQUESTS = 1000
+API_CACHE_WARM_DELAY = 5
+
+# The text search configuration used to build and query the full-text search
+# documents of submitted things, and the weights (A, B, C, or D, highest
+# first) given to the values of particular data attributes in the documents.
+# All other public values have weight D. After changing these, rebuild the
+# documents with the update_search_vectors management command.
+API_SEARCH_CONFIG = 'simple'
+API_SEARCH_WEIGHTS = {
+    'A': ['name', 'title'],
+    'B': ['description'],
+}
+
 # Where should the user be redirected to when they visit the root of the site?
 ROOT_REDIRECT_TO = 'api-root'
 
@@ -141,6 +205,7 @@ MIDDLEWARE_CLASSES = (
 
     'sa_api_v2.middleware.RequestTimeLogger',
     'sa_api_v2.middleware.RequestBodyLogger',
+    'sa_api_v2.middleware.CacheBufferMiddleware',
 )
 
 # We only use the CORS Headers app for oauth. The Shareabouts API resources
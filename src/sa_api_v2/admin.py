@@ -205,6 +205,7 @@ class InlineDataSetPermissionAdmin(admin.TabularInline):
 class InlineDataIndexAdmin(admin.TabularInline):
     model = models.DataIndex
     extra = 0
+    readonly_fields = ('is_building',)
 
 
 class InlineWebhookAdmin(admin.StackedInline):
@@ -277,6 +278,22 @@ class DataSetAdmin(DjangoObjectActions, admin.ModelAdmin):
         except Exception as e:
             messages.error(request, 'Failed to clone dataset: %s (%s)' % (e, type(e).__name__))
 
+    def save_formset(self, request, form, formset, change):
+        # Rebuilding the values for an index can take a while on a large
+        # dataset, so do it in the background.
+        if formset.model is not models.DataIndex:
+            return super(DataSetAdmin, self).save_formset(request, form, formset, change)
+
+        indexes = formset.save(commit=False)
+        for index in formset.deleted_objects:
+            index.delete()
+        for index in indexes:
+            index.save(reindex='background')
+
+        if indexes:
+            messages.info(request, 'Reindexing %s. Please give it a few moments.' %
+                ', '.join(index.attr_name for index in indexes))
+
     def api_path(self, instance):
         path = reverse('dataset-detail', args=[instance.owner, instance.slug])
         return '<a href="{0}">{0}</a>'.format(path)
@@ -1,17 +1,210 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from django.conf import settings
 from django.core import cache as django_cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from . import utils
+from .metrics import cache_metrics
 
+from threading import local, Lock
+
+import cPickle as pickle
+import json
 import logging
+import time
 logger = logging.getLogger('sa_api_v2.cache')
 
 
 # A sentinel object to differentiate from None
 Undefined = object()
 
+
+class SetBackend (object):
+    """
+    The base class for objects that store sets of strings (e.g., the members
+    of a meta-key) in the cache. Set backends let us add and remove single
+    members without reading and writing the whole set, so that concurrent
+    workers do not clobber each other's updates.
+
+    Sets are stored under the same keys that the cache would use for them, so
+    deleting a key from the cache deletes the corresponding set as well.
+
+    """
+    def members(self, skey):
+        """
+        Return the set of members stored at the given key.
+        """
+        raise NotImplementedError()
+
+    def contains(self, skey, member):
+        """
+        Check whether the member is stored at the given key.
+        """
+        return member in self.members(skey)
+
+    def add(self, skey, members, timeout=None, client=None):
+        """
+        Add the members to the set stored at the given key, and (re)set the
+        set's expiration. If a client (pipeline) is given, queue the commands
+        on it instead of running them immediately.
+        """
+        raise NotImplementedError()
+
+    def remove(self, skey, members, client=None):
+        """
+        Remove the members from the set stored at the given key.
+        """
+        raise NotImplementedError()
+
+    def incr_scores(self, skey, scores, timeout=None, max_size=None, client=None):
+        """
+        Increment the scores of members of the scored (sorted) set stored at
+        the given key, adding any members that aren't there yet. scores is a
+        dictionary mapping members to the amount to add to their scores. If
+        max_size is given, the set is first trimmed to that many of its
+        highest scoring members, so that new members always get in.
+        """
+        raise NotImplementedError()
+
+    def top(self, skey, count):
+        """
+        Return up to count members of the scored set stored at the given key,
+        highest scores first.
+        """
+        raise NotImplementedError()
+
+    def pipeline(self):
+        """
+        Return a pipeline that cache and set commands can be queued on and
+        then sent in a single transaction, or None if the backend does not
+        support pipelining.
+        """
+        return None
+
+
+class RedisSetBackend (SetBackend):
+    """
+    Stores sets natively on the Redis server backing the default cache, using
+    SADD, SREM, SMEMBERS, and friends.
+
+    """
+    def get_connection(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    def make_key(self, skey):
+        return django_cache.cache.make_key(skey)
+
+    def members(self, skey):
+        conn = self.get_connection()
+        return set(member.decode('utf-8') for member in conn.smembers(self.make_key(skey)))
+
+    def contains(self, skey, member):
+        conn = self.get_connection()
+        return conn.sismember(self.make_key(skey), member)
+
+    def add(self, skey, members, timeout=None, client=None):
+        if not members:
+            return
+
+        key = self.make_key(skey)
+        pipe = client or self.get_connection().pipeline()
+        pipe.sadd(key, *members)
+        if timeout is not None:
+            pipe.expire(key, max(1, int(timeout)))
+        if client is None:
+            pipe.execute()
+
+    def remove(self, skey, members, client=None):
+        if not members:
+            return
+
+        conn = client or self.get_connection()
+        conn.srem(self.make_key(skey), *members)
+
+    def incr_scores(self, skey, scores, timeout=None, max_size=None, client=None):
+        if not scores:
+            return
+
+        key = self.make_key(skey)
+        pipe = client or self.get_connection().pipeline()
+        if max_size is not None:
+            pipe.zremrangebyrank(key, 0, -(max_size + 1))
+        for member, amount in scores.iteritems():
+            # Use keyword arguments; the positional order of ZINCRBY's
+            # arguments differs between versions of redis-py.
+            pipe.zincrby(key, value=member, amount=amount)
+        if timeout is not None:
+            pipe.expire(key, max(1, int(timeout)))
+        if client is None:
+            pipe.execute()
+
+    def top(self, skey, count):
+        conn = self.get_connection()
+        return [member.decode('utf-8') for member in conn.zrevrange(self.make_key(skey), 0, count - 1)]
+
+    def pipeline(self):
+        return self.get_connection().pipeline(transaction=True)
+
+
+class LocalSetBackend (SetBackend):
+    """
+    A stand-in for native sets, for when the default cache is not Redis (e.g.,
+    the local-memory cache used in development and testing). Each set is
+    stored as a pickled Python set in the cache itself. This is subject to
+    lost updates between concurrent processes, so don't use it in production.
+
+    """
+    def members(self, skey):
+        return set(django_cache.cache.get(skey) or ())
+
+    def add(self, skey, members, timeout=None, client=None):
+        if not members:
+            return
+
+        svalue = self.members(skey) | set(members)
+        django_cache.cache.set(skey, svalue, timeout)
+
+    def remove(self, skey, members, client=None):
+        svalue = self.members(skey) - set(members)
+        django_cache.cache.set(skey, svalue)
+
+    def incr_scores(self, skey, scores, timeout=None, max_size=None, client=None):
+        if not scores:
+            return
+
+        svalue = django_cache.cache.get(skey) or {}
+        if max_size is not None and len(svalue) > max_size:
+            svalue = dict((member, svalue[member]) for member in self.top_of(svalue, max_size))
+        for member, amount in scores.iteritems():
+            svalue[member] = svalue.get(member, 0) + amount
+        django_cache.cache.set(skey, svalue, timeout)
+
+    def top(self, skey, count):
+        svalue = django_cache.cache.get(skey) or {}
+        return self.top_of(svalue, count)
+
+    def top_of(self, svalue, count):
+        # Break ties the way Redis does (ZREVRANGE orders them in reverse).
+        return sorted(svalue, key=lambda member: (svalue[member], member), reverse=True)[:count]
+
+
+def get_set_backend():
+    """
+    Get the set backend appropriate for the default cache.
+    """
+    global _set_backend
+    if _set_backend is None:
+        cache_backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+        if cache_backend.startswith('django_redis.'):
+            _set_backend = RedisSetBackend()
+        else:
+            _set_backend = LocalSetBackend()
+    return _set_backend
+_set_backend = None
+
+
 class CacheBuffer (object):
     def __init__(self, initial_buffer=None):
         # When we get a value from the remote cache, it goes in to the buffer
@@ -25,6 +218,17 @@ class CacheBuffer (object):
         self.queue = {}
         self.delete_queue = set()
 
+        # When we add or remove set members, the changes go into the set
+        # queues. They are sent to the set backend as native set operations
+        # when we flush.
+        self.sadd_queue = {}
+        self.srem_queue = {}
+
+        # Score increments for scored sets are summed in the zincr queue, and
+        # sent along with everything else when we flush. Each entry is a pair
+        # of the increments and the timeout for the set.
+        self.zincr_queue = {}
+
     def get_many(self, keys):
         results = {}
         unseen_keys = []
@@ -78,6 +282,54 @@ class CacheBuffer (object):
             try: self.delete_queue.remove(key)
             except KeyError: pass
 
+    def setdefault(self, key, default, timeout=Undefined):
+        """
+        Get the value at the given key, or atomically set it to the default
+        if there is no value there yet. Unlike other writes, this is applied
+        to the remote cache right away.
+        """
+        value = self.get(key)
+        if value is None:
+            if timeout is Undefined:
+                timeout = settings.API_CACHE_TIMEOUT
+            django_cache.cache.add(key, default, timeout)
+            value = django_cache.cache.get(key, default)
+            self.buffer[key] = value
+        return value
+
+    def set_now(self, key, value, timeout=Undefined):
+        """
+        Set the value at the given key. Unlike other writes, this is applied
+        to the remote cache right away.
+        """
+        if timeout is Undefined:
+            timeout = settings.API_CACHE_TIMEOUT
+        django_cache.cache.set(key, value, timeout)
+
+        self.buffer[key] = value
+        self.queue.pop(key, None)
+        self.timeouts.pop(key, None)
+        self.delete_queue.discard(key)
+
+    def incr(self, key, initial=0, timeout=Undefined):
+        """
+        Atomically increment the integer at the given key, or set it to the
+        initial value if there is no value there yet. Unlike other writes,
+        this is applied to the remote cache right away.
+        """
+        try:
+            value = django_cache.cache.incr(key)
+        except ValueError:
+            if timeout is Undefined:
+                timeout = settings.API_CACHE_TIMEOUT
+            value = initial
+            django_cache.cache.set(key, value, timeout)
+
+        self.buffer[key] = value
+        self.queue.pop(key, None)
+        self.delete_queue.discard(key)
+        return value
+
     def delete(self, key):
         try: del self.queue[key]
         except KeyError: pass
@@ -88,6 +340,10 @@ class CacheBuffer (object):
         try: del self.timeouts[key]
         except KeyError: pass
 
+        self.sadd_queue.pop(key, None)
+        self.srem_queue.pop(key, None)
+        self.zincr_queue.pop(key, None)
+
         self.delete_queue.add(key)
 
     def delete_many(self, keys):
@@ -101,10 +357,41 @@ class CacheBuffer (object):
             try: del self.timeouts[key]
             except KeyError: pass
 
+            self.sadd_queue.pop(key, None)
+            self.srem_queue.pop(key, None)
+            self.zincr_queue.pop(key, None)
+
         self.delete_queue.update(keys)
 
     # === Set operations
 
+    def members(self, skey):
+        svalue = self.buffer.get(skey)
+        if isinstance(svalue, set):
+            return set(svalue)
+
+        # If the set has been deleted, only pending additions remain.
+        if skey in self.delete_queue:
+            svalue = set()
+        else:
+            svalue = get_set_backend().members(skey)
+
+        svalue -= self.srem_queue.get(skey, set())
+        svalue |= self.sadd_queue.get(skey, set())
+        self.buffer[skey] = svalue
+        return set(svalue)
+
+    def contains(self, skey, member):
+        svalue = self.buffer.get(skey)
+        if isinstance(svalue, set):
+            return member in svalue
+
+        if member in self.sadd_queue.get(skey, ()):
+            return True
+        if member in self.srem_queue.get(skey, ()) or skey in self.delete_queue:
+            return False
+        return get_set_backend().contains(skey, member)
+
     def add(self, skey, members):
         members = set(members)
 
@@ -116,8 +403,11 @@ class CacheBuffer (object):
         new_members = (self.sadd_queue.get(skey) or set()) | members
         self.sadd_queue[skey] = new_members
 
-        svalue = (self.buffer.get(skey) or set()) | members
-        self.buffer[skey] = svalue
+        # Only update the buffered set if we know all of its members already.
+        # Otherwise, they will be fetched and combined with the queue the next
+        # time they are needed.
+        if isinstance(self.buffer.get(skey), set):
+            self.buffer[skey] = self.buffer[skey] | members
 
     def remove(self, skey, members):
         members = set(members)
@@ -130,39 +420,143 @@ class CacheBuffer (object):
         old_members = (self.srem_queue.get(skey) or set()) | members
         self.srem_queue[skey] = old_members
 
-        svalue = (self.buffer.get(skey) or set()) - members
-        self.buffer[skey] = svalue
+        if isinstance(self.buffer.get(skey), set):
+            self.buffer[skey] = self.buffer[skey] - members
+
+    # === Scored set operations
+
+    def incr_score(self, skey, member, amount=1, timeout=Undefined, max_size=None):
+        """
+        Add to the score of the member in the scored set at the given key,
+        first trimming the set to its max_size highest scoring members if
+        given. Scored sets are write-mostly, so they are not buffered for
+        reading; use the set backend's top method to read them.
+        """
+        scores, _, _ = self.zincr_queue.get(skey, ({}, None, None))
+        scores[member] = scores.get(member, 0) + amount
+        self.zincr_queue[skey] = (scores, timeout, max_size)
 
     # === Flush, reset
 
     def flush(self):
+        set_backend = get_set_backend()
+
+        # If we can, send all of the changes to the cache in one transaction,
+        # in a single round trip.
+        pipe = set_backend.pipeline()
+        client_kwargs = {} if pipe is None else {'client': pipe}
+
+        # Deleted keys never overlap with the queue of values, but sets may
+        # have members added back after being deleted, so delete first.
+        if self.delete_queue:
+            django_cache.cache.delete_many(self.delete_queue, **client_kwargs)
+
         timed_queues = defaultdict(dict)
 
         if self.queue:
             for key, value in self.queue.iteritems():
                 timeout = self.timeouts[key]
+                if timeout is Undefined:
+                    timeout = settings.API_CACHE_TIMEOUT
                 timed_queues[timeout][key] = value
 
             for timeout, queue in timed_queues.iteritems():
-                if timeout is not Undefined:
+                if pipe is None:
                     django_cache.cache.set_many(queue, timeout)
                 else:
-                    django_cache.cache.set_many(queue, settings.API_CACHE_TIMEOUT)
+                    # The cache's set_many would use a pipeline of its own.
+                    for key, value in queue.iteritems():
+                        django_cache.cache.set(key, value, timeout, client=pipe)
 
-        # if self.sadd_queue:
-        #     for key, value in self.sadd_queue.iteritems():
+        for skey, members in self.srem_queue.iteritems():
+            set_backend.remove(skey, members, client=pipe)
 
-        if self.delete_queue:
-            django_cache.cache.delete_many(self.delete_queue)
+        for skey, members in self.sadd_queue.iteritems():
+            set_backend.add(skey, members, settings.API_CACHE_TIMEOUT, client=pipe)
+
+        for skey, (scores, timeout, max_size) in self.zincr_queue.iteritems():
+            if timeout is Undefined:
+                timeout = settings.API_CACHE_TIMEOUT
+            set_backend.incr_scores(skey, scores, timeout, max_size, client=pipe)
+
+        if pipe is not None:
+            pipe.execute()
 
         self.reset()
 
     def reset(self):
         self.queue = {}
         self.delete_queue = set()
+        self.sadd_queue = {}
+        self.srem_queue = {}
+        self.zincr_queue = {}
         self.timeouts = {}
         self.buffer = {}
-cache_buffer = CacheBuffer()
+
+
+class ThreadLocalCacheBuffer (CacheBuffer, local):
+    """
+    A cache buffer with separate state for each thread (or each greenlet, when
+    the threading module has been monkey-patched by gevent). Concurrent
+    requests should never see or flush each other's buffered changes. The
+    buffer is reset at the start of each request and flushed at the end by
+    the CacheBufferMiddleware.
+
+    """
+    pass
+cache_buffer = ThreadLocalCacheBuffer()
+
+
+class LocalLRUCache (object):
+    """
+    A small in-process cache that sits in front of the remote cache for data
+    that is needed on nearly every request. It holds at most
+    API_LOCAL_CACHE_SIZE values, for at most API_LOCAL_CACHE_TIMEOUT seconds
+    each. Each value is stored along with a version (e.g., a dataset
+    generation), and is only returned if it's asked for with that version.
+
+    Values are stored pickled, so that (like with the remote cache) each get
+    returns a new copy, and callers can't modify the cached value.
+
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, version=None):
+        with self.lock:
+            try:
+                value, entry_version, expires = self.entries.pop(key)
+            except KeyError:
+                return None
+
+            if entry_version != version or expires < time.time():
+                return None
+
+            # Mark the entry as most recently used.
+            self.entries[key] = (value, entry_version, expires)
+        return pickle.loads(value)
+
+    def set(self, key, value, version=None):
+        max_size = getattr(settings, 'API_LOCAL_CACHE_SIZE', 256)
+        timeout = getattr(settings, 'API_LOCAL_CACHE_TIMEOUT', settings.API_CACHE_TIMEOUT)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, version, time.time() + timeout)
+
+            # Evict the least recently used entries.
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
 
 
 class Cache (object):
@@ -198,7 +592,7 @@ class Cache (object):
         keys = set()
         for prefix in prefixes:
             meta_key = self.get_meta_key(prefix)
-            keys |= cache_buffer.get(meta_key) or set()
+            keys |= cache_buffer.members(meta_key)
             keys.add(meta_key)
         logger.debug('Keys with prefixes "%s": "%s"' % ('", "'.join(prefixes), '", "'.join(keys)))
         return keys
@@ -275,23 +669,29 @@ class Cache (object):
 
             # Cache the key itself
             meta_key = self.get_serialized_data_meta_key(inst_key)
-            keys = cache_buffer.get(meta_key) or set()
-            keys.add(key)
-            cache_buffer.set(meta_key, keys)
+            cache_buffer.add(meta_key, [key])
 
         return data
 
     def get_serialized_data_keys(self, inst_key):
         meta_key = self.get_serialized_data_meta_key(inst_key)
         if meta_key is not None:
-            keys = cache_buffer.get(meta_key)
-            return (keys or set()) | set([meta_key])
+            keys = cache_buffer.members(meta_key)
+            return keys | set([meta_key])
         else:
             return set()
 
     def get_other_keys(self, **params):
         return set()
 
+    def clear_generations(self, **params):
+        """
+        Increment any generation numbers that cached data related to the
+        instance is keyed on, invalidating all of that data at once.
+        """
+        # Override in derived classes
+        pass
+
     def clear_instance(self, obj):
         # Collect information for cache keys
         params = self.get_cached_instance_params(obj.pk, lambda: obj)
@@ -303,7 +703,12 @@ class Cache (object):
         # Collect other related keys
         other_keys = self.get_other_keys(**params) | set([self.get_instance_params_key(obj.pk)])
         # Clear all the keys
-        self.clear_keys(*(prefixed_keys | data_keys | other_keys))
+        keys = prefixed_keys | data_keys | other_keys
+        self.clear_keys(*keys)
+        # Invalidate the versioned keys
+        self.clear_generations(**params)
+
+        cache_metrics.observe('invalidated_keys', self.__class__.__name__, len(keys))
 
 
 class UserCache (Cache):
@@ -338,8 +743,40 @@ class UserCache (Cache):
     def get_other_keys(cls, **params):
         return set([cls.get_instance_key(**params)])
 
+    def get_submitted_dataset_params(self, **params):
+        """
+        Get the identifying parameters of every dataset that the user has
+        submitted things or tags to.
+        """
+        from .models import DataSet
+        user_id = params['user_id']
+        submitted_datasets = DataSet.objects.filter(things__submitter_id=user_id)
+        tagged_datasets = DataSet.objects.filter(tags__place_tags__submitter_id=user_id)
+
+        dataset_keys = set()
+        for datasets in (submitted_datasets, tagged_datasets):
+            dataset_keys.update(datasets.order_by().values_list('owner__username', 'slug').distinct())
+        return [{'owner_username': owner_username, 'dataset_slug': dataset_slug}
+                for owner_username, dataset_slug in dataset_keys]
+
+    def clear_generations(self, **params):
+        """
+        Users are serialized along with the things and tags they submit, so
+        invalidate the responses of every dataset that they've submitted to.
+        """
+        self.clear_dataset_generations(self.get_submitted_dataset_params(**params))
+
+    def clear_dataset_generations(self, dataset_params):
+        dataset_cache = DataSetCache()
+        for params in dataset_params:
+            dataset_cache.clear_generations(**params)
+
 
 class DataSetCache (Cache):
+    # Datasets are needed on almost every request, so keep recently used ones
+    # in memory as well. This is shared by all DataSetCache instances.
+    local_cache = LocalLRUCache()
+
     # == Raw query caching
     def get_instance_key(self, **params):
         return ':'.join(['dataset-instance', params['owner_username'], params['dataset_slug']])
@@ -349,22 +786,221 @@ class DataSetCache (Cache):
         Get a full cached dataset instance.
         """
         key = self.get_instance_key(**params)
-        return cache_buffer.get(key)
+        return self.get_local_or_remote(key, **params)
 
     def set_instance(self, instance, **params):
         key = self.get_instance_key(**params)
-        cache_buffer.set(key, instance)
+        self.set_local_and_remote(key, instance, **params)
 
     def get_permissions_key(self, **params):
         return ':'.join(['dataset-permissions', params['owner_username'], params['dataset_slug']])
 
     def get_permissions(self, **params):
         key = self.get_permissions_key(**params)
-        return cache_buffer.get(key)
+        return self.get_local_or_remote(key, **params)
 
     def save_permissions(self, permissions, **params):
         key = self.get_permissions_key(**params)
-        cache_buffer.set(key, permissions)
+        self.set_local_and_remote(key, permissions, **params)
+
+    def get_indexes_key(self, dataset_id):
+        return 'dataset-indexes:%s' % (dataset_id,)
+
+    def get_indexes(self, dataset_id, indexes_getter):
+        """
+        Get the list of the dataset's data indexes. If they're not cached,
+        get them with indexes_getter and cache them. The indexes change
+        rarely, and are cleared when they do (see clear_indexes), so they are
+        kept for API_INDEX_CACHE_TIMEOUT seconds.
+
+        Indexes are used outside of requests too (e.g., by tasks), where the
+        cache buffer is never reset, so they skip the buffer altogether.
+        """
+        key = self.get_indexes_key(dataset_id)
+        indexes = django_cache.cache.get(key)
+
+        if indexes is None:
+            indexes = list(indexes_getter())
+            timeout = getattr(settings, 'API_INDEX_CACHE_TIMEOUT', 5 * 60)
+            django_cache.cache.set(key, indexes, timeout)
+        return indexes
+
+    def clear_indexes(self, dataset_id):
+        """
+        Remove the dataset's cached list of data indexes right away, rather
+        than when the cache buffer is flushed, since indexes may change
+        outside of a request (e.g., when a dataset is cloned in a task).
+        """
+        django_cache.cache.delete(self.get_indexes_key(dataset_id))
+
+    def get_local_or_remote(self, key, **params):
+        """
+        Get the value at the given key from the local cache if it is there
+        and is from the current generation of the dataset. Otherwise get it
+        from the remote cache, and remember it locally.
+        """
+        generation = self.get_generation(**params)
+        value = self.local_cache.get(key, generation)
+
+        if value is None:
+            value = cache_buffer.get(key)
+            if value is None:
+                return None
+            self.local_cache.set(key, value, generation)
+        return value
+
+    def set_local_and_remote(self, key, value, **params):
+        generation = self.get_generation(**params)
+        cache_buffer.set(key, value)
+        self.local_cache.set(key, value, generation)
+
+    # == Generations
+    def get_generation_key(self, **params):
+        return ':'.join(['dataset-generation', params['owner_username'], params['dataset_slug']])
+
+    def get_generation(self, **params):
+        """
+        Get the current generation number for the dataset. Cached data about
+        anything in the dataset (e.g., API responses) should be keyed on the
+        generation, so that it is all invalidated when the generation is
+        incremented. Stale data is left to expire.
+        """
+        key = self.get_generation_key(**params)
+        return cache_buffer.setdefault(key, self.get_initial_generation(), timeout=None)
+
+    def incr_generation(self, **params):
+        key = self.get_generation_key(**params)
+        return cache_buffer.incr(key, self.get_initial_generation(), timeout=None)
+
+    def get_initial_generation(self):
+        # Start counting from the current time, so that if the generation is
+        # ever evicted from the cache, we do not re-use old generation numbers.
+        return int(time.time() * 1000)
+
+    def get_last_modified_key(self, **params):
+        return ':'.join(['dataset-modified', params['owner_username'], params['dataset_slug']])
+
+    def get_last_modified(self, **params):
+        """
+        Get the time (in seconds since the epoch) that anything in the dataset
+        was last changed. If we don't know, assume that it was just changed.
+        """
+        key = self.get_last_modified_key(**params)
+        return cache_buffer.setdefault(key, int(time.time()), timeout=None)
+
+    def clear_generations(self, **params):
+        self.bump_generation(**params)
+
+        # Until the changes are committed, other readers still see the old
+        # data, and may cache it under the new generation. Bump it again
+        # once they can see the changes.
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self.bump_generation(**params))
+
+        self.schedule_warming(**params)
+
+    def bump_generation(self, **params):
+        self.incr_generation(**params)
+
+        # Anything cached locally is from an older generation now. Other
+        # processes will notice that when they check the generation.
+        self.local_cache.delete(self.get_instance_key(**params))
+        self.local_cache.delete(self.get_permissions_key(**params))
+
+        # Always move the modification time forward, so that anything served
+        # before the bump can't pass for what's there after it, even within
+        # the same second. This may run after the cache buffer has been
+        # flushed (e.g., when a transaction commits), so write it through.
+        key = self.get_last_modified_key(**params)
+        last_modified = django_cache.cache.get(key) or 0
+        cache_buffer.set_now(key, max(int(time.time()), last_modified + 1), timeout=None)
+
+    # == Cache warming
+    def get_hot_requests_key(self, window, **params):
+        return ':'.join(['dataset-hot-requests', params['owner_username'], params['dataset_slug'], str(window)])
+
+    def get_hot_requests_window(self):
+        """
+        Requests are counted in fixed windows of API_CACHE_WARM_WINDOW
+        seconds. Get the number of the current window.
+        """
+        window_size = getattr(settings, 'API_CACHE_WARM_WINDOW', 24 * 60 * 60)
+        return int(time.time() // window_size)
+
+    @staticmethod
+    def is_warming_enabled():
+        """
+        Check whether popular responses should be warmed after writes (and
+        requests counted for it). Warmed responses only live for
+        API_CACHE_TIMEOUT seconds; if that is no longer than the
+        API_CACHE_WARM_DELAY that writes are batched for, they would mostly
+        expire before anyone reads them, so warming is skipped.
+        """
+        if not getattr(settings, 'API_CACHE_WARM_REQUESTS', 0):
+            return False
+        return settings.API_CACHE_TIMEOUT > getattr(settings, 'API_CACHE_WARM_DELAY', 5)
+
+    def record_request(self, request_info, **params):
+        """
+        Count a request for a cached response in the dataset, so that the most
+        popular responses can be re-rendered ahead of readers when the dataset
+        changes. The request_info is a dictionary that describes the request
+        well enough to reconstruct it (see tasks.warm_dataset_cache).
+        """
+        key = self.get_hot_requests_key(self.get_hot_requests_window(), **params)
+        member = json.dumps(request_info, sort_keys=True)
+
+        # Each window's counts are still read during the next window.
+        timeout = 2 * getattr(settings, 'API_CACHE_WARM_WINDOW', 24 * 60 * 60)
+        max_size = getattr(settings, 'API_CACHE_WARM_TRACKED_REQUESTS', 1000)
+        cache_buffer.incr_score(key, member, timeout=timeout, max_size=max_size)
+
+    def get_hot_requests(self, count, **params):
+        """
+        Get the request info for the count most popular requests in the
+        dataset, most popular first. Requests from the current window come
+        first, followed by those from the previous (complete) window.
+        """
+        window = self.get_hot_requests_window()
+        set_backend = get_set_backend()
+
+        members = []
+        for key in (self.get_hot_requests_key(window, **params),
+                    self.get_hot_requests_key(window - 1, **params)):
+            for member in set_backend.top(key, count):
+                if member not in members:
+                    members.append(member)
+        return [json.loads(member) for member in members[:count]]
+
+    def get_warming_key(self, **params):
+        return ':'.join(['dataset-warming', params['owner_username'], params['dataset_slug']])
+
+    def schedule_warming(self, **params):
+        """
+        Schedule a task to re-render the dataset's most popular responses.
+        Writes often come in bursts, so the task is delayed by
+        API_CACHE_WARM_DELAY seconds, and only one task is scheduled per
+        dataset in that time.
+        """
+        if not self.is_warming_enabled():
+            return
+
+        delay = getattr(settings, 'API_CACHE_WARM_DELAY', 5)
+        if not django_cache.cache.add(self.get_warming_key(**params), True, delay):
+            return
+
+        from .tasks import warm_dataset_cache
+        args = (params['owner_username'], params['dataset_slug'])
+
+        def schedule():
+            try:
+                warm_dataset_cache.apply_async(args=args, countdown=delay)
+            except Exception:
+                # Warming is only an optimization; never fail a write for it.
+                logger.exception('Could not schedule cache warming for dataset "%s/%s"' % args)
+
+        # Don't let the task see the data from before the write.
+        transaction.on_commit(schedule)
 
     # == Serialized data caching
     def get_bulk_data_cache_key(self, dataset_id, submission_set_name, format, **flags):
@@ -393,7 +1029,8 @@ class DataSetCache (Cache):
         return prefixes
 
     def get_other_keys(self, **params):
-        return set([self.get_instance_key(**params), self.get_permissions_key(**params)])
+        return set([self.get_instance_key(**params), self.get_permissions_key(**params),
+                    self.get_indexes_key(params['dataset_id'])])
 
 
 class PlaceCache (Cache):
@@ -410,19 +1047,19 @@ class PlaceCache (Cache):
         return params
 
     def get_request_prefixes(self, **params):
-        owner, dataset, place = map(params.get, ('owner_username', 'dataset_slug', 'place_id'))
+        owner = params.get('owner_username')
         prefixes = super(PlaceCache, self).get_request_prefixes(**params)
 
-        instance_path = reverse('place-detail', args=[owner, dataset, place])
-        collection_path = reverse('place-list', args=[owner, dataset])
-        dataset_instance_path = reverse('dataset-detail', args=[owner, dataset])
+        # Requests within the dataset are invalidated by the generation; the
+        # owner's dataset list is not, since it spans datasets.
         dataset_collection_path = reverse('dataset-list', args=[owner])
-        action_collection_path = reverse('action-list', args=[owner, dataset])
-        prefixes.update([instance_path, collection_path, dataset_instance_path,
-                         dataset_collection_path, action_collection_path])
+        prefixes.update([dataset_collection_path])
 
         return prefixes
 
+    def clear_generations(self, **params):
+        self.dataset_cache.clear_generations(**params)
+
 
 class SubmissionCache (Cache):
     dataset_cache = DataSetCache()
@@ -446,33 +1083,19 @@ class SubmissionCache (Cache):
         return dataset_serialized_data_keys | place_serialized_data_keys
 
     def get_request_prefixes(self, **params):
-        owner, dataset, place_model, submission_set_name, submission = map(params.get, ['owner_username', 'dataset_slug', 'place_id', 'submission_set_name', 'submission_id'])
+        owner = params.get('owner_username')
         prefixes = super(SubmissionCache, self).get_request_prefixes(**params)
 
-        # TODO: it's pretty clear that a developer should be able to register
-        # a URL with or cache key or prefix or something to be cleared. How
-        # would that work?
-        specific_instance_path = reverse('submission-detail', args=[owner, dataset, place_model, submission_set_name, submission])
-        general_instance_path = reverse('submission-detail', args=[owner, dataset, place_model, 'submissions', submission])
-        specific_collection_path = reverse('submission-list', args=[owner, dataset, place_model, submission_set_name])
-        general_collection_path = reverse('submission-list', args=[owner, dataset, place_model, 'submissions'])
-        specific_all_path = reverse('dataset-submission-list', args=[owner, dataset, submission_set_name])
-        general_all_path = reverse('dataset-submission-list', args=[owner, dataset, 'submissions'])
-        place_instance_path = reverse('place-detail', args=[owner, dataset, place_model])
-        place_collection_path = reverse('place-list', args=[owner, dataset])
-        dataset_instance_path = reverse('dataset-detail', args=[owner, dataset])
+        # Requests within the dataset are invalidated by the generation; the
+        # owner's dataset list is not, since it spans datasets.
         dataset_collection_path = reverse('dataset-list', args=[owner])
-        action_collection_path = reverse('action-list', args=[owner, dataset])
-
-        prefixes.update([specific_instance_path, general_instance_path,
-                         specific_collection_path, general_collection_path,
-                         specific_all_path, general_all_path,
-                         place_instance_path, place_collection_path,
-                         dataset_instance_path, dataset_collection_path,
-                         action_collection_path])
+        prefixes.update([dataset_collection_path])
 
         return prefixes
 
+    def clear_generations(self, **params):
+        self.dataset_cache.clear_generations(**params)
+
 
 class PlaceTagCache (Cache):
     dataset_cache = DataSetCache()
@@ -488,13 +1111,25 @@ class PlaceTagCache (Cache):
         })
         return params
 
+    def clear_generations(self, **params):
+        self.dataset_cache.clear_generations(**params)
+
 
 class ActionCache (Cache):
+    dataset_cache = DataSetCache()
+
     def clear_instance(self, obj):
-        keys = cache_buffer.get('action_keys') or set()
+        keys = cache_buffer.members('action_keys')
         keys.add('action_keys')
         cache_buffer.delete_many(keys)
 
+        # Action lists within a dataset are keyed on its generation.
+        params = self.dataset_cache.get_cached_instance_params(
+            obj.thing.dataset_id, lambda: obj.thing.dataset)
+        self.dataset_cache.clear_generations(**params)
+
+        cache_metrics.observe('invalidated_keys', self.__class__.__name__, len(keys))
+
 
 class ThingWithAttachmentCache (Cache):
     place_cache = PlaceCache()
@@ -517,6 +1152,7 @@ class ThingWithAttachmentCache (Cache):
 
 
 class AttachmentCache (Cache):
+    dataset_cache = DataSetCache()
     thing_cache = ThingWithAttachmentCache()
     place_cache = PlaceCache()
     submission_cache = SubmissionCache()
@@ -530,43 +1166,6 @@ class AttachmentCache (Cache):
         })
         return params
 
-    def get_request_prefixes(self, **params):
-        prefixes = super(AttachmentCache, self).get_request_prefixes(**params)
-        if params['thing_type'] == 'submission':
-            return prefixes | self.get_submission_attachment_request_prefixes(**params)
-        else:
-            return prefixes | self.get_place_attachment_request_prefixes(**params)
-
-    def get_submission_attachment_request_prefixes(self, **params):
-        owner, dataset, place, submission_set_name, submission = map(params.get, ['owner_username', 'dataset_slug', 'place_id', 'submission_set_name', 'submission_id'])
-        prefixes = set()
-
-        specific_instance_path = reverse('submission-detail', args=[owner, dataset, place, submission_set_name, submission])
-        general_instance_path = reverse('submission-detail', args=[owner, dataset, place, 'submissions', submission])
-        specific_collection_path = reverse('submission-list', args=[owner, dataset, place, submission_set_name])
-        general_collection_path = reverse('submission-list', args=[owner, dataset, place, 'submissions'])
-        specific_all_path = reverse('dataset-submission-list', args=[owner, dataset, submission_set_name])
-        general_all_path = reverse('dataset-submission-list', args=[owner, dataset, 'submissions'])
-        action_collection_path = reverse('action-list', args=[owner, dataset])
-
-        prefixes.update([specific_instance_path, general_instance_path,
-                         specific_collection_path, general_collection_path,
-                         specific_all_path, general_all_path,
-                         action_collection_path])
-
-        return prefixes
-
-    def get_place_attachment_request_prefixes(self, **params):
-        owner, dataset, place = map(params.get, ('owner_username', 'dataset_slug', 'place_id'))
-        prefixes = set()
-
-        instance_path = reverse('place-detail', args=[owner, dataset, place])
-        collection_path = reverse('place-list', args=[owner, dataset])
-        action_collection_path = reverse('action-list', args=[owner, dataset])
-        prefixes.update([instance_path, collection_path, action_collection_path])
-
-        return prefixes
-
     def get_other_keys(self, **params):
         dataset_id = params.get('dataset_id')
         thing_id = params.get('thing_id')
@@ -579,3 +1178,6 @@ class AttachmentCache (Cache):
 
         # Union the two sets
         return set([thing_attachments_key]) | thing_serialized_data_keys
+
+    def clear_generations(self, **params):
+        self.dataset_cache.clear_generations(**params)
@@ -16,11 +16,11 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         # get our nonnumbered user-generated rain gardens:
         nonnumbered_user_generated = sa_models.Place.objects.exclude(
-            data__contains='"rain_garden_number":').order_by('pk')
+            data__has_key='rain_garden_number').order_by('pk')
 
         # get our nonnumbered imported rain gardens:
-        nonnumbered_imported = sa_models.Place.objects.filter(
-            data__contains='"rain_garden_number": ""').order_by('pk')
+        nonnumbered_imported = sa_models.Place.objects.filter_by_data_contains(
+            {'rain_garden_number': ''}).order_by('pk')
 
         nonnumbered_rain_gardens = sorted(
             chain(nonnumbered_user_generated, nonnumbered_imported),
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from sa_api_v2.models import SubmittedThing
+from sa_api_v2.models.core import update_search_trigger
+
+import logging
+log = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Rebuild the full-text search documents of all submitted things, '
+            'and the trigger that maintains them. Run this after changing the '
+            'API_SEARCH_CONFIG or API_SEARCH_WEIGHTS settings.')
+
+    def handle(self, *args, **options):
+        log.info('Redefining the search document trigger')
+        update_search_trigger()
+
+        log.info('Rebuilding the search documents of all submitted things')
+        SubmittedThing.objects.all().update_search_vectors()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from sa_api_v2.models import DataSet
+from sa_api_v2.tasks import warm_dataset_cache
+
+import logging
+log = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = ('Re-render the most popular cached responses for the given '
+            'datasets (as owner/slug), or for all datasets. Useful after '
+            'a deploy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', metavar='owner/slug')
+        parser.add_argument('--count', type=int, default=None,
+            help='The number of responses to warm per dataset (defaults to '
+                 'the API_CACHE_WARM_REQUESTS setting).')
+
+    def handle(self, *args, **options):
+        if options['datasets']:
+            try:
+                datasets = [name.split('/') for name in options['datasets']]
+                datasets = [(owner, slug) for owner, slug in datasets]
+            except ValueError:
+                raise CommandError('Datasets should be given as owner/slug.')
+        else:
+            datasets = DataSet.objects.values_list('owner__username', 'slug')
+
+        for owner_username, dataset_slug in datasets:
+            log.info('Warming the cache for dataset %s/%s' % (owner_username, dataset_slug))
+            warmed = warm_dataset_cache(owner_username, dataset_slug, count=options['count'])
+            self.stdout.write('%s/%s: warmed %s response(s)' % (owner_username, dataset_slug, warmed))
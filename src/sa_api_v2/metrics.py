@@ -0,0 +1,79 @@
+"""
+A lightweight, in-process registry of counters and timings, used to see how
+effective the API caches are. Each worker process keeps its own numbers; they
+can be scraped from the cache-metrics utility route, or logged periodically
+by setting API_CACHE_METRICS_LOG_INTERVAL (in seconds).
+"""
+
+from collections import defaultdict
+from django.conf import settings
+from threading import Lock
+
+import json
+import logging
+import time
+logger = logging.getLogger('sa_api_v2.metrics')
+
+
+class MetricsRegistry (object):
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(lambda: defaultdict(int))
+            self.timings = defaultdict(dict)
+            self.since = time.time()
+            self.last_logged = self.since
+
+    def incr(self, name, label, amount=1):
+        """
+        Add to the counter with the given name for the given label (e.g., the
+        number of cache hits for a particular view).
+        """
+        with self.lock:
+            self.counters[name][label] += amount
+
+    def observe(self, name, label, value):
+        """
+        Record a measurement (e.g., a duration, or a number of keys) with the
+        given name for the given label. We keep the count, total, and maximum
+        of the measurements.
+        """
+        with self.lock:
+            timing = self.timings[name].get(label)
+            if timing is None:
+                timing = self.timings[name][label] = {'count': 0, 'total': 0, 'max': value}
+            timing['count'] += 1
+            timing['total'] += value
+            timing['max'] = max(timing['max'], value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'since': self.since,
+                'counters': dict((name, dict(values)) for name, values in self.counters.items()),
+                'timings': dict((name, dict((label, timing.copy()) for label, timing in values.items()))
+                                for name, values in self.timings.items()),
+            }
+
+    def log_if_due(self):
+        """
+        Log a snapshot of the metrics if API_CACHE_METRICS_LOG_INTERVAL seconds
+        have passed since the last time.
+        """
+        interval = getattr(settings, 'API_CACHE_METRICS_LOG_INTERVAL', None)
+        if not interval:
+            return
+
+        now = time.time()
+        with self.lock:
+            if now - self.last_logged < interval:
+                return
+            self.last_logged = now
+
+        logger.info('Cache metrics: %s' % json.dumps(self.snapshot(), sort_keys=True))
+
+
+cache_metrics = MetricsRegistry()
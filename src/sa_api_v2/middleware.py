@@ -1,6 +1,8 @@
 import time
 import json
 import logging
+from .cache import cache_buffer
+from .metrics import cache_metrics
 
 
 # Request logging examples:
@@ -28,6 +30,25 @@ class RequestBodyLogger (object):
                 ))
 
 
+class CacheBufferMiddleware (object):
+    """
+    Scopes the cache buffer to the request. Any changes left over from a
+    previous request on this thread are discarded, and the changes buffered
+    during this request (including any invalidations from writes) are sent to
+    the cache once the response is ready.
+    """
+    def process_request(self, request):
+        cache_buffer.reset()
+
+    def process_exception(self, request, exception):
+        cache_buffer.reset()
+
+    def process_response(self, request, response):
+        cache_buffer.flush()
+        cache_metrics.log_if_due()
+        return response
+
+
 class RequestTimeLogger (object):
     def process_request(self, request):
         self.start_time = time.time()
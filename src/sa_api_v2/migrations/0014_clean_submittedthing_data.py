@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import ujson as json
+
+
+def clean_data_blobs(apps, schema_editor):
+    """
+    Make sure that every data blob is a JSON object before converting the
+    column to jsonb. Blank blobs become empty objects, and anything else that
+    can't be parsed is kept, as text, under an "_unparsed_data" attribute.
+    """
+    SubmittedThing = apps.get_model('sa_api_v2', 'SubmittedThing')
+
+    for thing in SubmittedThing.objects.only('id', 'data').iterator():
+        if not (thing.data or '').strip():
+            new_data = '{}'
+        else:
+            try:
+                blob = json.loads(thing.data)
+            except ValueError:
+                blob = None
+
+            if isinstance(blob, dict):
+                continue
+            new_data = json.dumps({'_unparsed_data': thing.data})
+
+        SubmittedThing.objects.filter(id=thing.id).update(data=new_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sa_api_v2', '0013_auto_20190201_0138'),
+    ]
+
+    operations = [
+        migrations.RunPython(clean_data_blobs, migrations.RunPython.noop),
+    ]
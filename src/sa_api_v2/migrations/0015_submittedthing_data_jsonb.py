@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import sa_api_v2.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sa_api_v2', '0014_clean_submittedthing_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submittedthing',
+            name='data',
+            field=sa_api_v2.models.fields.JSONBTextField(default='{}'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX sa_api_submittedthing_data_gin ON sa_api_submittedthing USING gin (data)',
+            'DROP INDEX sa_api_submittedthing_data_gin',
+        ),
+    ]
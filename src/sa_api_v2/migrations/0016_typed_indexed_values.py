@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sa_api_v2', '0015_submittedthing_data_jsonb'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataindex',
+            name='attr_type',
+            field=models.CharField(choices=[('string', 'String'), ('number', 'Number'), ('boolean', 'Boolean'), ('datetime', 'Date/Time')], default='string', max_length=10, verbose_name='Attribute type'),
+        ),
+        migrations.AddField(
+            model_name='indexedvalue',
+            name='boolean_value',
+            field=models.NullBooleanField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='indexedvalue',
+            name='datetime_value',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='indexedvalue',
+            name='number_value',
+            field=models.FloatField(db_index=True, null=True),
+        ),
+    ]
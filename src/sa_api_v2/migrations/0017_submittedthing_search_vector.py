@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    The search_vector column is maintained by a database trigger (see
+    0019_submittedthing_search_vector_trigger) and only ever used in SQL, so
+    it is not a model field (which would have it loaded with every thing).
+
+    The existing things' search documents are built with the default search
+    settings (API_SEARCH_CONFIG and API_SEARCH_WEIGHTS). With other settings,
+    rebuild them with the update_search_vectors management command.
+    """
+
+    dependencies = [
+        ('sa_api_v2', '0016_typed_indexed_values'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'ALTER TABLE sa_api_submittedthing ADD COLUMN search_vector tsvector',
+            'ALTER TABLE sa_api_submittedthing DROP COLUMN search_vector',
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE sa_api_submittedthing SET search_vector =
+                setweight(to_tsvector('simple'::regconfig, coalesce((
+                    SELECT string_agg(value, ' ') FROM jsonb_each_text(data)
+                    WHERE key NOT LIKE 'private%' AND key IN ('name', 'title')), '')), 'A') ||
+                setweight(to_tsvector('simple'::regconfig, coalesce((
+                    SELECT string_agg(value, ' ') FROM jsonb_each_text(data)
+                    WHERE key NOT LIKE 'private%' AND key IN ('description')), '')), 'B') ||
+                setweight(to_tsvector('simple'::regconfig, coalesce((
+                    SELECT string_agg(value, ' ') FROM jsonb_each_text(data)
+                    WHERE key NOT LIKE 'private%' AND key NOT IN ('name', 'title', 'description')), '')), 'D')
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX sa_api_submittedthing_search_vector_gin ON sa_api_submittedthing USING gin (search_vector)',
+            'DROP INDEX sa_api_submittedthing_search_vector_gin',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Places are ordered by their (geography) distance from a point with the
+    <-> operator, which can only use an index on the geography values.
+    """
+
+    dependencies = [
+        ('sa_api_v2', '0017_submittedthing_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX sa_api_place_geometry_geography_gist ON sa_api_place USING gist ((geometry::geography))',
+            'DROP INDEX sa_api_place_geometry_geography_gist',
+        ),
+    ]
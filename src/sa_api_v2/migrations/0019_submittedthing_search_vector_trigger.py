@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Build each thing's search document in the database whenever it is
+    inserted or its data is updated, so that it can't go stale however the
+    thing is written (e.g., in bulk, or with a queryset update).
+
+    The trigger function uses the default search settings (API_SEARCH_CONFIG
+    and API_SEARCH_WEIGHTS). With other settings, redefine it with the
+    update_search_vectors management command.
+    """
+
+    dependencies = [
+        ('sa_api_v2', '0018_place_geography_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION sa_api_submittedthing_search_vector() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector :=
+                    setweight(to_tsvector('simple'::regconfig, coalesce((
+                        SELECT string_agg(value, ' ') FROM jsonb_each_text(NEW.data)
+                        WHERE key NOT LIKE 'private%' AND key IN ('name', 'title')), '')), 'A') ||
+                    setweight(to_tsvector('simple'::regconfig, coalesce((
+                        SELECT string_agg(value, ' ') FROM jsonb_each_text(NEW.data)
+                        WHERE key NOT LIKE 'private%' AND key IN ('description')), '')), 'B') ||
+                    setweight(to_tsvector('simple'::regconfig, coalesce((
+                        SELECT string_agg(value, ' ') FROM jsonb_each_text(NEW.data)
+                        WHERE key NOT LIKE 'private%' AND key NOT IN ('name', 'title', 'description')), '')), 'D');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+            """,
+            'DROP FUNCTION sa_api_submittedthing_search_vector()',
+        ),
+        migrations.RunSQL(
+            'CREATE TRIGGER sa_api_submittedthing_search_vector '
+            'BEFORE INSERT OR UPDATE OF data ON sa_api_submittedthing '
+            'FOR EACH ROW EXECUTE PROCEDURE sa_api_submittedthing_search_vector()',
+            'DROP TRIGGER sa_api_submittedthing_search_vector ON sa_api_submittedthing',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sa_api_v2', '0019_submittedthing_search_vector_trigger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataindex',
+            name='is_building',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
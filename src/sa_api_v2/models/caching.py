@@ -49,6 +49,15 @@ class CacheClearingModel (object):
         return result
 
     def delete(self, clear_cache=True, *args, **kwargs):
+        # Clear the cache once the instance is gone, so that nothing can
+        # cache it again in the meantime. Deleting unsets the primary key,
+        # which the cached data is keyed on, so put it back while clearing.
+        pk = self.pk
+        result = super(CacheClearingModel, self).delete(*args, **kwargs)
         if clear_cache:
-            self.clear_instance_cache()
-        return super(CacheClearingModel, self).delete(*args, **kwargs)
+            self.pk = pk
+            try:
+                self.clear_instance_cache()
+            finally:
+                self.pk = None
+        return result
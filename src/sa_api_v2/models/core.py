@@ -1,13 +1,21 @@
+import math
+import operator
+import re
 import ujson as json
+from collections import OrderedDict
 from django.contrib.gis.db import models
 from django.contrib.gis.db.models import query
+from django.contrib.gis.db.models.functions import AsGeoJSON, GeoFunc, NUMERIC_TYPES
 from django.conf import settings
+from django.contrib.gis.geos import Polygon
 from django.core.files.storage import get_storage_class
+from django.db import connection
 from django.utils.timezone import now
 from .. import cache
 from .. import utils
 from .caching import CacheClearingModel
-from .data_indexes import IndexedValue, FilterByIndexMixin
+from .data_indexes import DataIndex, IndexedValue, FilterByIndexMixin
+from .fields import JSONBTextField
 from .mixins import CloneableModelMixin
 from .profiles import User
 
@@ -21,13 +29,205 @@ class TimeStampedModel (models.Model):
 
 
 class ModelWithDataBlob (models.Model):
-    data = models.TextField(default='{}')
+    data = JSONBTextField(default='{}')
 
     class Meta:
         abstract = True
 
 
-class SubmittedThingQuerySet (FilterByIndexMixin, query.QuerySet):
+class FilterByDataMixin (object):
+    """
+    Mixin for querysets and managers of models with data blobs, for filtering
+    on the contents of the blob within the database. Containment and key
+    lookups can use the GIN index on the data column.
+    """
+    def filter_by_data(self, key, *values):
+        """
+        Filter for things whose data attribute named key has any of the given
+        values. Query parameters are always strings, so a value like "5" or
+        "true" also matches the corresponding JSON number or boolean.
+        """
+        matches_any_values_clause = reduce(
+            operator.or_,
+            [models.Q(data__json_contains={key: candidate})
+             for value in values
+             for candidate in self.get_data_value_candidates(value)])
+        return self.filter(matches_any_values_clause)
+
+    def filter_by_data_contains(self, subset):
+        """
+        Filter for things whose data blob contains all of the key/value pairs
+        in the given dict.
+        """
+        return self.filter(data__json_contains=subset)
+
+    def filter_by_data_key(self, key):
+        """
+        Filter for things whose data blob has the given attribute.
+        """
+        return self.filter(data__has_key=key)
+
+    @staticmethod
+    def get_data_value_candidates(value):
+        candidates = [value]
+        try:
+            scalar = json.loads(value)
+        except (ValueError, OverflowError):
+            return candidates
+
+        if isinstance(scalar, float) and (math.isinf(scalar) or math.isnan(scalar)):
+            return candidates
+        if not isinstance(scalar, (basestring, list, dict)):
+            candidates.append(scalar)
+        return candidates
+
+
+def get_search_vector_sql(data_sql='data'):
+    """
+    Get the SQL (and parameters) for the full-text search document of a
+    thing, computed from its data column (or the given data_sql). Only public
+    data values are searchable -- not attribute names, and not private
+    attributes. Values of the attributes listed in the API_SEARCH_WEIGHTS
+    setting are weighted accordingly (A is the highest weight); all other
+    values have weight D.
+    """
+    search_config = getattr(settings, 'API_SEARCH_CONFIG', 'simple')
+    weights = getattr(settings, 'API_SEARCH_WEIGHTS', {})
+
+    values_sql = (
+        "to_tsvector(%s::regconfig, coalesce(("
+        "SELECT string_agg(value, ' ') FROM jsonb_each_text(" + data_sql + ") "
+        "WHERE key NOT LIKE 'private%%'{condition}), ''))")
+
+    parts, params = [], []
+    weighted_keys = []
+    for weight, keys in sorted(weights.items()):
+        keys = list(keys)
+        if not keys:
+            continue
+        parts.append('setweight(%s, %%s)' % values_sql.format(condition=' AND key = ANY(%s)'))
+        params.extend([search_config, keys, weight])
+        weighted_keys.extend(keys)
+
+    if weighted_keys:
+        parts.append('setweight(%s, %%s)' % values_sql.format(condition=' AND NOT key = ANY(%s)'))
+        params.extend([search_config, weighted_keys, 'D'])
+    else:
+        parts.append(values_sql.format(condition=''))
+        params.append(search_config)
+
+    return ' || '.join(parts), params
+
+
+def update_search_trigger():
+    """
+    (Re)define the trigger function that builds the search document of each
+    thing as it is inserted, or whenever its data is updated, according to
+    the current search settings. Whatever writes the things (including bulk
+    creates and queryset updates), their documents stay up to date.
+    """
+    vector_sql, vector_params = get_search_vector_sql(data_sql='NEW.data')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE OR REPLACE FUNCTION sa_api_submittedthing_search_vector() RETURNS trigger AS $$ '
+            'BEGIN NEW.search_vector := {vector}; RETURN NEW; END '
+            '$$ LANGUAGE plpgsql'.format(vector=vector_sql),
+            vector_params)
+
+
+def get_search_vector_col_sql(compiler, data_col):
+    """
+    Get the SQL for the search_vector column of the table that the given
+    (resolved) data column belongs to. The column is referred to by the
+    table's alias in the query, so that it stays correct when the query is
+    used as a subquery (and its tables are renamed).
+    """
+    return '%s.%s' % (compiler.quote_name_unless_alias(data_col.alias),
+                      compiler.connection.ops.quote_name('search_vector'))
+
+
+class SearchMatches (models.Lookup):
+    """
+    Check whether the search document of a thing (which is built from its
+    data; see SearchMixin) matches the given text search query, e.g.:
+
+        SubmittedThing.objects.filter(data__search_matches='gard:* & lot:*')
+
+    """
+    lookup_name = 'search_matches'
+
+    def get_prep_lookup(self):
+        return self.rhs
+
+    def as_sql(self, compiler, connection):
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        search_config = getattr(settings, 'API_SEARCH_CONFIG', 'simple')
+        return ('%s @@ to_tsquery(%%s::regconfig, %s)' % (get_search_vector_col_sql(compiler, self.lhs), rhs),
+                [search_config] + list(rhs_params))
+JSONBTextField.register_lookup(SearchMatches)
+
+
+class SearchRank (models.Func):
+    """
+    The relevance of a thing's search document to the given text search
+    query. The expression should be the thing's data field.
+    """
+    def __init__(self, expression, search_query, **extra):
+        extra.setdefault('output_field', models.FloatField())
+        super(SearchRank, self).__init__(expression, **extra)
+        self.search_query = search_query
+
+    def as_sql(self, compiler, connection):
+        data_col = self.get_source_expressions()[0]
+        search_config = getattr(settings, 'API_SEARCH_CONFIG', 'simple')
+        return ('ts_rank(%s, to_tsquery(%%s::regconfig, %%s))' % (get_search_vector_col_sql(compiler, data_col),),
+                [search_config, self.search_query])
+
+
+class SearchMixin (object):
+    """
+    Mixin for querysets and managers of submitted things, for full-text
+    search over their data values. The search documents are maintained in
+    the search_vector column of the submitted thing table (by a trigger; see
+    update_search_trigger), which has a GIN index.
+    """
+    def search(self, text, ranked=True):
+        """
+        Filter for things whose data values contain all the words in the
+        given text, each as a word or the prefix of a word (so that results
+        come back while the user is still typing). If ranked, order the
+        results by relevance, most relevant first.
+        """
+        words = re.findall(r'\w+', text, re.UNICODE)
+        if not words:
+            return self.none()
+
+        search_query = ' & '.join(word + ':*' for word in words)
+        queryset = self.filter(data__search_matches=search_query)
+        if ranked:
+            queryset = queryset.annotate(
+                search_rank=SearchRank('data', search_query),
+            ).order_by('-search_rank', 'pk')
+        return queryset
+
+    def update_search_vectors(self):
+        """
+        Rebuild the search documents of all the things in the queryset, e.g.
+        after changing the API_SEARCH_WEIGHTS setting.
+        """
+        vector_sql, vector_params = get_search_vector_sql()
+        pk_sql, pk_params = self.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {table} SET search_vector = {vector} WHERE {pk} IN ({pks})'.format(
+                    table=connection.ops.quote_name(SubmittedThing._meta.db_table),
+                    pk=connection.ops.quote_name(SubmittedThing._meta.pk.column),
+                    vector=vector_sql,
+                    pks=pk_sql),
+                vector_params + list(pk_params))
+
+
+class SubmittedThingQuerySet (FilterByDataMixin, SearchMixin, FilterByIndexMixin, query.QuerySet):
     # Custom version of create that passes needed kwargs to save.
     def create(self, silent=False, reindex=False, source='', force_insert=True, *args, **kwargs):
         """
@@ -46,7 +246,7 @@ class SubmittedThingQuerySet (FilterByIndexMixin, query.QuerySet):
         return obj
 
 
-class SubmittedThingManager (FilterByIndexMixin, models.Manager):
+class SubmittedThingManager (FilterByDataMixin, SearchMixin, FilterByIndexMixin, models.Manager):
     use_for_related_fields = True
 
     def get_queryset(self):
@@ -69,16 +269,49 @@ class SubmittedThing (CloneableModelMixin, CacheClearingModel, ModelWithDataBlob
         app_label = 'sa_api_v2'
         db_table = 'sa_api_submittedthing'
 
-    def index_values(self, indexes=None):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(SubmittedThing, cls).from_db(db, field_names, values)
+        # Remember the data as it was loaded, so that we can tell which
+        # attributes have changed when the thing is saved.
+        instance._loaded_data = instance.__dict__.get('data')
+        return instance
+
+    def get_changed_data_keys(self):
+        """
+        Get the set of data attributes that have been added, changed, or
+        removed since the thing was loaded, or None if we can't tell.
+        """
+        if self.id is None:
+            return set(json.loads(self.data).keys())
+
+        loaded_data = getattr(self, '_loaded_data', None)
+        if loaded_data is None:
+            return None
+        if loaded_data == self.data:
+            return set()
+
+        old_data = json.loads(loaded_data)
+        new_data = json.loads(self.data)
+        return set(key for key in set(old_data) | set(new_data)
+                   if key not in old_data or key not in new_data
+                   or old_data[key] != new_data[key])
+
+    def index_values(self, indexes=None, changed_keys=None):
+        """
+        Sync the thing's indexed values. If changed_keys is given, only the
+        indexes on those data attributes are synced.
+        """
         if indexes is None:
-            indexes = self.dataset.indexes.all()
+            indexes = DataIndex.get_for_dataset(self.dataset_id)
+
+        if changed_keys is not None:
+            indexes = [index for index in indexes if index.attr_name in changed_keys]
 
         if len(indexes) == 0:
             return
 
-        data = json.loads(self.data)
-        for index in indexes:
-            IndexedValue.objects.sync(self, index, data=data)
+        IndexedValue.objects.sync_batch([(self.id, self.data)], indexes)
 
     def get_clone_save_kwargs(self):
         return {'silent': True, 'reindex': False, 'clear_cache': False}
@@ -92,12 +325,16 @@ class SubmittedThing (CloneableModelMixin, CacheClearingModel, ModelWithDataBlob
         silent = getattr(self, 'silent', silent)
         source = getattr(self, 'source', source)
         reindex = getattr(self, 'reindex', reindex)
+        clear_cache = kwargs.pop('clear_cache', True)
         is_new = (self.id == None)
+        changed_keys = self.get_changed_data_keys() if reindex else None
 
-        ret = super(SubmittedThing, self).save(*args, **kwargs)
+        # The search document is kept up to date by a database trigger.
+        ret = super(SubmittedThing, self).save(clear_cache=False, *args, **kwargs)
 
         if reindex:
-            self.index_values()
+            self.index_values(changed_keys=changed_keys)
+            self._loaded_data = self.data
 
         # All submitted things generate an action if not silent.
         if not silent:
@@ -105,7 +342,12 @@ class SubmittedThing (CloneableModelMixin, CacheClearingModel, ModelWithDataBlob
             action.action = 'create' if is_new else 'update'
             action.thing = self
             action.source = source
-            action.save()
+            action.save(clear_cache=clear_cache)
+
+        # Clear the cache only once everything that is rendered along with
+        # the thing has been written.
+        if clear_cache:
+            self.clear_instance_cache()
 
         return ret
 
@@ -157,12 +399,10 @@ class DataSet (CloneableModelMixin, CacheClearingModel, models.Model):
                 return ds_origin
         return None
 
-    def reindex(self):
-        things = self.things.all()
-        indexes = self.indexes.all()
-
-        for thing in things:
-            thing.index_values(indexes)
+    def reindex(self, progress=None):
+        indexes = list(self.indexes.all())
+        IndexedValue.objects.bulk_sync(self.things.all(), indexes, progress=progress)
+        DataIndex.mark_built(indexes)
 
     def clone_related(self, onto):
         # Clone all the places. Submissions will be cloned as part of the
@@ -251,8 +491,159 @@ class PlaceEmailTemplate (TimeStampedModel):
         return 'template id: %s' % (self.id)
 
 
+class SimplifyPreserveTopology (GeoFunc):
+    """
+    Simplify a geometry to within the given tolerance, without letting it
+    become invalid (as ST_Simplify can).
+    """
+    def __init__(self, expression, tolerance, **extra):
+        tolerance = self._handle_param(tolerance, 'tolerance', NUMERIC_TYPES)
+        super(SimplifyPreserveTopology, self).__init__(expression, tolerance, **extra)
+
+
 class GeoSubmittedThingQuerySet (query.GeoQuerySet, SubmittedThingQuerySet):
-    pass
+    def with_geojson(self, precision=None, tolerance=None):
+        """
+        Have the database encode each place's geometry as GeoJSON, as the
+        geometry_geojson attribute. Optionally, round the coordinates to the
+        given number of decimal places, and simplify lines and polygons to
+        within the given tolerance (in degrees) first.
+        """
+        geometry = 'geometry'
+        if tolerance:
+            geometry = SimplifyPreserveTopology(geometry, tolerance)
+        return self.annotate(geometry_geojson=AsGeoJSON(geometry, precision=precision))
+
+    def nearest(self, reference):
+        """
+        Order the places by distance from the reference geometry, nearest
+        first, with the distance of each as the distance attribute. The
+        ordering uses the <-> operator, so that the spatial index can find
+        the nearest places without measuring the distance to every place;
+        the exact distance is only computed for the places that are fetched.
+        The geometries are compared as geography, so that the ordering is by
+        the same distance (on the sphere) as the distance attribute, rather
+        than by degrees. The places are ordered by distance alone; a second
+        sort key would keep the rows from being returned straight from the
+        index scan.
+        """
+        if reference.srid is None:
+            reference = reference.clone()
+            reference.srid = 4326
+
+        knn_sql = '{place}.{geometry}::geography <-> ST_GeomFromEWKT(%s)::geography'.format(
+            place=connection.ops.quote_name(self.model._meta.db_table),
+            geometry=connection.ops.quote_name(self.model._meta.get_field('geometry').column))
+
+        return self.distance(reference).extra(
+            select={'knn_distance': knn_sql},
+            select_params=(reference.ewkt,),
+        ).order_by('knn_distance')
+
+    # The PostGIS version that added ST_AsMVT and ST_AsMVTGeom
+    vector_tile_postgis_version = (2, 4)
+
+    def supports_vector_tiles(self):
+        """
+        Check whether the database's PostGIS can encode vector tiles.
+        """
+        return connection.ops.spatial_version >= self.vector_tile_postgis_version
+
+    def as_vector_tile(self, z, x, y, attr_names=(), layer_name='places', extent=4096, buffer=256):
+        """
+        Encode the places that fall on the given web map tile as a Mapbox
+        Vector Tile, within the database. Each feature has the place's id
+        and the (text) values of the given data attributes as properties.
+        The extent is the size of the tile in tile coordinates, and the
+        buffer is how far past the edge of the tile (in tile coordinates)
+        geometries are kept, so that features along the edges render
+        seamlessly. Returns the encoded tile. Requires PostGIS 2.4 or later
+        (see supports_vector_tiles).
+        """
+        # Find the places with the spatial index first, then encode them.
+        margin = float(buffer) / extent
+        tile_area = Polygon.from_bbox(utils.tile_lnglat_bounds(z, x, y, margin))
+        tile_area.srid = 4326
+        places = self.order_by().filter(geometry__bboverlaps=tile_area)
+        place_ids_sql, place_ids_params = places.values('pk').query.sql_with_params()
+
+        qn = connection.ops.quote_name
+        # Each attribute is a column of the tile's features, so each may be
+        # given only once.
+        attr_names = [attr_name for attr_name in OrderedDict.fromkeys(attr_names)
+                      if attr_name not in ('id', 'mvt_geom')]
+        for attr_name in attr_names:
+            if '"' in attr_name or '\x00' in attr_name:
+                raise ValueError('%r is not a valid attribute name for a tile' % (attr_name,))
+
+        # Attribute names become column names, so escape them for the query
+        # parameters as well.
+        attr_columns_sql = ''.join(
+            ', thing.{data} ->> %s AS {attr_name}'.format(
+                data=qn(SubmittedThing._meta.get_field('data').column),
+                attr_name=qn(attr_name).replace('%', '%%'))
+            for attr_name in attr_names)
+
+        tile_sql = (
+            'SELECT ST_AsMVT(tile, %s, %s, %s) FROM ('
+            'SELECT ST_AsMVTGeom(ST_Transform(place.{geometry}, 3857), '
+            'ST_MakeEnvelope(%s, %s, %s, %s, 3857), %s, %s, true) AS mvt_geom, '
+            'place.{pk} AS id{attr_columns} '
+            'FROM {place} place INNER JOIN {thing} thing ON thing.{thing_pk} = place.{pk} '
+            'WHERE place.{pk} IN ({place_ids})'
+            ') AS tile WHERE mvt_geom IS NOT NULL'
+        ).format(
+            geometry=qn(self.model._meta.get_field('geometry').column),
+            pk=qn(self.model._meta.pk.column),
+            attr_columns=attr_columns_sql,
+            place=qn(self.model._meta.db_table),
+            thing=qn(SubmittedThing._meta.db_table),
+            thing_pk=qn(SubmittedThing._meta.pk.column),
+            place_ids=place_ids_sql)
+        tile_params = (
+            [layer_name, extent, 'mvt_geom'] +
+            list(utils.tile_bounds(z, x, y)) +
+            [extent, buffer] +
+            attr_names +
+            list(place_ids_params))
+
+        with connection.cursor() as cursor:
+            cursor.execute(tile_sql, tile_params)
+            tile = cursor.fetchone()[0]
+        return bytes(tile or b'')
+
+    def grid_clusters(self, cell_size):
+        """
+        Aggregate the places into the cells of a grid with the given cell
+        size (in degrees), within the database. Returns a list of clusters,
+        largest first, each with the number of places in the cell, the
+        centroid of the places as a GeoJSON geometry, and the bounds of the
+        places as [west, south, east, north].
+        """
+        places = self.order_by()
+        place_ids_sql, place_ids_params = places.values('pk').query.sql_with_params()
+
+        qn = connection.ops.quote_name
+        cluster_sql = (
+            'SELECT count(*), ST_AsGeoJSON(ST_Centroid(ST_Collect(ST_Centroid({geometry})))), '
+            'ST_XMin(ST_Extent({geometry})), ST_YMin(ST_Extent({geometry})), '
+            'ST_XMax(ST_Extent({geometry})), ST_YMax(ST_Extent({geometry})) '
+            'FROM {place} WHERE {pk} IN ({place_ids}) '
+            'GROUP BY ST_SnapToGrid(ST_Centroid({geometry}), %s) '
+            'ORDER BY count(*) DESC'
+        ).format(
+            geometry=qn(self.model._meta.get_field('geometry').column),
+            place=qn(self.model._meta.db_table),
+            pk=qn(self.model._meta.pk.column),
+            place_ids=place_ids_sql)
+
+        with connection.cursor() as cursor:
+            cursor.execute(cluster_sql, list(place_ids_params) + [cell_size])
+            return [{
+                'count': count,
+                'geometry': json.loads(centroid),
+                'bounds': [west, south, east, north],
+            } for count, centroid, west, south, east, north in cursor.fetchall()]
 
 
 class GeoSubmittedThingManager (models.GeoManager, SubmittedThingManager):
@@ -1,75 +1,310 @@
+import logging
+import math
 import operator
 import ujson as json
+from datetime import datetime, time
+from django.conf import settings
 from django.contrib.gis.db import models
+from django.db import connection, transaction
+from django.db.models.expressions import Col, OrderBy
+from django.db.models.sql.constants import LOUTER
+from django.db.models.sql.datastructures import Join
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .. import cache
 from .mixins import CloneableModelMixin
 
+logger = logging.getLogger('sa_api_v2.models')
+
+def to_string_value(value):
+    return unicode(value)
+
+def to_number_value(value):
+    if isinstance(value, bool):
+        raise ValueError('%r is not a number' % (value,))
+    number = float(value)
+    if math.isinf(number) or math.isnan(number):
+        raise ValueError('%r is not a finite number' % (value,))
+    return number
+
+def to_boolean_value(value):
+    if isinstance(value, bool):
+        return value
+    normalized = unicode(value).strip().lower()
+    if normalized in ('true', 't', 'yes', 'y', 'on', '1'):
+        return True
+    if normalized in ('false', 'f', 'no', 'n', 'off', '0'):
+        return False
+    raise ValueError('%r is not a boolean' % (value,))
+
+def to_datetime_value(value):
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        value = unicode(value).strip()
+        dt = parse_datetime(value)
+        if dt is None:
+            date = parse_date(value)
+            if date is None:
+                raise ValueError('%r is not a date or date/time' % (value,))
+            dt = datetime.combine(date, time())
+
+    if settings.USE_TZ and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.utc)
+    return dt
+
 
 class DataIndex (CloneableModelMixin, models.Model):
     ATTR_TYPE_CHOICES = (
         ('string', 'String'),
+        ('number', 'Number'),
+        ('boolean', 'Boolean'),
+        ('datetime', 'Date/Time'),
     )
 
+    # For each attribute type, the IndexedValue field that typed values are
+    # stored in, and the function that converts data values to that type.
+    VALUE_FIELDS = {
+        'string': 'value',
+        'number': 'number_value',
+        'boolean': 'boolean_value',
+        'datetime': 'datetime_value',
+    }
+    VALUE_CONVERTERS = {
+        'string': to_string_value,
+        'number': to_number_value,
+        'boolean': to_boolean_value,
+        'datetime': to_datetime_value,
+    }
+
     dataset = models.ForeignKey('DataSet', related_name='indexes')
     attr_name = models.CharField(max_length=100, db_index=True, verbose_name='Attribute name')
     attr_type = models.CharField(max_length=10, choices=ATTR_TYPE_CHOICES, default='string', verbose_name='Attribute type')
 
+    # Whether the indexed values are being rebuilt in the background. Until
+    # they are, the index isn't used to filter or order things.
+    is_building = models.BooleanField(default=False, editable=False)
+
+    dataset_cache = cache.DataSetCache()
+
     class Meta:
         app_label = 'sa_api_v2'
 
     def __unicode__(self):
         return self.attr_name
 
-    def index_things(self):
+    @classmethod
+    def get_for_dataset(cls, dataset_id):
+        """
+        Get the list of indexes on the dataset with the given id, from the
+        cache if possible.
+        """
+        return cls.dataset_cache.get_indexes(
+            dataset_id, lambda: cls.objects.filter(dataset_id=dataset_id))
+
+    @classmethod
+    def get_value_field(cls, attr_type):
+        return cls.VALUE_FIELDS[attr_type]
+
+    @classmethod
+    def to_typed_value(cls, attr_type, value):
+        """
+        Convert a data (or query) value to the given attribute type. Raises a
+        ValueError if the value can't be converted.
+        """
+        return cls.VALUE_CONVERTERS[attr_type](value)
+
+    @classmethod
+    def mark_built(cls, indexes):
+        """
+        Mark the given indexes, whose values have just been rebuilt, as ready
+        to use. An index that has changed since it was loaded is left alone,
+        since its values are being rebuilt again.
+        """
+        for index in indexes:
+            if not index.is_building:
+                continue
+            cls.objects.filter(pk=index.pk, attr_name=index.attr_name, attr_type=index.attr_type)\
+                .update(is_building=False)
+            index.is_building = False
+            cls.dataset_cache.clear_indexes(index.dataset_id)
+
+    def index_things(self, progress=None):
         things = self.dataset.things.all()
-        for thing in things:
-            IndexedValue.objects.sync(thing, self)
+        IndexedValue.objects.bulk_sync(things, [self], progress=progress)
+
+    def schedule_reindex(self):
+        """
+        Index the dataset's things on this index in a background task, once
+        the current transaction is committed.
+        """
+        from ..tasks import reindex_dataset
+        dataset_id, index_id = self.dataset_id, self.id
+
+        def schedule():
+            try:
+                reindex_dataset.apply_async(args=(dataset_id,), kwargs={'index_ids': [index_id]})
+            except Exception:
+                # The index is already saved, so don't fail the request. The
+                # index stays marked as building (and unused) until the
+                # dataset is reindexed.
+                logger.exception('Could not schedule reindexing of index %s in dataset %s' % (index_id, dataset_id))
+
+        transaction.on_commit(schedule)
 
     def get_clone_save_kwargs(self):
         return {'reindex': False}
 
-    def save(self, reindex=True, *args, **kwargs):
+    def save(self, reindex='background', *args, **kwargs):
+        """
+        Save the index. Changing the attribute name or type changes every
+        indexed value, so by default they are all rebuilt in a background
+        task once the index is committed, since that can take a while on a
+        large dataset. Pass reindex=True to rebuild them before returning
+        instead, or reindex=False not to rebuild them.
+
+        While the values are rebuilt in the background, the index is marked
+        as building, so that queries don't use the missing or stale values.
+        """
+        if reindex == 'background':
+            self.is_building = True
+        elif reindex:
+            self.is_building = False
+
         ret = super(DataIndex, self).save(*args, **kwargs)
-        if reindex:
+        self.clear_dataset_cache()
+
+        if reindex == 'background':
+            self.schedule_reindex()
+        elif reindex:
             self.index_things()
         return ret
 
+    def delete(self, *args, **kwargs):
+        self.clear_dataset_cache()
+        return super(DataIndex, self).delete(*args, **kwargs)
+
+    def clear_dataset_cache(self):
+        """
+        Changing the indexes changes how the dataset's things can be filtered
+        and ordered, so clear the cached index definitions along with
+        everything else cached for the dataset (including API responses).
+        The index definitions are cleared again once the change is committed,
+        in case they were read back into the cache in the meantime.
+        """
+        dataset_id = self.dataset_id
+        self.dataset_cache.clear_indexes(dataset_id)
+        transaction.on_commit(lambda: self.dataset_cache.clear_indexes(dataset_id))
+        self.dataset.clear_instance_cache()
+
 
 class IndexedValueManager (models.Manager):
-    def sync(self, thing, index, data=None):
-        if data is None:
-            data = json.loads(thing.data)
+    def bulk_sync(self, things, indexes, batch_size=1000, progress=None):
+        """
+        Sync the indexed values of many things on the given indexes at once.
+        Things are read from the database in batches, in order of primary
+        key, so that only one batch is in memory at a time. For each batch, the
+        existing values are read in one query, and the values that are new
+        or changed are inserted (changed values are first deleted) in bulk.
 
-        if index.attr_name in data:
-            # If there is a value, index it.
-            try:
-                value = self.get(thing_id=thing.id, index_id=index.id)
-            except IndexedValue.DoesNotExist:
-                value = IndexedValue(thing_id=thing.id, index_id=index.id)
+        If given, progress is called with the number of things synced so far
+        and the total number of things after each batch.
+        """
+        indexes = list(indexes)
+        if not indexes:
+            return
+
+        total = things.count()
+        done = 0
+        thing_rows = things.order_by('pk').values_list('pk', 'data')
+        last_pk = None
+
+        while True:
+            batch_rows = thing_rows if last_pk is None else thing_rows.filter(pk__gt=last_pk)
+            batch = list(batch_rows[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            with transaction.atomic():
+                self.sync_batch(batch, indexes)
 
-            new_indexable_value = unicode(data[index.attr_name])
-            if value.value != new_indexable_value:
-                value.value = new_indexable_value
-                value.save()
-        else:
-            # If there's no value and there was one previously indexed, get
-            # rid of it.
-            self.filter(thing_id=thing.id, index_id=index.id).delete()
+            done += len(batch)
+            if progress is not None:
+                progress(done, total)
+
+    def sync_batch(self, thing_rows, indexes):
+        """
+        Sync the indexed values of the given things, as (id, data JSON) rows,
+        on the given indexes. This is the one place that indexed values are
+        written, whether for a single thing as it's saved, or for a batch of
+        things (see bulk_sync).
+        """
+        thing_ids = [thing_id for thing_id, _ in thing_rows]
+        existing_values = dict(
+            ((value.thing_id, value.index_id), value)
+            for value in self.filter(thing_id__in=thing_ids, index__in=indexes))
+
+        new_values = []
+        stale_value_ids = []
+        for thing_id, data in thing_rows:
+            data = json.loads(data)
+            for index in indexes:
+                existing_value = existing_values.get((thing_id, index.id))
+
+                if index.attr_name not in data:
+                    if existing_value is not None:
+                        stale_value_ids.append(existing_value.id)
+                    continue
+
+                new_field_values = self.get_field_values(index, data[index.attr_name])
+                if existing_value is not None:
+                    if all(getattr(existing_value, field_name) == field_value
+                           for field_name, field_value in new_field_values.items()):
+                        continue
+                    stale_value_ids.append(existing_value.id)
+
+                new_values.append(IndexedValue(thing_id=thing_id, index_id=index.id, **new_field_values))
+
+        if stale_value_ids:
+            self.filter(id__in=stale_value_ids).delete()
+        if new_values:
+            self.bulk_create(new_values)
+
+    def get_field_values(self, index, raw_value):
+        """
+        Get the values of all the IndexedValue fields for the given raw data
+        value. The string value is always set, so that values can be matched
+        exactly regardless of the index's type. The typed value is None if the
+        raw value can't be converted to the index's type.
+        """
+        field_values = {
+            'value': unicode(raw_value)[:IndexedValue._meta.get_field('value').max_length],
+            'number_value': None,
+            'boolean_value': None,
+            'datetime_value': None,
+        }
+        if index.attr_type != 'string':
+            try:
+                typed_value = DataIndex.to_typed_value(index.attr_type, raw_value)
+            except (ValueError, TypeError):
+                typed_value = None
+            field_values[DataIndex.get_value_field(index.attr_type)] = typed_value
+        return field_values
 
 
 class IndexedValue (models.Model):
     index = models.ForeignKey('DataIndex', related_name='values')
     thing = models.ForeignKey('SubmittedThing', related_name='indexed_values')
 
+    # The string value is always set. Depending on the index's attribute type,
+    # one of the typed values is set as well, so that we can use the
+    # appropriate comparisons and ordering for each (i.e., less than operates
+    # differently on strings than on numbers).
     value = models.CharField(max_length=100, null=True, db_index=True)
-    # TODO: This might be better as:
-    #
-    #   * string_value
-    #   * number_value
-    #   * boolean_value
-    #   * datetime_value
-    #
-    #   So that we can use the appropriate comparisons for each (i.e., less
-    #   than operates differently on strings than on numbers)
+    number_value = models.FloatField(null=True, db_index=True)
+    boolean_value = models.NullBooleanField(db_index=True)
+    datetime_value = models.DateTimeField(null=True, db_index=True)
 
     objects = IndexedValueManager()
 
@@ -84,16 +319,118 @@ class IndexedValue (models.Model):
             raise KeyError('The thing %s has no data attribute %s' % (self.thing, self.index.attr_name))
 
 
+class IndexedValueJoinField (object):
+    """
+    Stands in for a relation field in a join from things to their indexed
+    values on a single attribute (see FilterByIndexMixin.order_by_index).
+    The join is made on the thing, and restricted to the attribute's indexes.
+    """
+    def __init__(self, thing_pk_column, attr_name):
+        self.thing_pk_column = thing_pk_column
+        self.attr_name = attr_name
+
+    def get_joining_columns(self):
+        return ((self.thing_pk_column, IndexedValue._meta.get_field('thing').column),)
+
+    def get_extra_restriction(self, where_class, alias, related_alias):
+        return IndexedValueAttrRestriction(alias, self.attr_name)
+
+
+class IndexedValueAttrRestriction (object):
+    def __init__(self, alias, attr_name):
+        self.alias = alias
+        self.attr_name = attr_name
+
+    def as_sql(self, compiler, connection):
+        qn = connection.ops.quote_name
+        sql = '{indexedvalue}.{index_id} IN (SELECT {pk} FROM {dataindex} WHERE {attr_name} = %s)'.format(
+            indexedvalue=compiler.quote_name_unless_alias(self.alias),
+            index_id=qn(IndexedValue._meta.get_field('index').column),
+            pk=qn(DataIndex._meta.pk.column),
+            dataindex=qn(DataIndex._meta.db_table),
+            attr_name=qn(DataIndex._meta.get_field('attr_name').column))
+        return sql, [self.attr_name]
+
+
+class NullsLastOrderBy (OrderBy):
+    template = '%(expression)s %(ordering)s NULLS LAST'
+
+
 class FilterByIndexMixin (object):
     """
     Mixin for model managers of indexed models.
     """
-    def filter_by_index(self, key, *values):
-        matches_any_values_clause = reduce(
-            operator.or_,
-            [models.Q(indexed_values__value=value) for value in values])
-        return self\
-            .filter(indexed_values__index__attr_name=key)\
-            .filter(matches_any_values_clause)
+    INDEX_LOOKUPS = ('exact', 'gt', 'gte', 'lt', 'lte', 'range')
+
+    # Index types whose plain equality is matched on the typed value
+    TYPED_EXACT_ATTR_TYPES = ('number', 'boolean')
+
+    def filter_by_index(self, key, *values, **kwargs):
+        """
+        Filter for things whose indexed value for key matches any of the
+        given values. Pass an attr_type to compare typed values, and a
+        lookup of 'gt', 'gte', 'lt', 'lte', or 'range' to compare them by
+        order. Range values are given as "lower,upper". Raises a ValueError
+        if a value can't be converted to the attribute type (except for plain
+        equality; see get_exact_index_match).
+        """
+        attr_type = kwargs.pop('attr_type', 'string')
+        lookup = kwargs.pop('lookup', 'exact')
+        if lookup not in self.INDEX_LOOKUPS:
+            raise ValueError('Unknown index lookup %r' % (lookup,))
+
+        clauses = []
+        for value in values:
+            if lookup == 'exact':
+                field_name, value = self.get_exact_index_match(attr_type, value)
+            elif lookup == 'range':
+                bounds = value.split(',')
+                if len(bounds) != 2:
+                    raise ValueError('A range should be given as "lower,upper", not %r' % (value,))
+                field_name = DataIndex.get_value_field(attr_type)
+                value = tuple(DataIndex.to_typed_value(attr_type, bound) for bound in bounds)
+            else:
+                field_name = DataIndex.get_value_field(attr_type)
+                value = DataIndex.to_typed_value(attr_type, value)
+            clauses.append(models.Q(**{'indexed_values__%s__%s' % (field_name, lookup): value}))
+        matches_any_values_clause = reduce(operator.or_, clauses)
+
+        # Filter on the index and the value at once, so that both conditions
+        # apply to the same indexed value.
+        return self.filter(
+            models.Q(indexed_values__index__attr_name=key) &
+            matches_any_values_clause)
+
+    def get_exact_index_match(self, attr_type, value):
+        """
+        Get the IndexedValue field and value to match a query value exactly.
+        On a number or boolean index, the typed value is compared, so that
+        "true" matches true and "2" matches 2.0. Otherwise, or if the value
+        can't be converted, the string value is compared, so that "2" still
+        matches both 2 and "2".
+        """
+        if attr_type in self.TYPED_EXACT_ATTR_TYPES:
+            try:
+                return DataIndex.get_value_field(attr_type), DataIndex.to_typed_value(attr_type, value)
+            except (ValueError, TypeError):
+                pass
+        return 'value', unicode(value)
+
+    def order_by_index(self, key, attr_type='string', descending=False):
+        """
+        Order things by their (typed) indexed value for key. Things that have
+        no value come last.
+        """
+        queryset = self.all()
+        query = queryset.query
 
+        # Left join the things' values on the index once, so that the
+        # ordering can use the index on the value column, instead of looking
+        # up each thing's value separately.
+        join_field = IndexedValueJoinField(queryset.model._meta.pk.column, key)
+        alias = query.join(Join(IndexedValue._meta.db_table, query.get_initial_alias(),
+                                None, LOUTER, join_field, True))
 
+        value_field = IndexedValue._meta.get_field(DataIndex.get_value_field(attr_type))
+        return queryset.order_by(
+            NullsLastOrderBy(Col(alias, value_field), descending=descending), 'pk')
@@ -0,0 +1,79 @@
+import ujson as json
+from django.db import models
+from django.db.backends.signals import connection_created
+
+
+class JSONBTextField (models.TextField):
+    """
+    A field for JSON documents that are stored in a Postgres jsonb column, so
+    that they can be indexed and queried within the database, but that are
+    still exchanged with the application as JSON text, like a TextField.
+
+    Note that Postgres normalizes jsonb documents, so the text read back may
+    differ in whitespace and key order from the text that was saved.
+
+    """
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        return super(JSONBTextField, self).db_type(connection)
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None or isinstance(value, unicode):
+            return value
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        # The database adapter may have already decoded the document.
+        return json.dumps(value)
+
+
+class JSONContains (models.Lookup):
+    """
+    Check whether the JSON document contains the given document (a dict, or
+    JSON text) at its top level, e.g.:
+
+        Place.objects.filter(data__json_contains={'status': 'open'})
+
+    """
+    lookup_name = 'json_contains'
+
+    def get_prep_lookup(self):
+        if isinstance(self.rhs, basestring):
+            return self.rhs
+        return json.dumps(self.rhs)
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s @> %s::jsonb' % (lhs, rhs), lhs_params + rhs_params
+JSONBTextField.register_lookup(JSONContains)
+
+
+class JSONHasKey (models.Lookup):
+    """
+    Check whether the JSON document has the given top-level key, e.g.:
+
+        Place.objects.filter(data__has_key='status')
+
+    """
+    lookup_name = 'has_key'
+
+    def get_prep_lookup(self):
+        return self.rhs
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s ? %s' % (lhs, rhs), lhs_params + rhs_params
+JSONBTextField.register_lookup(JSONHasKey)
+
+
+def pass_jsonb_through_as_text(sender, connection, **kwargs):
+    """
+    Have psycopg2 hand jsonb values to us as text, instead of decoding them,
+    since JSONBTextField would only encode them again.
+    """
+    if connection.vendor == 'postgresql':
+        from psycopg2.extras import register_default_jsonb
+        register_default_jsonb(conn_or_curs=connection.connection, loads=lambda value: value)
+connection_created.connect(pass_jsonb_through_as_text, dispatch_uid="jsonb-as-text")
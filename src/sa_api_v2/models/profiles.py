@@ -105,6 +105,26 @@ class User (CacheClearingModel, AbstractUser):
     def get_groups(self):
         return self._groups.all().prefetch_related('permissions')
 
+    def save(self, *args, **kwargs):
+        # Logging in only updates the last login time, which isn't part of
+        # any cached response.
+        if set(kwargs.get('update_fields') or ()) == set(['last_login']):
+            kwargs.setdefault('clear_cache', False)
+        return super(User, self).save(*args, **kwargs)
+
+    def delete(self, clear_cache=True, *args, **kwargs):
+        # The user's things are deleted along with them, so find the datasets
+        # that they were in while we still can.
+        dataset_params = []
+        if clear_cache:
+            dataset_params = self.cache.get_submitted_dataset_params(user_id=self.id)
+
+        result = super(User, self).delete(clear_cache, *args, **kwargs)
+
+        if clear_cache:
+            self.cache.clear_dataset_generations(dataset_params)
+        return result
+
     class Meta:
         app_label = 'sa_api_v2'
         db_table = 'auth_user'
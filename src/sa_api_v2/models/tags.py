@@ -2,6 +2,7 @@ import re
 from closuretree.models import ClosureModel
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
+from .caching import CacheClearingModel
 from .core import DataSet, Place, TimeStampedModel
 from .. import cache
 from .profiles import User
@@ -32,7 +33,7 @@ class Tag(ClosureModel):
         ordering = ['name']
 
 
-class PlaceTag(TimeStampedModel):
+class PlaceTag(CacheClearingModel, TimeStampedModel):
     tag = models.ForeignKey(Tag, related_name='place_tags', null=False, on_delete=models.CASCADE)
     submitter = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
     place = models.ForeignKey(Place, related_name='tags', on_delete=models.CASCADE)
@@ -11,6 +11,30 @@ DISTANCE_PARAM = 'distance_lt'
 BBOX_PARAM = 'bounds'
 FORMAT_PARAM = 'format'
 TEXTSEARCH_PARAM = 'search'
+ORDER_BY_PARAM = 'order_by'
+ATTRS_PARAM = 'attrs'
+GRID_PARAM = 'grid'
+CLUSTER_PARAM = 'cluster'
+PRECISION_PARAM = 'precision'
+SIMPLIFY_PARAM = 'simplify'
+ZOOM_PARAM = 'zoom'
+LIMIT_PARAM = 'limit'
+SNAP_TO_TILES_PARAM = 'snap_to_tiles'
+
+# Parameters that are turned on by their presence in the querystring,
+# regardless of their values
+FLAG_PARAMS = (
+    INCLUDE_INVISIBLE_PARAM,
+    INCLUDE_PRIVATE_PLACES_PARAM,
+    INCLUDE_PRIVATE_FIELDS_PARAM,
+    INCLUDE_SUBMISSIONS_PARAM,
+    INCLUDE_TAGS_PARAM,
+    SNAP_TO_TILES_PARAM,
+)
+
+# Flag values that turn a flag off for the serializers (any other value,
+# including an empty one, turns it on)
+FLAG_OFF_VALUES = ('false', 'no', 'off')
 
 PAGE_PARAM = 'page'
 PAGE_SIZE_PARAM = lambda: getattr(settings, 'REST_FRAMEWORK', {}).get('PAGINATE_BY_PARAM')
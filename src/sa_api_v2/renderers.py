@@ -1,5 +1,5 @@
 import ujson as json
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework_jsonp.renderers import JSONPRenderer
 from rest_framework_csv.renderers import CSVRenderer
 from django.contrib.gis.geos import GEOSGeometry
@@ -55,6 +55,8 @@ class GeoJSONRenderer(JSONRenderer):
         geometry = feature_props.pop(self.geometry_field)
         feature_id = feature_props.get(self.id_field)  # Should this be popped?
 
+        # Geometries that are already GeoJSON (e.g., encoded by the database)
+        # are passed through as they are.
         if isinstance(geometry, basestring):
             geometry = json.loads(GEOSGeometry(geometry).json)
         elif isinstance(geometry, GEOSGeometry):
@@ -97,3 +99,31 @@ class NullJSONPRenderer(JSONPRenderer, NullJSONRenderer):
     (JSONPRenderer will call NullJSONRenderer before JSONRenderer)
     """
     pass
+
+
+class MVTRenderer(BaseRenderer):
+    """
+    Renderer for Mapbox Vector Tiles, which are already encoded (by the
+    database). Errors, and anything else that isn't a tile, are rendered
+    (and served) as JSON.
+    """
+    media_type = 'application/vnd.mapbox-vector-tile'
+    format = 'mvt'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        response = renderer_context.get('response')
+        is_success = response is None or 200 <= response.status_code < 300
+
+        if isinstance(data, bytes) and is_success:
+            return data
+
+        json_renderer = JSONRenderer()
+        if response is not None:
+            content_type = json_renderer.media_type
+            if json_renderer.charset:
+                content_type += '; charset=%s' % json_renderer.charset
+            response['Content-Type'] = content_type
+        return json_renderer.render(data, json_renderer.media_type, renderer_context)
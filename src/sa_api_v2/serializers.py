@@ -8,6 +8,7 @@ from collections import defaultdict, OrderedDict
 from itertools import chain
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.exceptions import ValidationError
+from django.db.models import Count, Manager
 from django.utils.http import urlquote_plus
 from rest_framework import pagination, serializers, fields
 from rest_framework.response import Response
@@ -22,7 +23,8 @@ from .params import (
     INCLUDE_TAGS_PARAM,
     INCLUDE_PRIVATE_FIELDS_PARAM,
     INCLUDE_SUBMISSIONS_PARAM,
-    FORMAT_PARAM
+    FORMAT_PARAM,
+    FLAG_OFF_VALUES
 )
 
 import logging
@@ -808,7 +810,7 @@ class DataSetSubmissionSetSummarySerializer (serializers.HyperlinkedModelSeriali
     def is_flag_on(self, flagname):
         request = self.context['request']
         param = request.GET.get(flagname, 'false')
-        return param.lower() not in ('false', 'no', 'off')
+        return param.lower() not in FLAG_OFF_VALUES
 
     def get_submission_sets(self, dataset):
         include_invisible = self.is_flag_on(INCLUDE_INVISIBLE_PARAM)
@@ -842,7 +844,7 @@ class SubmittedThingSerializer (ActivityGenerator, DataBlobProcessor):
     def is_flag_on(self, flagname):
         request = self.context['request']
         param = request.GET.get(flagname, 'false')
-        return param.lower() not in ('false', 'no', 'off')
+        return param.lower() not in FLAG_OFF_VALUES
 
 
 # Place serializers
@@ -865,22 +867,36 @@ class BasePlaceSerializer (SubmittedThingSerializer,
                 submission_sets[set_name].append(submission)
         return submission_sets
 
-    def summary_to_native(self, set_name, submissions):
+    def get_submission_set_lengths(self, place):
+        """
+        Get a mapping from submission set name to the number of submissions
+        in the set. The list serializer counts these for the whole page of
+        places at once; otherwise, they're counted from the place's
+        submissions.
+        """
+        set_lengths = self.context.get('submission_set_lengths')
+        if set_lengths is not None:
+            return set_lengths.get(place.pk, {})
+
+        submission_sets = self.get_submission_sets(place)
+        return dict((set_name, len(submissions))
+                    for set_name, submissions in submission_sets.iteritems())
+
+    def summary_to_native(self, place, set_name, length):
         return {
             'name': set_name,
-            'length': len(submissions)
+            'length': length
         }
 
     def get_submission_set_summaries(self, place):
         """
-        Get a mapping from place id to a submission set summary dictionary.
-        Get this for the entire dataset at once.
+        Get a mapping from set name to a submission set summary dictionary.
         """
         request = self.context['request']
 
-        submission_sets = self.get_submission_sets(place)
+        set_lengths = self.get_submission_set_lengths(place)
         summaries = {}
-        for set_name, submissions in submission_sets.iteritems():
+        for set_name, length in set_lengths.iteritems():
             # Ensure the user has read permission on the submission set.
             user = getattr(request, 'user', None)
             client = getattr(request, 'client', None)
@@ -889,21 +905,28 @@ class BasePlaceSerializer (SubmittedThingSerializer,
             if not check_data_permission(user, client, None, 'retrieve', dataset, set_name):
                 continue
 
-            summaries[set_name] = self.summary_to_native(set_name, submissions)
+            summaries[set_name] = self.summary_to_native(place, set_name, length)
 
         return summaries
 
     def get_tag_summary(self, place):
         """
-        Get a mapping from place id to a tag summary dictionary.
-        Get this for the entire dataset at once.
+        Get a tag summary dictionary for the place. The list serializer counts
+        the tags for the whole page of places at once.
         """
         url_field = PlaceTagListIdentityField()
         url_field.context = self.context
         url = url_field.to_representation(place)
+
+        tag_lengths = self.context.get('tag_lengths')
+        if tag_lengths is not None:
+            length = tag_lengths.get(place.pk, 0)
+        else:
+            length = place.tags.count()
+
         return {
             'url': url,
-            'length': place.tags.count()
+            'length': length
         }
 
     def get_detailed_tags(self, place):
@@ -955,6 +978,15 @@ class BasePlaceSerializer (SubmittedThingSerializer,
     def submitter_to_native(self, obj):
         return SimpleUserSerializer(obj.submitter).data if obj.submitter else None
 
+    def geometry_to_native(self, obj):
+        # If the database has already encoded the geometry as GeoJSON (see
+        # GeoSubmittedThingQuerySet.with_geojson), use that as is. Otherwise,
+        # use WKT.
+        geometry_geojson = getattr(obj, 'geometry_geojson', None)
+        if geometry_geojson is not None:
+            return json.loads(geometry_geojson)
+        return str(obj.geometry or 'POINT(0 0)')  # = GeometryField(format='wkt')
+
     def to_representation(self, obj):
         obj = self.ensure_obj(obj)
         fields = self.get_fields()
@@ -963,7 +995,7 @@ class BasePlaceSerializer (SubmittedThingSerializer,
 
         data = {
             'id': obj.pk,  # = serializers.PrimaryKeyRelatedField(read_only=True)
-            'geometry': str(obj.geometry or 'POINT(0 0)'),  # = GeometryField(format='wkt')
+            'geometry': self.geometry_to_native(obj),
             'dataset': fields['dataset'].get_url(obj.dataset, request),
             'attachments': self.attachments_to_native(obj),  # = AttachmentSerializer(read_only=True)
             'submitter': self.submitter_to_native(obj),
@@ -1014,6 +1046,44 @@ class SimplePlaceSerializer (BasePlaceSerializer):
 
 
 class PlaceListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        places = list(data.all() if isinstance(data, Manager) else data)
+        place_ids = [place.pk for place in places]
+
+        # Count the submission sets and tags of the whole page of places in
+        # one query each, instead of once per place.
+        if place_ids and not self.child.is_flag_on(INCLUDE_SUBMISSIONS_PARAM):
+            self.context['submission_set_lengths'] = self.get_submission_set_lengths(place_ids)
+        if place_ids and not self.child.is_flag_on(INCLUDE_TAGS_PARAM):
+            self.context['tag_lengths'] = self.get_tag_lengths(place_ids)
+
+        return super(PlaceListSerializer, self).to_representation(places)
+
+    def get_submission_set_lengths(self, place_ids):
+        """
+        Get a mapping from place id to a mapping from submission set name to
+        the number of submissions in the set.
+        """
+        submissions = models.Submission.objects.filter(place_model_id__in=place_ids)
+        if not self.child.is_flag_on(INCLUDE_INVISIBLE_PARAM):
+            submissions = submissions.filter(visible=True)
+
+        set_lengths = defaultdict(dict)
+        for row in submissions.order_by()\
+                .values('place_model_id', 'set_name')\
+                .annotate(length=Count('pk')):
+            set_lengths[row['place_model_id']][row['set_name']] = row['length']
+        return set_lengths
+
+    def get_tag_lengths(self, place_ids):
+        """
+        Get a mapping from place id to the number of tags on the place.
+        """
+        place_tags = models.PlaceTag.objects.filter(place_id__in=place_ids)
+        return dict(place_tags.order_by()
+                    .values_list('place_id')
+                    .annotate(length=Count('pk')))
+
     def update(self, instance, validated_data):
         place_mapping = {place.id: place for place in instance}
 
@@ -1045,14 +1115,18 @@ class PlaceSerializer (BasePlaceSerializer,
     class Meta (BasePlaceSerializer.Meta):
         list_serializer_class = PlaceListSerializer
 
-    def summary_to_native(self, set_name, submissions):
-        url_field = SubmissionSetIdentityField()
-        url_field.context = self.context
-        set_url = url_field.to_representation(submissions[0])
+    def summary_to_native(self, place, set_name, length):
+        # The set URL is the place's URL plus the set name, so build it from
+        # the place rather than from one of the set's submissions.
+        url_kwargs = PlaceIdentityField().get_url_kwargs(place)
+        url_kwargs['submission_set_name'] = set_name
+        set_url = api_reverse(SubmissionSetIdentityField.view_name, kwargs=url_kwargs,
+                              request=self.context.get('request', None),
+                              format=self.context.get('format', None))
 
         return {
             'name': set_name,
-            'length': len(submissions),
+            'length': length,
             'url': set_url,
         }
 
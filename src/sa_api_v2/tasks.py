@@ -4,12 +4,16 @@ import requests
 import ujson as json
 from celery import shared_task
 from celery.result import AsyncResult
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core import cache as django_cache
+from django.core.urlresolvers import resolve
 from django.db import transaction
 from django.test.client import RequestFactory
 from django.utils.timezone import now
 from itertools import chain
 from social_django.models import UserSocialAuth
-from .models import DataSnapshotRequest, DataSnapshot, DataSet, User
+from .models import DataSnapshotRequest, DataSnapshot, DataSet, DataIndex, IndexedValue, User
 from .serializers import SimplePlaceSerializer, SimpleSubmissionSerializer, SimpleDataSetSerializer
 from .renderers import CSVRenderer, JSONRenderer, GeoJSONRenderer
 
@@ -17,6 +21,33 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# =========================================================
+# Scoping the cache buffer
+#
+
+@task_prerun.connect
+def reset_cache_buffer(task=None, **kwargs):
+    """
+    Scope the cache buffer to the task, as CacheBufferMiddleware does for
+    requests, so that worker threads don't keep stale values (or an ever
+    growing buffer) from one task to the next. Tasks run eagerly share the
+    buffer of whatever called them.
+    """
+    from .cache import cache_buffer
+    if not task.request.is_eager:
+        cache_buffer.reset()
+
+@task_postrun.connect
+def flush_cache_buffer(task=None, state=None, **kwargs):
+    from .cache import cache_buffer
+    if task.request.is_eager:
+        return
+    if state == 'SUCCESS':
+        cache_buffer.flush()
+    else:
+        cache_buffer.reset()
+
+
 # =========================================================
 # Generating snapshots
 #
@@ -120,6 +151,100 @@ def clone_related_dataset_data(orig_dataset_id, new_dataset_id):
     with transaction.atomic():
         orig_dataset.clone_related(onto=new_dataset)
 
+    # Outside of a request, nothing else flushes the cache invalidations.
+    from .cache import cache_buffer
+    cache_buffer.flush()
+
+
+# =========================================================
+# Reindexing data
+#
+
+@shared_task(bind=True)
+def reindex_dataset(self, dataset_id, index_ids=None):
+    """
+    Rebuild the indexed values of a dataset's things, on all of the dataset's
+    indexes or only on those with the given ids. Progress is reported in the
+    task's state, as the numbers of things done and in total.
+    """
+    dataset = DataSet.objects.get(pk=dataset_id)
+    indexes = dataset.indexes.all()
+    if index_ids is not None:
+        indexes = indexes.filter(pk__in=index_ids)
+    indexes = list(indexes)
+
+    def report_progress(done, total):
+        log.info('Reindexed %s of %s things in dataset %s' % (done, total, dataset_id))
+        if self.request.id:
+            self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+
+    IndexedValue.objects.bulk_sync(dataset.things.all(), indexes, progress=report_progress)
+    DataIndex.mark_built(indexes)
+
+    # Responses filtered or ordered by the indexes may have changed.
+    from .cache import cache_buffer
+    dataset.clear_instance_cache()
+    cache_buffer.flush()
+
+
+# =========================================================
+# Warming the API cache
+#
+
+def warm_cached_request(request_info):
+    """
+    Reconstruct a request recorded by CachedResourceMixin and run it through
+    its view, which will render the response and store it in the cache (or do
+    nothing if the response is already cached).
+    """
+    path_info = request_info['path_info']
+    script_name = request_info['path'][:-len(path_info)] if path_info else request_info['path']
+
+    request = RequestFactory().get(
+        path_info,
+        secure=request_info['secure'],
+        QUERY_STRING=request_info['query'],
+        HTTP_ACCEPT=request_info['accept'],
+        HTTP_HOST=request_info['host'],
+        SCRIPT_NAME=script_name)
+
+    # Don't count the warming request as a reader's request.
+    request.is_cache_warming = True
+
+    match = resolve(path_info)
+    return match.func(request, *match.args, **match.kwargs)
+
+@shared_task
+def warm_dataset_cache(owner_username, dataset_slug, count=None):
+    """
+    Re-render the dataset's most popular cached responses, so that readers
+    find them in the cache after the dataset changes.
+    """
+    from .cache import DataSetCache, cache_buffer
+    ds_cache = DataSetCache()
+    params = {'owner_username': owner_username, 'dataset_slug': dataset_slug}
+
+    # Let further changes to the dataset schedule another warming.
+    django_cache.cache.delete(ds_cache.get_warming_key(**params))
+
+    if count is None:
+        count = getattr(settings, 'API_CACHE_WARM_REQUESTS', 0)
+
+    warmed = 0
+    for request_info in ds_cache.get_hot_requests(count, **params):
+        cache_buffer.reset()
+        try:
+            response = warm_cached_request(request_info)
+        except Exception:
+            log.exception('Could not warm the cache for %r' % (request_info,))
+            continue
+
+        if response.status_code == 200:
+            warmed += 1
+
+    log.info('Warmed %s cached response(s) for dataset %s/%s' % (warmed, owner_username, dataset_slug))
+    return warmed
+
 
 # =========================================================
 # Loading a dataset
@@ -0,0 +1,397 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.cache import cache as django_cache
+from mock import MagicMock, patch
+import threading
+from ..cache import (CacheBuffer, DataSetCache, LocalLRUCache, LocalSetBackend,
+    cache_buffer, get_set_backend)
+from ..metrics import MetricsRegistry
+from ..middleware import CacheBufferMiddleware
+
+
+class TestCacheBufferSets (TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def tearDown(self):
+        django_cache.clear()
+
+    def test_local_set_backend_is_used_without_redis(self):
+        self.assertIsInstance(get_set_backend(), LocalSetBackend)
+
+    def test_added_members_are_flushed_to_the_set_backend(self):
+        buf = CacheBuffer()
+        buf.add('things_keys', ['a', 'b'])
+        buf.add('things_keys', ['c'])
+
+        # Nothing is sent until the buffer is flushed
+        self.assertEqual(get_set_backend().members('things_keys'), set())
+        self.assertEqual(buf.members('things_keys'), set(['a', 'b', 'c']))
+
+        buf.flush()
+        self.assertEqual(get_set_backend().members('things_keys'), set(['a', 'b', 'c']))
+
+    def test_members_combine_stored_and_queued_changes(self):
+        get_set_backend().add('things_keys', ['a', 'b'], 60)
+
+        buf = CacheBuffer()
+        buf.add('things_keys', ['c'])
+        buf.remove('things_keys', ['a'])
+        self.assertEqual(buf.members('things_keys'), set(['b', 'c']))
+        self.assertTrue(buf.contains('things_keys', 'c'))
+        self.assertFalse(buf.contains('things_keys', 'a'))
+
+        buf.flush()
+        self.assertEqual(get_set_backend().members('things_keys'), set(['b', 'c']))
+
+    def test_deleted_sets_only_keep_members_added_afterwards(self):
+        get_set_backend().add('things_keys', ['a', 'b'], 60)
+
+        buf = CacheBuffer()
+        buf.delete_many(['things_keys'])
+        buf.add('things_keys', ['c'])
+        self.assertEqual(buf.members('things_keys'), set(['c']))
+
+        buf.flush()
+        self.assertEqual(get_set_backend().members('things_keys'), set(['c']))
+
+    def test_concurrent_buffers_do_not_lose_members(self):
+        buf1 = CacheBuffer()
+        buf2 = CacheBuffer()
+
+        # Both buffers know the set before either one changes it
+        self.assertEqual(buf1.members('things_keys'), set())
+        self.assertEqual(buf2.members('things_keys'), set())
+
+        buf1.add('things_keys', ['a'])
+        buf2.add('things_keys', ['b'])
+        buf1.flush()
+        buf2.flush()
+
+        self.assertEqual(get_set_backend().members('things_keys'), set(['a', 'b']))
+
+
+class TestDataSetCacheGenerations (TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+        self.params = {'owner_username': 'mjumbewu', 'dataset_slug': 'chairs'}
+
+    def tearDown(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def test_generation_is_stable_until_incremented(self):
+        ds_cache = DataSetCache()
+        generation = ds_cache.get_generation(**self.params)
+
+        cache_buffer.reset()
+        self.assertEqual(ds_cache.get_generation(**self.params), generation)
+
+        ds_cache.clear_generations(**self.params)
+        cache_buffer.reset()
+        self.assertEqual(ds_cache.get_generation(**self.params), generation + 1)
+
+    def test_generation_is_not_reused_after_eviction(self):
+        ds_cache = DataSetCache()
+        with patch('time.time', return_value=1000.0):
+            generation = ds_cache.get_generation(**self.params)
+
+        django_cache.delete(ds_cache.get_generation_key(**self.params))
+        cache_buffer.reset()
+        with patch('time.time', return_value=1001.0):
+            ds_cache.clear_generations(**self.params)
+        self.assertGreater(ds_cache.get_generation(**self.params), generation)
+
+    def test_generation_is_incremented_again_on_commit(self):
+        ds_cache = DataSetCache()
+        generation = ds_cache.get_generation(**self.params)
+
+        with patch('sa_api_v2.cache.transaction.on_commit') as on_commit:
+            ds_cache.clear_generations(**self.params)
+        self.assertEqual(ds_cache.get_generation(**self.params), generation + 1)
+
+        # Anything cached before the commit is versioned out once it happens
+        on_commit.call_args_list[0][0][0]()
+        self.assertEqual(ds_cache.get_generation(**self.params), generation + 2)
+
+    def test_generations_are_separate_per_dataset(self):
+        ds_cache = DataSetCache()
+        other_params = {'owner_username': 'mjumbewu', 'dataset_slug': 'tables'}
+        generation = ds_cache.get_generation(**self.params)
+        other_generation = ds_cache.get_generation(**other_params)
+
+        ds_cache.clear_generations(**self.params)
+        self.assertEqual(ds_cache.get_generation(**other_params), other_generation)
+        self.assertNotEqual(ds_cache.get_generation(**self.params), generation)
+
+
+class TestCacheBufferScope (TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def tearDown(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def test_cache_buffer_is_separate_for_each_thread(self):
+        cache_buffer.set('my_key', 'main thread')
+
+        seen = {}
+        def other_request():
+            seen['value'] = cache_buffer.get('my_key')
+            cache_buffer.set('my_key', 'other thread')
+            cache_buffer.flush()
+
+        thread = threading.Thread(target=other_request)
+        thread.start()
+        thread.join()
+
+        # The other thread neither saw nor flushed our queued value
+        self.assertIsNone(seen['value'])
+        self.assertEqual(cache_buffer.queue, {'my_key': 'main thread'})
+
+    def test_middleware_flushes_buffer_after_each_request(self):
+        middleware = CacheBufferMiddleware()
+        cache_buffer.set('leftover_key', 'leftover')
+
+        middleware.process_request(None)
+        self.assertEqual(cache_buffer.queue, {})
+
+        cache_buffer.delete('deleted_key')
+        django_cache.set('deleted_key', 'value')
+        response = object()
+        self.assertIs(middleware.process_response(None, response), response)
+        self.assertIsNone(django_cache.get('deleted_key'))
+        self.assertIsNone(django_cache.get('leftover_key'))
+
+    @override_settings(API_CACHE_TIMEOUT=60)
+    def test_flush_sends_everything_in_one_pipeline(self):
+        pipe = MagicMock()
+        set_backend = MagicMock()
+        set_backend.pipeline.return_value = pipe
+
+        buf = CacheBuffer()
+        buf.set('key1', 'value1')
+        buf.set('key2', 'value2', timeout=None)
+        buf.delete('key3')
+        buf.add('things_keys', ['a'])
+
+        with patch('sa_api_v2.cache.get_set_backend', return_value=set_backend), \
+             patch('sa_api_v2.cache.django_cache.cache') as patched_cache:
+            buf.flush()
+
+        patched_cache.delete_many.assert_called_once_with(set(['key3']), client=pipe)
+        patched_cache.set.assert_any_call('key1', 'value1', 60, client=pipe)
+        patched_cache.set.assert_any_call('key2', 'value2', None, client=pipe)
+        self.assertFalse(patched_cache.set_many.called)
+        set_backend.add.assert_called_once_with('things_keys', set(['a']), 60, client=pipe)
+        pipe.execute.assert_called_once_with()
+
+
+class TestLocalLRUCache (TestCase):
+    @override_settings(API_LOCAL_CACHE_SIZE=2)
+    def test_least_recently_used_values_are_evicted(self):
+        lru = LocalLRUCache()
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_values_are_only_returned_for_their_version(self):
+        lru = LocalLRUCache()
+        lru.set('a', 1, version=5)
+        self.assertEqual(lru.get('a', 5), 1)
+        self.assertIsNone(lru.get('a', 6))
+
+    @override_settings(API_LOCAL_CACHE_TIMEOUT=10)
+    def test_values_expire(self):
+        lru = LocalLRUCache()
+        with patch('time.time', return_value=1000.0):
+            lru.set('a', 1)
+        with patch('time.time', return_value=1005.0):
+            self.assertEqual(lru.get('a'), 1)
+        with patch('time.time', return_value=1011.0):
+            self.assertIsNone(lru.get('a'))
+
+
+class TestDataSetCacheLocalInstances (TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+        DataSetCache.local_cache.clear()
+        self.params = {'owner_username': 'mjumbewu', 'dataset_slug': 'chairs'}
+
+    def tearDown(self):
+        cache_buffer.reset()
+        django_cache.clear()
+        DataSetCache.local_cache.clear()
+
+    def test_instance_is_read_from_memory_within_a_generation(self):
+        ds_cache = DataSetCache()
+        ds_cache.set_instance({'slug': 'chairs'}, **self.params)
+        cache_buffer.flush()
+
+        with patch.object(cache_buffer, 'get', wraps=cache_buffer.get) as patched_get:
+            self.assertEqual(ds_cache.get_instance(**self.params), {'slug': 'chairs'})
+            read_keys = [call[0][0] for call in patched_get.call_args_list]
+        self.assertNotIn(ds_cache.get_instance_key(**self.params), read_keys)
+
+    def test_instance_is_not_read_from_memory_after_generation_changes(self):
+        ds_cache = DataSetCache()
+        ds_cache.set_instance({'slug': 'chairs'}, **self.params)
+        cache_buffer.flush()
+
+        # Some other process changes the dataset
+        django_cache.incr(ds_cache.get_generation_key(**self.params))
+        django_cache.set(ds_cache.get_instance_key(**self.params), {'slug': 'tables'})
+
+        cache_buffer.reset()
+        self.assertEqual(ds_cache.get_instance(**self.params), {'slug': 'tables'})
+
+    def test_changes_to_returned_values_are_not_cached(self):
+        ds_cache = DataSetCache()
+        ds_cache.save_permissions([{'submission_set': 'places', 'can_create': False}], **self.params)
+        cache_buffer.flush()
+
+        permissions = ds_cache.get_permissions(**self.params)
+        permissions[0]['can_create'] = True
+
+        # The next read is still from memory, but unaffected by the change
+        with patch.object(cache_buffer, 'get', wraps=cache_buffer.get) as patched_get:
+            self.assertEqual(ds_cache.get_permissions(**self.params),
+                             [{'submission_set': 'places', 'can_create': False}])
+            read_keys = [call[0][0] for call in patched_get.call_args_list]
+        self.assertNotIn(ds_cache.get_permissions_key(**self.params), read_keys)
+
+    def test_indexes_are_not_kept_in_the_buffer(self):
+        ds_cache = DataSetCache()
+        self.assertEqual(ds_cache.get_indexes(1, lambda: ['old']), ['old'])
+
+        # The indexes change in another worker (e.g., in a task). This
+        # worker's buffer may never be reset, so it must not hold on to them.
+        ds_cache.clear_indexes(1)
+        self.assertEqual(ds_cache.get_indexes(1, lambda: ['new']), ['new'])
+        self.assertEqual(cache_buffer.buffer, {})
+
+
+class TestMetricsRegistry (TestCase):
+    def test_counters_and_timings_are_recorded_per_label(self):
+        metrics = MetricsRegistry()
+        metrics.incr('hits', 'PlaceListView')
+        metrics.incr('hits', 'PlaceListView')
+        metrics.incr('bytes_stored', 'PlaceListView', 100)
+        metrics.incr('hits', 'SubmissionListView')
+        metrics.observe('rebuild_seconds', 'PlaceListView', 0.5)
+        metrics.observe('rebuild_seconds', 'PlaceListView', 1.5)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['hits'], {'PlaceListView': 2, 'SubmissionListView': 1})
+        self.assertEqual(snapshot['counters']['bytes_stored'], {'PlaceListView': 100})
+        self.assertEqual(snapshot['timings']['rebuild_seconds']['PlaceListView'],
+                         {'count': 2, 'total': 2.0, 'max': 1.5})
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()['counters'], {})
+
+    @override_settings(API_CACHE_METRICS_LOG_INTERVAL=60)
+    def test_metrics_are_logged_periodically(self):
+        with patch('time.time', return_value=1000.0):
+            metrics = MetricsRegistry()
+
+        with patch('sa_api_v2.metrics.logger') as patched_logger:
+            with patch('time.time', return_value=1030.0):
+                metrics.log_if_due()
+            self.assertEqual(patched_logger.info.call_count, 0)
+
+            with patch('time.time', return_value=1061.0):
+                metrics.log_if_due()
+                metrics.log_if_due()
+            self.assertEqual(patched_logger.info.call_count, 1)
+
+
+class TestDataSetCacheWarming (TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+        self.params = {'owner_username': 'mjumbewu', 'dataset_slug': 'chairs'}
+
+    def tearDown(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def test_hot_requests_are_ordered_by_popularity(self):
+        ds_cache = DataSetCache()
+        for path, hits in [('/a', 1), ('/b', 3), ('/c', 2)]:
+            for _ in range(hits):
+                ds_cache.record_request({'path': path}, **self.params)
+
+        # Nothing is counted until the buffer is flushed
+        self.assertEqual(ds_cache.get_hot_requests(2, **self.params), [])
+
+        cache_buffer.flush()
+        self.assertEqual(ds_cache.get_hot_requests(2, **self.params),
+                         [{'path': '/b'}, {'path': '/c'}])
+
+    @override_settings(API_CACHE_WARM_TRACKED_REQUESTS=2)
+    def test_only_the_most_popular_requests_are_tracked(self):
+        ds_cache = DataSetCache()
+        for path, hits in [('/a', 1), ('/b', 3), ('/c', 2)]:
+            for _ in range(hits):
+                ds_cache.record_request({'path': path}, **self.params)
+                cache_buffer.flush()
+
+        # The least popular request made room for the new one
+        self.assertEqual(ds_cache.get_hot_requests(10, **self.params),
+                         [{'path': '/b'}, {'path': '/c'}])
+
+    @override_settings(API_CACHE_WARM_WINDOW=60)
+    def test_requests_are_counted_in_fixed_windows(self):
+        ds_cache = DataSetCache()
+        with patch('time.time', return_value=1000.0):
+            ds_cache.record_request({'path': '/a'}, **self.params)
+            ds_cache.record_request({'path': '/a'}, **self.params)
+            cache_buffer.flush()
+
+        # Counts from the previous window come after the current window's
+        with patch('time.time', return_value=1070.0):
+            ds_cache.record_request({'path': '/b'}, **self.params)
+            cache_buffer.flush()
+            self.assertEqual(ds_cache.get_hot_requests(10, **self.params),
+                             [{'path': '/b'}, {'path': '/a'}])
+
+        # Older windows are no longer counted
+        with patch('time.time', return_value=1130.0):
+            self.assertEqual(ds_cache.get_hot_requests(10, **self.params),
+                             [{'path': '/b'}])
+
+    @override_settings(API_CACHE_WARM_REQUESTS=10, API_CACHE_WARM_DELAY=5, API_CACHE_TIMEOUT=60)
+    def test_warming_is_scheduled_once_per_delay(self):
+        ds_cache = DataSetCache()
+        with patch('sa_api_v2.cache.transaction.on_commit') as on_commit, \
+             patch('sa_api_v2.tasks.warm_dataset_cache.apply_async') as apply_async:
+            ds_cache.schedule_warming(**self.params)
+            ds_cache.schedule_warming(**self.params)
+
+            self.assertEqual(on_commit.call_count, 1)
+            on_commit.call_args[0][0]()
+            apply_async.assert_called_once_with(args=('mjumbewu', 'chairs'), countdown=5)
+
+    @override_settings(API_CACHE_WARM_REQUESTS=0)
+    def test_warming_can_be_disabled(self):
+        ds_cache = DataSetCache()
+        with patch('sa_api_v2.cache.transaction.on_commit') as on_commit:
+            ds_cache.schedule_warming(**self.params)
+        self.assertEqual(on_commit.call_count, 0)
+
+    @override_settings(API_CACHE_WARM_REQUESTS=10, API_CACHE_WARM_DELAY=5, API_CACHE_TIMEOUT=1)
+    def test_warming_is_disabled_when_responses_expire_too_soon(self):
+        ds_cache = DataSetCache()
+        with patch('sa_api_v2.cache.transaction.on_commit') as on_commit:
+            ds_cache.schedule_warming(**self.params)
+        self.assertEqual(on_commit.call_count, 0)
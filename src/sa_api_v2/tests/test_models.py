@@ -5,12 +5,15 @@ from django.test.client import RequestFactory
 # from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 # from mock import patch
 # from nose.tools import (istest, assert_equal, assert_not_equal, assert_in,
 #                         assert_raises)
 from ..models import (DataSet, User, Group, SubmittedThing, Action, Place, Submission,
-    DataSetPermission, check_data_permission, DataIndex, IndexedValue)
+    DataSetPermission, check_data_permission, DataIndex, IndexedValue, Tag, PlaceTag)
 from ..apikey.models import ApiKey
+from ..cache import DataSetCache
 # from ..views import SubmissionCollectionView
 # from ..views import raise_error_if_not_authenticated
 # from ..views import ApiKeyCollectionView
@@ -60,6 +63,127 @@ class TestSubmittedThing (TestCase):
         qs = Action.objects.all()
         self.assertEqual(qs.count(), 1)
 
+    def test_data_is_read_back_as_json_text(self):
+        st = SubmittedThing.objects.create(dataset=self.dataset, data='{"key": "value"}')
+        st = SubmittedThing.objects.get(pk=st.pk)
+        self.assertEqual(json.loads(st.data), {'key': 'value'})
+
+    def test_user_can_query_by_data_contents(self):
+        st1 = SubmittedThing.objects.create(dataset=self.dataset, data='{"status": "open", "votes": 5}')
+        st2 = SubmittedThing.objects.create(dataset=self.dataset, data='{"status": "closed"}')
+        st3 = SubmittedThing.objects.create(dataset=self.dataset, data='{}')
+
+        qs = SubmittedThing.objects.filter_by_data_contains({'status': 'open'})
+        self.assertEqual(set(qs), set([st1]))
+
+        qs = SubmittedThing.objects.filter_by_data_key('status')
+        self.assertEqual(set(qs), set([st1, st2]))
+
+        qs = SubmittedThing.objects.filter_by_data('votes', '5')
+        self.assertEqual(set(qs), set([st1]))
+
+        qs = SubmittedThing.objects.filter_by_data('status', 'closed', 'other')
+        self.assertEqual(set(qs), set([st2]))
+
+    def test_search_document_is_updated_on_save(self):
+        st = SubmittedThing.objects.create(dataset=self.dataset, data='{"name": "Corner garden", "private-notes": "compost"}')
+        self.assertEqual(list(SubmittedThing.objects.search('garden')), [st])
+        self.assertEqual(list(SubmittedThing.objects.search('gar corn')), [st])
+        self.assertEqual(list(SubmittedThing.objects.search('compost')), [])
+        self.assertEqual(list(SubmittedThing.objects.search('name')), [])
+
+        st.data = '{"name": "Corner lot"}'
+        st.save()
+        self.assertEqual(list(SubmittedThing.objects.search('garden')), [])
+        self.assertEqual(list(SubmittedThing.objects.search('lot')), [st])
+
+    def test_search_document_is_updated_in_bulk(self):
+        SubmittedThing.objects.bulk_create([
+            SubmittedThing(dataset=self.dataset, data='{"name": "Corner garden"}')])
+        st = SubmittedThing.objects.get()
+        self.assertEqual(list(SubmittedThing.objects.search('garden')), [st])
+
+        SubmittedThing.objects.filter(pk=st.pk).update(data='{"name": "Corner lot"}')
+        self.assertEqual(list(SubmittedThing.objects.search('garden')), [])
+        self.assertEqual(list(SubmittedThing.objects.search('lot')), [st])
+
+    def test_search_can_be_used_in_a_subquery(self):
+        st = SubmittedThing.objects.create(dataset=self.dataset, data='{"name": "Corner garden"}')
+        SubmittedThing.objects.create(dataset=self.dataset, data='{"name": "Corner lot"}')
+
+        # The subquery's tables are renamed, so the search can't refer to the
+        # things table by name.
+        for ranked in (True, False):
+            matches = SubmittedThing.objects.search('garden', ranked=ranked).values('pk')
+            self.assertEqual(list(SubmittedThing.objects.filter(pk__in=matches)), [st])
+
+        # Places' search documents are on the (joined) things table.
+        place = Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data='{"name": "Corner garden"}')
+        matches = Place.objects.search('garden').values('pk')
+        self.assertEqual(list(Place.objects.filter(pk__in=matches)), [place])
+
+
+class TestDataSetGenerations (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='myuser')
+        self.submitter = User.objects.create(username='mysubmitter')
+        self.dataset = DataSet.objects.create(slug='data', owner=self.owner)
+        self.place = Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', submitter=self.submitter)
+        self.tag = Tag.objects.create(dataset=self.dataset, name='tag')
+        self.params = {'owner_username': self.owner.username, 'dataset_slug': self.dataset.slug}
+
+    def tearDown(self):
+        cache.clear()
+
+    def get_generation(self):
+        return self.dataset.cache.get_generation(**self.params)
+
+    def test_place_tag_changes_increment_generation(self):
+        generation = self.get_generation()
+        place_tag = PlaceTag.objects.create(place=self.place, tag=self.tag)
+        self.assertGreater(self.get_generation(), generation)
+
+        generation = self.get_generation()
+        place_tag.delete()
+        self.assertGreater(self.get_generation(), generation)
+
+    def test_submitter_changes_increment_generation(self):
+        generation = self.get_generation()
+        self.submitter.first_name = 'Changed'
+        self.submitter.save()
+        self.assertGreater(self.get_generation(), generation)
+
+        generation = self.get_generation()
+        self.submitter.save(update_fields=['last_login'])
+        self.assertEqual(self.get_generation(), generation)
+
+    def test_thing_changes_increment_generation_after_dependent_writes(self):
+        written = []
+        def bump_generation(**params):
+            written.append(Action.objects.filter(thing=self.place, action='update').exists())
+
+        with patch.object(DataSetCache, 'bump_generation', side_effect=bump_generation):
+            self.place.save()
+        self.assertTrue(written)
+        self.assertTrue(all(written))
+
+    def test_deleted_things_increment_generation_after_deletion(self):
+        place_id = self.place.id
+        remaining = []
+        def bump_generation(**params):
+            remaining.append(Place.objects.filter(id=place_id).exists())
+
+        with patch.object(DataSetCache, 'bump_generation', side_effect=bump_generation):
+            self.place.delete()
+        self.assertTrue(remaining)
+        self.assertFalse(any(remaining))
+
+    def test_deleted_submitters_increment_generation(self):
+        generation = self.get_generation()
+        self.submitter.delete()
+        self.assertGreater(self.get_generation(), generation)
+
 
 class TestDataIndexes (TestCase):
     def setUp(self):
@@ -73,8 +197,8 @@ class TestDataIndexes (TestCase):
         User.objects.all().delete()  # Everything should cascade from owner
 
     def test_indexed_values_are_indexed_when_thing_is_saved(self):
-        self.dataset.indexes.add(DataIndex(attr_name='index1'), bulk=False)
-        self.dataset.indexes.add(DataIndex(attr_name='index2'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='index1').save(reindex=True)
+        DataIndex(dataset=self.dataset, attr_name='index2').save(reindex=True)
 
         st1 = SubmittedThing(dataset=self.dataset)
         st1.data = '{"index1": "value1", "index2": 2, "freetext": "This is an unindexed value."}'
@@ -89,8 +213,8 @@ class TestDataIndexes (TestCase):
         st1.data = '{"index1": "value1", "index2": 2, "freetext": "This is an unindexed value."}'
         st1.save()
 
-        self.dataset.indexes.add(DataIndex(attr_name='index1'), bulk=False)
-        self.dataset.indexes.add(DataIndex(attr_name='index2'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='index1').save(reindex=True)
+        DataIndex(dataset=self.dataset, attr_name='index2').save(reindex=True)
 
         indexed_values = IndexedValue.objects.filter(index__dataset=self.dataset)
         self.assertEqual(indexed_values.count(), 2)
@@ -109,8 +233,8 @@ class TestDataIndexes (TestCase):
         st3.data = '{"index1": "value1", "index2": 2}'
         st3.save()
 
-        self.dataset.indexes.add(DataIndex(attr_name='index1'), bulk=False)
-        self.dataset.indexes.add(DataIndex(attr_name='index2'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='index1').save(reindex=True)
+        DataIndex(dataset=self.dataset, attr_name='index2').save(reindex=True)
 
         # index1 only has one value matching 'value1' in self.dataset
         qs = self.dataset.things.filter_by_index('index1', 'value1')
@@ -154,7 +278,7 @@ class TestDataIndexes (TestCase):
             indexed_value.get()
 
     def test_data_values_are_updated_when_saved(self):
-        self.dataset.indexes.add(DataIndex(attr_name='index'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='index').save(reindex=True)
 
         st1 = SubmittedThing(dataset=self.dataset)
         st1.data = '{"index": "value1", "freetext": "This is an unindexed value."}'
@@ -179,7 +303,7 @@ class TestDataIndexes (TestCase):
         st3.data = '{"index": "value1"}'
         st3.save()
 
-        self.dataset.indexes.add(DataIndex(attr_name='index'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='index').save(reindex=True)
         num_indexed_values = IndexedValue.objects.all().count()
 
         # At first, index with 'value1' should match two things.
@@ -195,6 +319,225 @@ class TestDataIndexes (TestCase):
         # Delete should have cascaded to indexed values.
         self.assertEqual(IndexedValue.objects.all().count(), num_indexed_values - 1)
 
+    def test_user_can_query_by_typed_indexed_value_ranges(self):
+        for budget in [500, '1500', 2500.5, 'unknown']:
+            st = SubmittedThing(dataset=self.dataset)
+            st.data = json.dumps({'budget': budget})
+            st.save()
+
+        DataIndex(dataset=self.dataset, attr_name='budget', attr_type='number').save(reindex=True)
+
+        # Numbers are compared as numbers, not strings
+        qs = self.dataset.things.filter_by_index('budget', '1000', attr_type='number', lookup='gt')
+        self.assertEqual(set(json.loads(st.data)['budget'] for st in qs), set(['1500', 2500.5]))
+
+        qs = self.dataset.things.filter_by_index('budget', '0,2000', attr_type='number', lookup='range')
+        self.assertEqual(set(json.loads(st.data)['budget'] for st in qs), set([500, '1500']))
+
+        with self.assertRaises(ValueError):
+            self.dataset.things.filter_by_index('budget', 'lots', attr_type='number', lookup='gt')
+
+    def test_user_can_query_by_typed_indexed_value_equality(self):
+        for done in [True, 'yes', False, 'maybe']:
+            st = SubmittedThing(dataset=self.dataset)
+            st.data = json.dumps({'done': done})
+            st.save()
+
+        DataIndex(dataset=self.dataset, attr_name='done', attr_type='boolean').save(reindex=True)
+
+        # Booleans are compared as booleans, not as their string values
+        qs = self.dataset.things.filter_by_index('done', 'true', attr_type='boolean')
+        self.assertEqual(set(json.loads(st.data)['done'] for st in qs), set([True, 'yes']))
+
+        qs = self.dataset.things.filter_by_index('done', 'false', attr_type='boolean')
+        self.assertEqual(set(json.loads(st.data)['done'] for st in qs), set([False]))
+
+        # Values that aren't booleans are still matched as strings
+        qs = self.dataset.things.filter_by_index('done', 'maybe', attr_type='boolean')
+        self.assertEqual(set(json.loads(st.data)['done'] for st in qs), set(['maybe']))
+
+    def test_user_can_order_by_typed_indexed_value(self):
+        for created_on in ['2019-02-01', '2018-12-31T12:00:00Z', None, '2019-01-15']:
+            st = SubmittedThing(dataset=self.dataset)
+            st.data = json.dumps({'created_on': created_on} if created_on else {})
+            st.save()
+
+        DataIndex(dataset=self.dataset, attr_name='created_on', attr_type='datetime').save(reindex=True)
+
+        # Things without a value come last, whichever the direction
+        qs = self.dataset.things.order_by_index('created_on', attr_type='datetime', descending=True)
+        self.assertEqual([json.loads(st.data).get('created_on') for st in qs],
+                         ['2019-02-01', '2019-01-15', '2018-12-31T12:00:00Z', None])
+
+        qs = self.dataset.things.order_by_index('created_on', attr_type='datetime')
+        self.assertEqual([json.loads(st.data).get('created_on') for st in qs],
+                         ['2018-12-31T12:00:00Z', '2019-01-15', '2019-02-01', None])
+
+        # The values are joined once, rather than looked up for each thing
+        self.assertEqual(str(qs.query).count('JOIN "sa_api_v2_indexedvalue"'), 1)
+        self.assertNotIn('SELECT "sa_api_v2_indexedvalue"', str(qs.query))
+
+    def test_bulk_sync_takes_the_same_number_of_queries_for_any_number_of_things(self):
+        index1 = DataIndex(attr_name='index1', dataset=self.dataset)
+        index1.save(reindex=False)
+        index2 = DataIndex(attr_name='index2', dataset=self.dataset)
+        index2.save(reindex=False)
+
+        def sync_things(count):
+            IndexedValue.objects.all().delete()
+            SubmittedThing.objects.all().delete()
+            for i in range(count):
+                SubmittedThing(dataset=self.dataset, data=json.dumps({'index1': i, 'index2': 'x'})).save(reindex=False)
+
+            with CaptureQueriesContext(connection) as queries:
+                IndexedValue.objects.bulk_sync(self.dataset.things.all(), [index1, index2])
+            self.assertEqual(IndexedValue.objects.count(), count * 2)
+            return len(queries)
+
+        self.assertEqual(sync_things(3), sync_things(30))
+
+    def test_sync_batch_adds_changes_and_removes_a_things_values(self):
+        index1 = DataIndex(attr_name='index1', dataset=self.dataset)
+        index1.save(reindex=False)
+        index2 = DataIndex(attr_name='index2', dataset=self.dataset)
+        index2.save(reindex=False)
+        st = SubmittedThing.objects.create(dataset=self.dataset, data='{}')
+
+        IndexedValue.objects.sync_batch([(st.id, '{"index1": "a", "index2": "b"}')], [index1, index2])
+        self.assertEqual(dict((value.index_id, value.value) for value in IndexedValue.objects.filter(thing=st)),
+                         {index1.id: 'a', index2.id: 'b'})
+
+        IndexedValue.objects.sync_batch([(st.id, '{"index1": "c"}')], [index1, index2])
+        self.assertEqual(dict((value.index_id, value.value) for value in IndexedValue.objects.filter(thing=st)),
+                         {index1.id: 'c'})
+
+    def test_bulk_sync_updates_changed_values_and_reports_progress(self):
+        index = DataIndex(attr_name='index', dataset=self.dataset)
+        index.save(reindex=False)
+
+        things = []
+        for value in ['a', 'b', 'c']:
+            st = SubmittedThing(dataset=self.dataset, data=json.dumps({'index': value}))
+            st.save(reindex=False)
+            things.append(st)
+        IndexedValue.objects.bulk_sync(self.dataset.things.all(), [index])
+
+        SubmittedThing.objects.filter(pk=things[0].pk).update(data='{"index": "z"}')
+        SubmittedThing.objects.filter(pk=things[1].pk).update(data='{}')
+
+        progress = mock.Mock()
+        IndexedValue.objects.bulk_sync(self.dataset.things.all(), [index], batch_size=2, progress=progress)
+
+        self.assertEqual(dict((value.thing_id, value.value) for value in IndexedValue.objects.all()),
+                         {things[0].pk: 'z', things[2].pk: 'c'})
+        self.assertEqual(progress.call_args_list, [mock.call(2, 3), mock.call(3, 3)])
+
+    def test_only_changed_attributes_are_reindexed_when_thing_is_saved(self):
+        DataIndex(dataset=self.dataset, attr_name='index1').save(reindex=True)
+        DataIndex(dataset=self.dataset, attr_name='index2').save(reindex=True)
+
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"index1": "value1", "index2": "value2", "freetext": "Unindexed"}'
+        st.save()
+        st = SubmittedThing.objects.get(pk=st.pk)
+
+        # Changing an unindexed attribute doesn't touch the indexed values
+        st.data = '{"index1": "value1", "index2": "value2", "freetext": "Changed"}'
+        with CaptureQueriesContext(connection) as queries:
+            st.save(silent=True)
+        self.assertFalse(any('indexedvalue' in query['sql'] for query in queries))
+
+        st.data = '{"index1": "value1", "freetext": "Changed"}'
+        st.save()
+        self.assertEqual(set(value.value for value in IndexedValue.objects.filter(thing=st)), set(['value1']))
+
+    def test_thing_is_indexed_on_indexes_added_after_it_was_loaded(self):
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"index1": "value1"}'
+        st.save()
+
+        # Index definitions are cached, but invalidated when they change
+        self.assertEqual(DataIndex.get_for_dataset(self.dataset.id), [])
+        index = DataIndex(attr_name='index1', dataset=self.dataset)
+        index.save(reindex=False)
+        self.assertEqual(DataIndex.get_for_dataset(self.dataset.id), [index])
+
+        st.data = '{"index1": "value2"}'
+        st.save()
+        self.assertEqual(IndexedValue.objects.get(thing=st).value, 'value2')
+
+    def test_index_is_rebuilt_in_the_background_by_default(self):
+        index = DataIndex(attr_name='index1', dataset=self.dataset)
+        with patch.object(DataIndex, 'schedule_reindex') as schedule_reindex, \
+             patch.object(DataIndex, 'index_things') as index_things:
+            index.save()
+        self.assertEqual(schedule_reindex.call_count, 1)
+        self.assertEqual(index_things.call_count, 0)
+
+    def test_index_is_building_until_rebuilt_in_the_background(self):
+        from ..tasks import reindex_dataset
+
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"index1": "value1"}'
+        st.save()
+
+        index = DataIndex(attr_name='index1', dataset=self.dataset)
+        with patch.object(DataIndex, 'schedule_reindex'):
+            index.save()
+        self.assertTrue(DataIndex.objects.get(pk=index.pk).is_building)
+        self.assertTrue(DataIndex.get_for_dataset(self.dataset.id)[0].is_building)
+
+        reindex_dataset(self.dataset.id, index_ids=[index.pk])
+        self.assertFalse(DataIndex.objects.get(pk=index.pk).is_building)
+        self.assertFalse(DataIndex.get_for_dataset(self.dataset.id)[0].is_building)
+        self.assertEqual(IndexedValue.objects.get(thing=st).value, 'value1')
+
+    def test_index_is_saved_if_reindexing_cannot_be_scheduled(self):
+        index = DataIndex(attr_name='index1', dataset=self.dataset)
+        with patch('sa_api_v2.models.data_indexes.transaction.on_commit', lambda func: func()), \
+             patch('sa_api_v2.tasks.reindex_dataset.apply_async', side_effect=Exception('No broker')):
+            index.save()
+        self.assertTrue(DataIndex.objects.get(pk=index.pk).is_building)
+
+    def test_typed_values_are_reindexed_when_index_type_changes(self):
+        st = SubmittedThing(dataset=self.dataset)
+        st.data = '{"done": "yes"}'
+        st.save()
+
+        index = DataIndex(attr_name='done', dataset=self.dataset)
+        index.save(reindex=True)
+        self.assertIsNone(IndexedValue.objects.get(thing=st).boolean_value)
+
+        index.attr_type = 'boolean'
+        index.save(reindex=True)
+        self.assertEqual(IndexedValue.objects.get(thing=st).boolean_value, True)
+
+
+class TestNearestPlaces (TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='aaron', password='123', email='abc@example.com')
+        self.dataset = DataSet.objects.create(slug='ds', owner=self.owner)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)')
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 1)')
+
+    def test_nearest_uses_geography_index(self):
+        from django.contrib.gis.geos import Point
+        places = Place.objects.nearest(Point(0.5, 0.5))[:10]
+        sql, params = places.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            # The tables are too small for the planner to choose the index on
+            # its own, so rule out the alternatives. Sorting is only ruled
+            # out if the ordering can come from the index at all.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        # The rows should come out of the index in order, without a sort.
+        self.assertIn('sa_api_place_geometry_geography_gist', plan)
+        self.assertNotIn('Sort', plan)
+
 
 class CloningTests (TestCase):
     def clear_objects(self):
@@ -8,7 +8,7 @@
 from django.test import TestCase
 from django.contrib.gis.measure import D
 # from nose.tools import istest
-from nose.tools import assert_equal, assert_false, assert_true, assert_raises
+from nose.tools import assert_equal, assert_almost_equal, assert_false, assert_true, assert_raises
 from .. import utils
 
 
@@ -55,6 +55,41 @@ class TestBuildRelativeURL (TestCase):
         assert_equal(url, 'https://google.com/')
 
 
+class TestTileBounds (TestCase):
+    def test_whole_world_tile(self):
+        west, south, east, north = utils.tile_bounds(0, 0, 0)
+        assert_equal((west, south, east, north), (
+            -utils.WEB_MERCATOR_EXTENT, -utils.WEB_MERCATOR_EXTENT,
+            utils.WEB_MERCATOR_EXTENT, utils.WEB_MERCATOR_EXTENT))
+
+    def test_tile_quadrant(self):
+        west, south, east, north = utils.tile_bounds(1, 1, 0)
+        assert_equal((west, south, east, north), (
+            0, 0, utils.WEB_MERCATOR_EXTENT, utils.WEB_MERCATOR_EXTENT))
+
+    def test_margin_extends_bounds(self):
+        west, south, east, north = utils.tile_bounds(1, 1, 0, margin=0.5)
+        half_tile = utils.WEB_MERCATOR_EXTENT / 2
+        assert_almost_equal(west, -half_tile, places=6)
+        assert_almost_equal(south, -half_tile, places=6)
+        assert_almost_equal(east, utils.WEB_MERCATOR_EXTENT + half_tile, places=6)
+        assert_almost_equal(north, utils.WEB_MERCATOR_EXTENT + half_tile, places=6)
+
+    def test_lnglat_bounds(self):
+        west, south, east, north = utils.tile_lnglat_bounds(1, 0, 1)
+        assert_equal((west, east), (-180, 0))
+        assert_equal(north, 0)
+        assert_true(-85.06 < south < -85.05)
+
+    def test_tile_ranges_covering(self):
+        assert_equal(utils.tile_ranges_covering(1, -10, -10, 10, 10), ((0, 1), (0, 1)))
+        assert_equal(utils.tiles_covering(1, -10, -10, 10, 10), [(0, 0), (0, 1), (1, 0), (1, 1)])
+
+        # The ranges are found without listing the tiles
+        assert_equal(utils.tile_ranges_covering(18, -80, 35, -70, 45),
+                     ((72817, 80099), (94299, 103834)))
+
+
 # class TestToWkt (object):
 
 #     @istest
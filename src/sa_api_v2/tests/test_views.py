@@ -3,12 +3,15 @@ from django.test.client import RequestFactory
 from django.core.urlresolvers import reverse
 from django.core.cache import cache as django_cache
 from django.core.files import File
+from django.db import connection
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.gis import geos
+from django.test.utils import CaptureQueriesContext, override_settings
 import base64
 import csv
 import json
 import mock
+import zlib
 from StringIO import StringIO
 from ..models import User, DataSet, Place, Submission, Attachment, Action, Group, DataIndex, GroupPermission
 from ..params import (
@@ -21,7 +24,8 @@ from ..apikey.auth import KEY_HEADER
 from ..cors.models import Origin
 from ..views import (PlaceInstanceView, PlaceListView, SubmissionInstanceView,
     SubmissionListView, DataSetSubmissionListView, DataSetInstanceView,
-    DataSetListView, AdminDataSetListView, AttachmentListView, ActionListView)
+    DataSetListView, AdminDataSetListView, AttachmentListView, ActionListView,
+    PlaceFacetView, PlaceTileView)
 
 
 class APITestMixin (object):
@@ -235,6 +239,37 @@ class TestPlaceInstanceView (APITestMixin, TestCase):
         self.assertEqual(len(comments_set), 3)
         self.assert_(not all([comment['visible'] for comment in comments_set]))
 
+    def test_GET_response_with_simplified_geometry(self):
+        self.place.geometry = 'LINESTRING(0 0, 1 0.00004, 2 0)'
+        self.place.save()
+
+        request = self.factory.get(self.path + '?simplify=0.001')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data['geometry'], {'type': 'LineString', 'coordinates': [[0, 0], [2, 0]]})
+
+        # A zoom level implies a tolerance and precision
+        request = self.factory.get(self.path + '?zoom=10')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data['geometry'], {'type': 'LineString', 'coordinates': [[0, 0], [2, 0]]})
+
+        # Without any parameters, the geometry is left as is
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(len(data['geometry']['coordinates']), 3)
+
+        request = self.factory.get(self.path + '?simplify=lots')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_response_with_attachment(self):
         request = self.factory.get(self.path)
         response = self.view(request, **self.request_kwargs)
@@ -258,6 +293,7 @@ class TestPlaceInstanceView (APITestMixin, TestCase):
         # Create a dummy view instance so that we can call get_cache_key
         temp_view = PlaceInstanceView()
         temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
 
         # Check that the response is cached
         cache_key = temp_view.get_cache_key(request)
@@ -540,6 +576,50 @@ class TestPlaceInstanceView (APITestMixin, TestCase):
             response = self.view(request, **self.request_kwargs)
             self.assertStatusCode(response, 200)
 
+    def test_GET_from_cache_serves_rendered_content(self):
+        path = reverse('place-detail', kwargs=self.request_kwargs)
+        request = self.factory.get(path + '?callback=cb')
+        request.META['HTTP_ORIGIN'] = 'http://first.example.com'
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        initial_content = response.rendered_content
+
+        request = self.factory.get(path + '?callback=cb')
+        request.META['HTTP_ORIGIN'] = 'http://second.example.com'
+
+        # The cached content should not need to be rendered again, but
+        # per-request headers should still be applied.
+        with mock.patch('sa_api_v2.renderers.GeoJSONRenderer.get_feature') as patched_get_feature:
+            response = self.view(request, **self.request_kwargs)
+            response.render()
+            self.assertEqual(patched_get_feature.call_count, 0)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response.content, initial_content)
+        self.assertTrue(response.content.startswith('cb('))
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'http://second.example.com')
+
+    def test_GET_from_compressed_cache(self):
+        path = reverse('place-detail', kwargs=self.request_kwargs)
+        with override_settings(API_CACHE_COMPRESS=True):
+            request = self.factory.get(path)
+            response = self.view(request, **self.request_kwargs)
+            initial_content = response.rendered_content
+
+            # Clients that accept gzip get the compressed content as-is
+            request = self.factory.get(path, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            response = self.view(request, **self.request_kwargs)
+            response.render()
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(zlib.decompress(response.content, 16 + zlib.MAX_WBITS), initial_content)
+
+            # Other clients get the uncompressed content
+            request = self.factory.get(path)
+            response = self.view(request, **self.request_kwargs)
+            response.render()
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response.content, initial_content)
+
     def test_GET_from_cache_with_api_key(self):
         # Modify the dataset permissions
         ds_perm = self.dataset.permissions.all()[0]
@@ -1084,6 +1164,23 @@ class TestPlaceListView (APITestMixin, TestCase):
         # Check that we have the right number of rows
         self.assertEqual(len(rows), 2)
 
+        # Check that the geometry is still WKT
+        self.assertTrue(rows[1][headers.index('geometry')].startswith('POINT'))
+
+    def test_GET_response_with_geometry_precision(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(-75.163789 39.952335)', data=json.dumps({'name': 'City Hall'}))
+
+        request = self.factory.get(self.path + '?precision=3&name=City%20Hall')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data['features'][0]['geometry'], {'type': 'Point', 'coordinates': [-75.164, 39.952]})
+
+        request = self.factory.get(self.path + '?precision=many')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_text_search_response(self):
         Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar', 'name': 1})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'foo': 'bar', 'name': 2})),
@@ -1127,6 +1224,84 @@ class TestPlaceListView (APITestMixin, TestCase):
             self.dataset.places.filter(visible=True, private=False).count()
         )
 
+    def test_GET_text_search_only_matches_public_values(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'qux'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'qux': 'bar'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'private-foo': 'qux'})),
+
+        request = self.factory.get(self.path + '?search=qux')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(len(data['features']), 1)
+        self.assertEqual(data['features'][0]['properties']['foo'], 'qux')
+
+    def test_GET_text_search_response_is_ordered_by_relevance(self):
+        described = Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'description': 'A community garden'}))
+        named = Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'name': 'Community Garden'}))
+        other = Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'notes': 'Near the garden'}))
+
+        request = self.factory.get(self.path + '?search=garden')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['id'] for feature in data['features']],
+                         [named.id, described.id, other.id])
+
+        # An explicit ordering takes precedence over relevance
+        request = self.factory.get(self.path + '?search=garden&order_by=-id')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['id'] for feature in data['features']],
+                         [other.id, named.id, described.id])
+
+    def test_GET_clustered_response(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0.2 0.4)', data=json.dumps({'foo': 'bar'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0.1 0.1)', data=json.dumps({'foo': 'baz'})),
+
+        request = self.factory.get(self.path + '?grid=1&bounds=-1,-1,1,1')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(len(data['features']), 1)
+        cluster = data['features'][0]
+        self.assertEqual(cluster['properties']['count'], 3)
+        self.assertEqual(cluster['properties']['bounds'], [0, 0, 0.2, 0.4])
+        self.assertEqual(cluster['geometry']['type'], 'Point')
+        self.assertAlmostEqual(cluster['geometry']['coordinates'][0], 0.1)
+        self.assertAlmostEqual(cluster['geometry']['coordinates'][1], 0.5 / 3)
+
+        # Clusters combine with attribute filters, and only include visible,
+        # public places.
+        request = self.factory.get(self.path + '?cluster=0&foo=bar')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([cluster['properties']['count'] for cluster in data['features']], [2])
+
+        request = self.factory.get(self.path + '?cluster=0')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(sum(cluster['properties']['count'] for cluster in data['features']),
+                         self.dataset.places.filter(visible=True, private=False).count())
+
+        request = self.factory.get(self.path + '?grid=0')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+        request = self.factory.get(self.path + '?cluster=far')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_filtered_response(self):
         Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar', 'name': 1})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'foo': 'bar', 'name': 2})),
@@ -1158,20 +1333,67 @@ class TestPlaceListView (APITestMixin, TestCase):
         self.assertStatusCode(response, 200)
         self.assertEqual(len(data['features']), 0)
 
+    def test_GET_filtered_by_non_string_data_values(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar', 'name': 1})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'foo': 'bar', 'name': 2})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'foo': 'baz', 'name': 3})),
+
+        # Data values are compared by their text
+        request = self.factory.get(self.path + '?name=1&name=3')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(sorted(feature['properties']['name'] for feature in data['features']), [1, 3])
+
+    def test_GET_filtered_by_non_scalar_field_names(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'data': 'x', 'name': 1})),
+
+        # Only values within the data blob are compared
+        request = self.factory.get(self.path + '?data=x')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['properties']['name'] for feature in data['features']], [1])
+
+        request = self.factory.get(self.path + '?geometry=x')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data['features'], [])
+
+    def test_GET_filtered_by_boolean_field(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'name': 1}))
+
+        request = self.factory.get(self.path + '?visible=true')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertIn(1, [feature['properties'].get('name') for feature in data['features']])
+
+        request = self.factory.get(self.path + '?visible=maybe')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_indexed_response(self):
         Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar', 'name': 1})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'foo': 'bar', 'name': 2})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'foo': 'baz', 'name': 3})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(3 0)', data=json.dumps({'name': 4})),
 
-        self.dataset.indexes.add(DataIndex(attr_name='foo'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='foo').save(reindex=True)
 
         from  sa_api_v2.models.core import GeoSubmittedThingQuerySet
         from django.core import cache
         with mock.patch.object(GeoSubmittedThingQuerySet, 'filter_by_index') as patched_filter:
             # We patch django's caching here because otherwise we attempt to save
-            # the filter mock to the cache, which requires pickleability.
-            with mock.patch.object(cache, 'cache'):
+            # the filter mock to the cache, which requires pickleability. The
+            # patched cache should behave as if it were empty.
+            with mock.patch.object(cache, 'cache') as patched_cache:
+                patched_cache.get.return_value = None
                 request = self.factory.get(self.path + '?foo=bar')
                 self.view(request, **self.request_kwargs)
                 self.assertEqual(patched_filter.call_count, 1)
@@ -1182,7 +1404,7 @@ class TestPlaceListView (APITestMixin, TestCase):
         Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'foo': 'baz', 'name': 3})),
         Place.objects.create(dataset=self.dataset, geometry='POINT(3 0)', data=json.dumps({'name': 4})),
 
-        self.dataset.indexes.add(DataIndex(attr_name='foo'), bulk=False)
+        DataIndex(dataset=self.dataset, attr_name='foo').save(reindex=True)
 
         from  sa_api_v2.models.core import GeoSubmittedThingQuerySet
         with mock.patch.object(GeoSubmittedThingQuerySet, 'filter_by_index') as patched_filter:
@@ -1190,6 +1412,63 @@ class TestPlaceListView (APITestMixin, TestCase):
             self.view(request, **self.request_kwargs)
             self.assertEqual(patched_filter.call_count, 0)
 
+    def test_GET_filtered_response_does_not_query_for_indexes(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'foo': 'bar', 'name': 1})),
+        DataIndex(dataset=self.dataset, attr_name='foo').save(reindex=True)
+
+        request = self.factory.get(self.path + '?foo=bar')
+        self.view(request, **self.request_kwargs)
+
+        request = self.factory.get(self.path + '?foo=baz&name=1')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertFalse(any('FROM "sa_api_v2_dataindex"' in query['sql'] for query in queries))
+
+    def test_GET_compared_and_ordered_by_typed_index(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'score': 10, 'name': 1})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'score': 9, 'name': 2})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'score': 100, 'name': 3})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(3 0)', data=json.dumps({'name': 4})),
+
+        DataIndex(dataset=self.dataset, attr_name='score', attr_type='number').save(reindex=True)
+
+        request = self.factory.get(self.path + '?score__gte=10&order_by=-score')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['properties']['name'] for feature in data['features']], [3, 1])
+
+        request = self.factory.get(self.path + '?score__gte=many')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+        request = self.factory.get(self.path + '?order_by=name')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+    def test_GET_response_while_index_is_building(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'score': 10, 'name': 1})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'score': 9, 'name': 2})),
+
+        # The index has no values yet
+        with mock.patch.object(DataIndex, 'schedule_reindex'):
+            DataIndex(dataset=self.dataset, attr_name='score', attr_type='number').save()
+
+        # Equality is still matched within the data blob
+        request = self.factory.get(self.path + '?score=10')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['properties']['name'] for feature in data['features']], [1])
+
+        # Ordering can't be done until the index is ready
+        request = self.factory.get(self.path + '?order_by=score')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+        self.assertIn('still being indexed', json.loads(response.rendered_content)['detail'])
+
     def test_GET_paginated_response(self):
         # Create a view with pagination configuration set, for consistency
         class OverridePlaceListView (PlaceListView):
@@ -1238,6 +1517,119 @@ class TestPlaceListView (APITestMixin, TestCase):
                          [3,2,4,1])
         self.assertIn('distance', data['features'][0]['properties'])
 
+    def test_GET_nearby_response_at_high_latitude(self):
+        # Degrees of longitude are much shorter than degrees of latitude up
+        # here, so the place to the east is nearer despite being more
+        # degrees away.
+        Place.objects.create(dataset=self.dataset, geometry='POINT(10 60)', data=json.dumps({'new_place': 'yes', 'name': 'East'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 67)', data=json.dumps({'new_place': 'yes', 'name': 'North'})),
+
+        request = self.factory.get(self.path + '?near=60,0&new_place=yes')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['properties']['name'] for feature in data['features']],
+                         ['East', 'North'])
+        distances = [float(feature['properties']['distance'].split()[0]) for feature in data['features']]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_GET_response_snapped_to_tiles(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(2.5 3.5)', data=json.dumps({'name': 'Inside'})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(3.5 3.5)', data=json.dumps({'name': 'Outside'})),
+        cache_buffer.flush()
+
+        request = self.factory.get(self.path + '?bounds=1,2,3,4&snap_to_tiles')
+        with CaptureQueriesContext(connection) as first_queries:
+            response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Check that only the places within the bounds are returned
+        self.assertStatusCode(response, 200)
+        self.assertEqual(set(feature['properties']['name'] for feature in data['features']),
+                         set(['K-Mart', 'Inside']))
+
+        # Check that nearby bounds reuse the places cached for the tiles
+        request = self.factory.get(self.path + '?bounds=1.1,2.1,3.1,4.1&snap_to_tiles')
+        with CaptureQueriesContext(connection) as second_queries:
+            response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(set(feature['properties']['name'] for feature in data['features']),
+                         set(['K-Mart', 'Inside']))
+        self.assertLess(len(second_queries), len(first_queries))
+
+        request = self.factory.get(self.path + '?bounds=1,2,3,4&snap_to_tiles&near=0,0')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+    def test_GET_response_snapped_to_tiles_with_too_many_places(self):
+        # Bounds as large as the world are snapped to the lowest zoom levels
+        request = self.factory.get(self.path + '?bounds=-180,-85,180,85&snap_to_tiles')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+
+        with mock.patch.object(PlaceListView, 'max_snap_places', 0):
+            request = self.factory.get(self.path + '?bounds=-170,-80,170,80&snap_to_tiles')
+            response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+    def test_GET_response_with_submission_set_summaries(self):
+        other_place = Place.objects.create(dataset=self.dataset, geometry='POINT(4 5)', data='{}')
+        Submission.objects.create(place_model=other_place, set_name='comments', dataset=self.dataset, data='{}')
+        Submission.objects.create(place_model=other_place, set_name='comments', dataset=self.dataset, data='{}', visible=False)
+        cache_buffer.flush()
+
+        request = self.factory.get(self.path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Check that the submission sets are summarized for each place
+        self.assertStatusCode(response, 200)
+        summaries = dict((feature['id'], feature['properties']['submission_sets'])
+                         for feature in data['features'])
+        self.assertEqual(summaries[self.place.id]['comments']['length'], 2)
+        self.assertEqual(summaries[self.place.id]['likes']['length'], 3)
+        self.assertEqual(summaries[other_place.id]['comments']['length'], 1)
+        self.assertNotIn('likes', summaries[other_place.id])
+        self.assertTrue(summaries[other_place.id]['comments']['url'].endswith(
+            '/places/%s/comments' % other_place.id))
+        self.assertFalse(hasattr(other_place, 'submission_set_name'))
+
+        # Check that the submissions and tags were each counted for the whole
+        # page in one query
+        submission_queries = [q for q in queries if 'FROM "sa_api_submission"' in q['sql']]
+        tag_queries = [q for q in queries if 'FROM "ms_api_place_tag"' in q['sql']]
+        self.assertEqual(len(submission_queries), 1)
+        self.assertEqual(len(tag_queries), 1)
+
+    def test_GET_nearby_response_with_limit(self):
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'new_place': 'yes', 'name': 1})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(10 0)', data=json.dumps({'new_place': 'yes', 'name': 2})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(20 0)', data=json.dumps({'new_place': 'yes', 'name': 3})),
+        Place.objects.create(dataset=self.dataset, geometry='POINT(30 0)', data=json.dumps({'new_place': 'yes', 'name': 4})),
+
+        request = self.factory.get(self.path + '?near=0,19&new_place=yes&limit=2')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        # Check that we have just the nearest places, and no page metadata
+        self.assertStatusCode(response, 200)
+        self.assertEqual([feature['properties']['name'] for feature in data['features']],
+                         [3,2])
+        self.assertIn('distance', data['features'][0]['properties'])
+        self.assertNotIn('metadata', data)
+
+        request = self.factory.get(self.path + '?limit=2')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+        request = self.factory.get(self.path + '?near=0,19&limit=0')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
     def test_GET_response_with_private_data(self):
         #
         # View should not return private data normally
@@ -1792,6 +2184,213 @@ class TestPlaceListView (APITestMixin, TestCase):
         # Check that the request was successful
         self.assertStatusCode(response, 201)
 
+    def test_GET_from_cache_with_equivalent_querystrings(self):
+        request = self.factory.get(self.path + '?include_submissions=true&format=json&_=1234')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        initial_content = response.rendered_content
+
+        # Parameter order, flag values, cache busters, and equivalent Accept
+        # headers should not matter.
+        request = self.factory.get(self.path + '?format=json&include_submissions', HTTP_ACCEPT='*/*')
+        with self.assertNumQueries(0):
+            response = self.view(request, **self.request_kwargs)
+            self.assertStatusCode(response, 200)
+        self.assertEqual(response.rendered_content, initial_content)
+
+        # ...but the parameters themselves should.
+        request = self.factory.get(self.path + '?format=json')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertNotEqual(response.rendered_content, initial_content)
+
+    def test_cache_querystring_depends_on_flag_values(self):
+        view = PlaceListView()
+
+        def get_cache_key(querystring):
+            request = self.factory.get(self.path + querystring)
+            return view.get_cache_querystring(request)
+
+        self.assertEqual(get_cache_key('?include_private_fields'),
+                         get_cache_key('?include_private_fields=true'))
+        self.assertNotEqual(get_cache_key('?include_private_fields'),
+                            get_cache_key('?include_private_fields=false'))
+        self.assertNotEqual(get_cache_key('?include_invisible=off'),
+                            get_cache_key('?include_invisible=on'))
+
+    def test_GET_records_cache_metrics(self):
+        from ..metrics import cache_metrics
+        cache_metrics.reset()
+
+        request = self.factory.get(self.path)
+        self.view(request, **self.request_kwargs)
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+
+        snapshot = cache_metrics.snapshot()
+        self.assertEqual(snapshot['counters']['misses']['PlaceListView'], 1)
+        self.assertEqual(snapshot['counters']['hits']['PlaceListView'], 1)
+        self.assertEqual(snapshot['counters']['stores']['PlaceListView'], 1)
+        self.assertEqual(snapshot['counters']['bytes_stored']['PlaceListView'], len(response.rendered_content))
+        self.assertEqual(snapshot['timings']['rebuild_seconds']['PlaceListView']['count'], 1)
+
+    def test_GET_with_matching_etag_is_not_modified(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        etag = response['ETag']
+
+        # An unchanged dataset should not need to be serialized again
+        request = self.factory.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(0):
+            response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 304)
+        self.assertEqual(response.rendered_content, '')
+        self.assertEqual(response['ETag'], etag)
+
+        # After anything in the dataset changes, the etag no longer matches
+        self.place.save()
+        cache_buffer.flush()
+
+        request = self.factory.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_GET_with_matching_etag_after_content_expires(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        etag = response['ETag']
+
+        # Pretend that the cached content has expired, but not its tag
+        temp_view = PlaceListView()
+        temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
+        cache_key = temp_view.get_cache_key(request)
+        django_cache.delete(cache_key)
+
+        request = self.factory.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        with mock.patch.object(PlaceListView, 'list') as patched_list:
+            response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(patched_list.called)
+
+        # If the tag has expired too, the rebuilt content is still checked
+        django_cache.delete(temp_view.get_etag_cache_key(cache_key))
+
+        request = self.factory.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 304)
+        self.assertEqual(response.content, '')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_GET_etag_does_not_match_other_content(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        etag = response['ETag']
+
+        # Pretend that the cached response was rendered from different data
+        # under the same cache key
+        temp_view = PlaceListView()
+        temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
+        cache_key = temp_view.get_cache_key(request)
+        content, status, headers, compressed = django_cache.get(cache_key)
+        other_content = content.replace('ATM', 'Bank')
+        headers = [(name, temp_view.get_content_etag(other_content) if name == 'ETag' else value)
+                   for name, value in headers]
+        django_cache.set(cache_key, (other_content, status, headers, compressed))
+
+        request = self.factory.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response.rendered_content, other_content)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_GET_with_if_modified_since(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        last_modified = response['Last-Modified']
+
+        request = self.factory.get(self.path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 304)
+
+        request = self.factory.get(self.path, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2015 00:00:00 GMT')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+
+    def test_GET_serves_stale_response_while_rebuilding(self):
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        initial_content = response.rendered_content
+
+        # Invalidate the response
+        self.place.data = json.dumps({'type': 'Bank'})
+        self.place.save()
+        cache_buffer.flush()
+
+        # Pretend another request is rebuilding the response
+        temp_view = PlaceListView()
+        temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
+        cache_key = temp_view.get_cache_key(request)
+        django_cache.add(cache_key + ':lock', True)
+
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response.rendered_content, initial_content)
+        self.assertFalse(response.has_header('ETag'))
+
+        # Once the rebuilt response is ready, it is served instead
+        django_cache.delete(cache_key + ':lock')
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertNotEqual(response.rendered_content, initial_content)
+
+    def test_GET_rebuilds_response_if_lock_is_not_released(self):
+        class NoStalePlaceListView (PlaceListView):
+            cache_stale_timeout = 0
+        view = NoStalePlaceListView.as_view()
+
+        request = self.factory.get(self.path)
+        temp_view = NoStalePlaceListView()
+        temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
+        cache_key = temp_view.get_cache_key(request)
+        django_cache.add(cache_key + ':lock', True)
+
+        with override_settings(API_CACHE_LOCK_WAIT=0):
+            response = view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        data = json.loads(response.rendered_content)
+        self.assertEqual(len(data['features']), 1)
+
+    def test_GET_uncacheable_response_does_not_wait_for_lock(self):
+        request = self.factory.get(self.path, HTTP_ACCEPT='text/html')
+        temp_view = PlaceListView()
+        temp_view.request = request
+        temp_view.kwargs = self.request_kwargs
+        cache_key = temp_view.get_cache_key(request)
+        django_cache.add(cache_key + ':lock', True)
+
+        # The browsable API is never cached, so there's nothing to wait for
+        with mock.patch.object(PlaceListView, 'wait_for_cached_data') as wait_for_cached_data:
+            response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 200)
+        self.assertEqual(wait_for_cached_data.call_count, 0)
+
+    def test_wait_for_cached_data_stops_when_lock_is_released(self):
+        view = PlaceListView()
+        with override_settings(API_CACHE_LOCK_WAIT=60), \
+             mock.patch('time.sleep') as sleep:
+            self.assertIsNone(view.wait_for_cached_data('some-key', 'some-key:lock'))
+        self.assertEqual(sleep.call_count, 1)
+
     def test_model_update_clears_GET_cache_for_multiple_specific_objects(self):
         places = []
         for _ in range(10):
@@ -1865,6 +2464,185 @@ class TestPlaceListView (APITestMixin, TestCase):
             view(request, **request_kwargs)
 
 
+class TestPlaceFacetView (APITestMixin, TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+        self.owner = User.objects.create_user(username='aaron', password='123', email='abc@example.com')
+        self.dataset = DataSet.objects.create(slug='ds', owner=self.owner)
+        DataIndex(dataset=self.dataset, attr_name='status').save(reindex=True)
+        DataIndex(dataset=self.dataset, attr_name='type').save(reindex=True)
+
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 0)', data=json.dumps({'status': 'open', 'type': 'ATM'}), reindex=True)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(1 0)', data=json.dumps({'status': 'open', 'type': 'bank'}), reindex=True)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(5 5)', data=json.dumps({'status': 'closed', 'type': 'ATM'}), reindex=True)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(2 0)', data=json.dumps({'status': 'open'}), reindex=True)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(3 0)', data=json.dumps({'status': 'open'}), visible=False, reindex=True)
+        Place.objects.create(dataset=self.dataset, geometry='POINT(4 0)', data=json.dumps({'status': 'open'}), private=True, reindex=True)
+
+        self.request_kwargs = {
+          'owner_username': self.owner.username,
+          'dataset_slug': self.dataset.slug
+        }
+
+        self.factory = RequestFactory()
+        self.path = reverse('place-facets', kwargs=self.request_kwargs)
+        self.view = PlaceFacetView.as_view()
+
+    def tearDown(self):
+        User.objects.all().delete()
+        DataSet.objects.all().delete()
+        Place.objects.all().delete()
+
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def test_GET_response(self):
+        request = self.factory.get(self.path + '?attrs=status,type')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data, {
+            'status': [{'value': 'open', 'count': 3}, {'value': 'closed', 'count': 1}],
+            'type': [{'value': 'ATM', 'count': 2}, {'value': 'bank', 'count': 1}],
+        })
+
+    def test_GET_filtered_response(self):
+        request = self.factory.get(self.path + '?attrs=status&type=ATM&bounds=-1,-1,2,2')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data, {'status': [{'value': 'open', 'count': 1}]})
+
+    def test_GET_searched_response(self):
+        request = self.factory.get(self.path + '?attrs=status&search=bank')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data, {'status': [{'value': 'open', 'count': 1}]})
+
+    def test_GET_response_for_building_index(self):
+        with mock.patch.object(DataIndex, 'schedule_reindex'):
+            DataIndex(dataset=self.dataset, attr_name='name').save()
+
+        request = self.factory.get(self.path + '?attrs=name')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+        self.assertIn('still being indexed', json.loads(response.rendered_content)['detail'])
+
+    def test_GET_response_with_private_places_as_owner(self):
+        request = self.factory.get(self.path + '?attrs=status&include_private_places&include_invisible')
+        request.META['HTTP_AUTHORIZATION'] = 'Basic ' + base64.b64encode(':'.join([self.owner.username, '123']))
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+
+        self.assertStatusCode(response, 200)
+        self.assertEqual(data, {'status': [{'value': 'open', 'count': 5}, {'value': 'closed', 'count': 1}]})
+
+    def test_GET_response_for_unindexed_attribute(self):
+        request = self.factory.get(self.path + '?attrs=name')
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+        request = self.factory.get(self.path)
+        response = self.view(request, **self.request_kwargs)
+        self.assertStatusCode(response, 400)
+
+    def test_GET_response_is_invalidated_by_changes(self):
+        request = self.factory.get(self.path + '?attrs=type')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+        self.assertEqual(data, {'type': [{'value': 'ATM', 'count': 2}, {'value': 'bank', 'count': 1}]})
+
+        Place.objects.create(dataset=self.dataset, geometry='POINT(0 1)', data=json.dumps({'type': 'bank'}), reindex=True)
+        cache_buffer.flush()
+
+        request = self.factory.get(self.path + '?attrs=type')
+        response = self.view(request, **self.request_kwargs)
+        data = json.loads(response.rendered_content)
+        self.assertEqual(data, {'type': [{'value': 'ATM', 'count': 2}, {'value': 'bank', 'count': 2}]})
+
+
+class TestPlaceTileView (APITestMixin, TestCase):
+    def setUp(self):
+        cache_buffer.reset()
+        django_cache.clear()
+
+        self.owner = User.objects.create_user(username='aaron', password='123', email='abc@example.com')
+        self.dataset = DataSet.objects.create(slug='ds', owner=self.owner)
+        self.place = Place.objects.create(dataset=self.dataset, geometry='POINT(-75.16 39.95)', data=json.dumps({'name': 'City Hall', 'private-notes': 'secret'}))
+
+        self.request_kwargs = {
+          'owner_username': self.owner.username,
+          'dataset_slug': self.dataset.slug
+        }
+
+        self.factory = RequestFactory()
+        self.view = PlaceTileView.as_view()
+
+    def tearDown(self):
+        User.objects.all().delete()
+        DataSet.objects.all().delete()
+        Place.objects.all().delete()
+
+        cache_buffer.reset()
+        django_cache.clear()
+
+    def get_tile(self, z, x, y, query=''):
+        kwargs = dict(self.request_kwargs, z=str(z), x=str(x), y=str(y))
+        request = self.factory.get(reverse('place-tiles', kwargs=kwargs) + query)
+        return self.view(request, **kwargs)
+
+    def test_GET_tile_with_places(self):
+        response = self.get_tile(10, 298, 387, '?attrs=name')
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        self.assertIn('City Hall', response.rendered_content)
+        self.assertNotIn('secret', response.rendered_content)
+
+    def test_GET_tile_with_repeated_attributes(self):
+        response = self.get_tile(10, 298, 387, '?attrs=name,name')
+        self.assertStatusCode(response, 200)
+        self.assertIn('City Hall', response.rendered_content)
+
+    def test_GET_tile_without_places(self):
+        response = self.get_tile(10, 0, 0)
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response.rendered_content, '')
+
+    def test_GET_tile_leaves_out_invisible_places(self):
+        self.place.visible = False
+        self.place.save()
+
+        response = self.get_tile(10, 298, 387, '?attrs=name')
+        self.assertStatusCode(response, 200)
+        self.assertEqual(response.rendered_content, '')
+
+    def test_GET_tile_with_private_attribute(self):
+        response = self.get_tile(10, 298, 387, '?attrs=private-notes')
+        self.assertStatusCode(response, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', json.loads(response.rendered_content))
+
+    def test_GET_tile_out_of_range(self):
+        response = self.get_tile(1, 2, 0)
+        self.assertStatusCode(response, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_GET_tile_without_vector_tile_support(self):
+        from sa_api_v2.models.core import GeoSubmittedThingQuerySet
+
+        with mock.patch.object(GeoSubmittedThingQuerySet, 'supports_vector_tiles', return_value=False):
+            response = self.get_tile(10, 298, 387, '?attrs=name')
+        self.assertStatusCode(response, 501)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('PostGIS 2.4', json.loads(response.rendered_content)['detail'])
+
+
 class TestSubmissionInstanceView (APITestMixin, TestCase):
     def setUp(self):
         self.owner = User.objects.create_user(username='aaron', password='123', email='abc@example.com')
@@ -57,6 +57,12 @@ urlpatterns = patterns('sa_api_v2',
     url(r'^(?P<owner_username>[^/]+)/datasets/(?P<dataset_slug>[^/]+)/places/(?P<place_id>\d+)$',
         views.PlaceInstanceView.as_view(),
         name='place-detail'),
+    url(r'^(?P<owner_username>[^/]+)/datasets/(?P<dataset_slug>[^/]+)/places/tiles/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt$',
+        views.PlaceTileView.as_view(),
+        name='place-tiles'),
+    url(r'^(?P<owner_username>[^/]+)/datasets/(?P<dataset_slug>[^/]+)/places/facets$',
+        views.PlaceFacetView.as_view(),
+        name='place-facets'),
     url(r'^(?P<owner_username>[^/]+)/datasets/(?P<dataset_slug>[^/]+)/places(?:/(?P<pk_list>(?:\d+,)+\d+))?$',
         views.PlaceListView.as_view(),
         name='place-list'),
@@ -134,6 +140,7 @@ urlpatterns = patterns('sa_api_v2',
 
     url(r'^utils/send-away', views.redirector, name='redirector'),
     url(r'^utils/session-key', views.SessionKeyView.as_view(), name='session-key'),
+    url(r'^utils/cache-metrics$', views.CacheMetricsView.as_view(), name='cache-metrics'),
     url(r'^utils/noop/?$', lambda request: HttpResponse(''), name='noop-route'),
 
 )
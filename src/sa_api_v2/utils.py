@@ -1,3 +1,4 @@
+import math
 import re
 import time
 from django.contrib.gis.geos import GEOSGeometry, Point
@@ -45,6 +46,80 @@ def to_geom(string):
             geom = Point(lng, lat)
     return geom
 
+# Half the width of the world in web mercator (EPSG:3857) meters
+WEB_MERCATOR_EXTENT = 20037508.342789244
+
+# The latitude of the northern edge of the web mercator projection
+MAX_WEB_MERCATOR_LATITUDE = 85.0511287798066
+
+def tile_to_lnglat(z, x, y):
+    """
+    Get the longitude and latitude of the north-west corner of the given
+    web map tile. The x and y may be fractional, for points within a tile.
+    """
+    n = 2.0 ** z
+    lng = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lng, lat
+
+def lnglat_to_tile(z, lng, lat):
+    """
+    Get the (fractional) x and y of the web map tile at zoom level z that
+    the given longitude and latitude fall on. Latitudes beyond the edges of
+    the web mercator projection are clamped to them.
+    """
+    n = 2.0 ** z
+    lat = max(-MAX_WEB_MERCATOR_LATITUDE, min(MAX_WEB_MERCATOR_LATITUDE, lat))
+    lat_radians = math.radians(lat)
+    x = (lng + 180.0) / 360.0 * n
+    y = (1 - math.log(math.tan(lat_radians) + 1 / math.cos(lat_radians)) / math.pi) / 2 * n
+    return x, y
+
+def tile_ranges_covering(z, west, south, east, north):
+    """
+    Get the ranges of the x and y of the web map tiles at zoom level z that
+    the given bounds overlap, as ((min_x, max_x), (min_y, max_y)), without
+    listing the tiles themselves.
+    """
+    n = 2 ** z
+    min_x, min_y = lnglat_to_tile(z, west, north)
+    max_x, max_y = lnglat_to_tile(z, east, south)
+    clamp = lambda value: max(0, min(n - 1, int(math.floor(value))))
+    return (clamp(min_x), clamp(max_x)), (clamp(min_y), clamp(max_y))
+
+def tiles_covering(z, west, south, east, north):
+    """
+    Get the (x, y) of each web map tile at zoom level z that the given
+    bounds overlap.
+    """
+    (min_x, max_x), (min_y, max_y) = tile_ranges_covering(z, west, south, east, north)
+    return [(x, y)
+            for x in range(min_x, max_x + 1)
+            for y in range(min_y, max_y + 1)]
+
+def tile_bounds(z, x, y, margin=0):
+    """
+    Get the bounds of the given web map tile as (west, south, east, north)
+    in web mercator (EPSG:3857) meters. The margin is a fraction of the
+    tile's width to extend the bounds by on every side.
+    """
+    tile_size = 2 * WEB_MERCATOR_EXTENT / 2 ** z
+    west = -WEB_MERCATOR_EXTENT + (x - margin) * tile_size
+    east = -WEB_MERCATOR_EXTENT + (x + 1 + margin) * tile_size
+    north = WEB_MERCATOR_EXTENT - (y - margin) * tile_size
+    south = WEB_MERCATOR_EXTENT - (y + 1 + margin) * tile_size
+    return (west, south, east, north)
+
+def tile_lnglat_bounds(z, x, y, margin=0):
+    """
+    Get the bounds of the given web map tile as (west, south, east, north)
+    in longitude and latitude. The margin is a fraction of the tile's width
+    to extend the bounds by on every side.
+    """
+    west, north = tile_to_lnglat(z, x - margin, y - margin)
+    east, south = tile_to_lnglat(z, x + 1 + margin, y + 1 + margin)
+    return (west, south, east, north)
+
 def memo(f):
     """
     A memoization decorator. Borrowed and modified from
@@ -1,14 +1,19 @@
 from django.conf import settings
 from django.contrib.auth import views as auth_views
+from django.contrib.gis.db.models import GeometryField
 from django.contrib.gis.geos import GEOSGeometry, Point, Polygon
 from django.core import cache as django_cache
+from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db.models import Count, Q
+from django.db.models import BooleanField, Count, NullBooleanField, Q
 from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag, unquote_etag
+from django.utils.text import compress_string
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import (views, permissions, mixins, authentication,
                             generics, exceptions, status)
@@ -36,6 +41,7 @@ from .. import tasks
 from .. import utils
 from .content_negotiation import ShareaboutsContentNegotiation
 from ..cache import cache_buffer
+from ..metrics import cache_metrics
 from ..params import (
     INCLUDE_INVISIBLE_PARAM,
     INCLUDE_PRIVATE_FIELDS_PARAM,
@@ -45,19 +51,33 @@ from ..params import (
     DISTANCE_PARAM,
     BBOX_PARAM,
     TEXTSEARCH_PARAM,
+    ORDER_BY_PARAM,
+    ATTRS_PARAM,
+    GRID_PARAM,
+    CLUSTER_PARAM,
+    PRECISION_PARAM,
+    SIMPLIFY_PARAM,
+    ZOOM_PARAM,
+    LIMIT_PARAM,
+    SNAP_TO_TILES_PARAM,
     FORMAT_PARAM,
     PAGE_PARAM,
     PAGE_SIZE_PARAM,
     CALLBACK_PARAM,
-    INCLUDE_TAGS_PARAM
+    INCLUDE_TAGS_PARAM,
+    FLAG_PARAMS,
+    FLAG_OFF_VALUES
 )
 from functools import wraps
 from itertools import groupby, count
 from collections import defaultdict
 from urllib import urlencode
+import hashlib
+import math
 import re
 import requests
-import ujson as json
+import time
+import zlib
 import logging
 import bleach
 from .authentication import ShareaboutsSessionAuth
@@ -262,38 +282,141 @@ class FilteredResourceMixin (object):
 
             TEXTSEARCH_PARAM,
             BBOX_PARAM,
+            ORDER_BY_PARAM,
+            ATTRS_PARAM,
+            GRID_PARAM,
+            CLUSTER_PARAM,
+            PRECISION_PARAM,
+            SIMPLIFY_PARAM,
+            ZOOM_PARAM,
+            LIMIT_PARAM,
+            SNAP_TO_TILES_PARAM,
             CALLBACK_PARAM(self)
         ])
 
-        # Filter by full-text search
-        textsearch_filter = self.request.GET.get(TEXTSEARCH_PARAM, None)
+        # Filter by full-text search, most relevant results first
+        textsearch_filter = self.request.GET.get(TEXTSEARCH_PARAM, '').strip()
         if textsearch_filter:
-            queryset = queryset.filter(data__icontains=textsearch_filter)
+            if hasattr(queryset, 'search'):
+                queryset = queryset.search(textsearch_filter)
+            else:
+                queryset = queryset.none()
 
         # Then filter by attributes
         for key, values in self.request.GET.iterlists():
             if key not in special_filters:
-                # Filter quickly for indexed values
-                if self.get_dataset().indexes.filter(attr_name=key).exists():
-                    queryset = queryset.filter_by_index(key, *values)
+                attr_name, lookup = self.split_filter_key(key)
+                index = self.get_dataset_index(attr_name)
 
-                # Filter slowly for other values
+                # Filter quickly for indexed values
+                if index is not None:
+                    try:
+                        queryset = queryset.filter_by_index(
+                            attr_name, *values, attr_type=index.attr_type, lookup=lookup)
+                    except ValueError as e:
+                        raise QueryError(detail='Invalid value for "%s": %s' % (key, e))
+
+                # Filter on model fields directly
+                elif key in self.get_filterable_field_names(queryset):
+                    field = queryset.model._meta.get_field(key)
+                    try:
+                        values = [self.to_field_value(field, value) for value in values]
+                    except (ValidationError, ValueError, TypeError):
+                        raise QueryError(detail='Invalid value for "%s": %r' % (key, values))
+                    queryset = queryset.filter(**{key + '__in': values})
+
+                # Filter other values within the data blob in the database
+                elif hasattr(queryset, 'filter_by_data'):
+                    queryset = queryset.filter_by_data(key, *values)
+
+                # Nothing else has the attribute
                 else:
-                    excluded = []
-                    for obj in queryset:
-                        if hasattr(obj, key):
-                            if getattr(obj, key) not in values:
-                                queryset = queryset.exclude(pk=obj.pk)
-                        else:
-                            # Is it in the data blob?
-                            data = json.loads(obj.data)
-                            if key not in data or data[key] not in values:
-                                excluded.append(obj.pk)
-                    queryset = queryset.exclude(pk__in=excluded)
+                    queryset = queryset.none()
 
+        # Finally, order by an attribute if requested
+        order_by = self.request.GET.get(ORDER_BY_PARAM, None)
+        if order_by:
+            queryset = self.order_queryset(queryset, order_by)
 
         return queryset
 
+    def split_filter_key(self, key):
+        """
+        Split a filter key like "budget__gt" into an attribute name and a
+        comparison. Only indexed attributes can be compared; for any other
+        key, the whole key is the attribute name.
+        """
+        if '__' in key:
+            attr_name, lookup = key.rsplit('__', 1)
+            if (lookup in models.FilterByIndexMixin.INDEX_LOOKUPS and
+                self.get_dataset_index(attr_name) is not None):
+                return attr_name, lookup
+        return key, 'exact'
+
+    def get_dataset_index(self, attr_name):
+        """
+        Get the dataset's index on the given attribute, or None if the
+        attribute is not indexed. An index whose values are still being
+        built doesn't count, so the attribute is filtered within the data
+        blob until the index is ready.
+        """
+        index = self.get_dataset_indexes().get(attr_name)
+        if index is None or index.is_building:
+            return None
+        return index
+
+    def get_dataset_indexes(self):
+        """
+        Get the dataset's indexes, by attribute name. The dataset's index
+        definitions are cached, so planning the filters doesn't take any
+        queries.
+        """
+        if not hasattr(self, '_dataset_indexes'):
+            dataset = self.get_dataset()
+            self._dataset_indexes = dict(
+                (index.attr_name, index)
+                for index in models.DataIndex.get_for_dataset(dataset.id))
+        return self._dataset_indexes
+
+    def order_queryset(self, queryset, order_by):
+        """
+        Order the queryset by an indexed attribute or a model field. Prefix
+        the name with "-" to order descending.
+        """
+        descending = order_by.startswith('-')
+        attr_name = order_by.lstrip('-')
+
+        index = self.get_dataset_indexes().get(attr_name)
+        if index is not None:
+            if index.is_building:
+                raise QueryError(detail='Invalid parameter for "%s": %r is still being indexed; try again in a few moments' % (ORDER_BY_PARAM, attr_name))
+            return queryset.order_by_index(attr_name, attr_type=index.attr_type, descending=descending)
+
+        if attr_name in self.get_filterable_field_names(queryset):
+            return queryset.order_by(order_by, 'pk')
+
+        raise QueryError(detail='Invalid parameter for "%s": %r is not an indexed attribute' % (ORDER_BY_PARAM, attr_name))
+
+    def get_filterable_field_names(self, queryset):
+        """
+        Get the names of the model fields that can be filtered on directly.
+        Related objects, data blobs, and geometries are not filterable by
+        their string values.
+        """
+        return set(field.name for field in queryset.model._meta.concrete_fields
+                   if not field.is_relation and
+                   not isinstance(field, (models.JSONBTextField, GeometryField)))
+
+    def to_field_value(self, field, value):
+        """
+        Convert a query value to the type of the given model field. Boolean
+        fields accept the same words as boolean indexes (e.g., "true" or
+        "no"), not just the ones that Django does.
+        """
+        if isinstance(field, (BooleanField, NullBooleanField)):
+            return models.to_boolean_value(value)
+        return field.to_python(value)
+
 
 class LocatedResourceMixin (object):
     """
@@ -306,7 +429,7 @@ class LocatedResourceMixin (object):
                 reference = utils.to_geom(self.request.GET[NEAR_PARAM])
             except ValueError:
                 raise QueryError(detail='Invalid parameter for "%s": %r' % (NEAR_PARAM, self.request.GET[NEAR_PARAM]))
-            queryset = queryset.distance(reference).order_by('distance')
+            queryset = queryset.nearest(reference)
 
         if DISTANCE_PARAM in self.request.GET:
             if NEAR_PARAM not in self.request.GET:
@@ -320,16 +443,107 @@ class LocatedResourceMixin (object):
             # use the `reference` geometry here.
             queryset = queryset.filter(geometry__distance_lt=(reference, max_dist))
 
-        if BBOX_PARAM in self.request.GET:
-            bounds = self.request.GET[BBOX_PARAM].split(',')
-            if len(bounds) != 4:
-                raise QueryError(detail='Invalid parameter for "%s": %r' % (BBOX_PARAM, self.request.GET[BBOX_PARAM]))
-
+        bounds = self.get_bounds()
+        if bounds is not None:
             boundingbox = Polygon.from_bbox(bounds)
             queryset = queryset.filter(geometry__within=boundingbox)
 
         return queryset
 
+    def get_bounds(self):
+        """
+        Get the bounds to restrict the queryset to, as (west, south, east,
+        north), or None if no bounds were requested.
+        """
+        if BBOX_PARAM not in self.request.GET:
+            return None
+
+        try:
+            bounds = [float(bound) for bound in self.request.GET[BBOX_PARAM].split(',')]
+        except ValueError:
+            bounds = []
+        if len(bounds) != 4:
+            raise QueryError(detail='Invalid parameter for "%s": %r' % (BBOX_PARAM, self.request.GET[BBOX_PARAM]))
+
+        x1, y1, x2, y2 = bounds
+        return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+
+class EncodedGeometryMixin (object):
+    """
+    A view mixin that has the database encode the geometries of places for
+    GeoJSON responses, simplified and rounded as requested.
+    """
+    # The size of a map tile in pixels, for converting zoom levels to
+    # distances.
+    tile_size = 256
+
+    def encode_geometries(self, queryset):
+        # The encoded geometries would be stale after an update, so only
+        # encode them for reading.
+        if self.request.method.upper() not in ('GET', 'HEAD'):
+            return queryset
+
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        if not isinstance(renderer, renderers.GeoJSONRenderer):
+            return queryset
+
+        zoom = self.get_geometry_zoom()
+        return queryset.with_geojson(
+            precision=self.get_geometry_precision(zoom),
+            tolerance=self.get_geometry_tolerance(zoom))
+
+    def get_geometry_zoom(self):
+        if ZOOM_PARAM not in self.request.GET:
+            return None
+
+        try:
+            zoom = int(self.request.GET[ZOOM_PARAM])
+        except ValueError:
+            zoom = None
+        if zoom is None or not (0 <= zoom <= 30):
+            raise QueryError(detail='Invalid parameter for "%s": %r' % (ZOOM_PARAM, self.request.GET[ZOOM_PARAM]))
+        return zoom
+
+    def get_geometry_precision(self, zoom=None):
+        """
+        Get the number of decimal places to round coordinates to, or None to
+        leave them as they are. For a map at a given zoom level, coordinates
+        are only as precise as a pixel.
+        """
+        if PRECISION_PARAM not in self.request.GET:
+            if zoom is None:
+                return None
+            pixels_per_degree = self.tile_size * 2 ** zoom / 360.0
+            return max(0, int(math.ceil(math.log10(pixels_per_degree))))
+
+        try:
+            precision = int(self.request.GET[PRECISION_PARAM])
+        except ValueError:
+            precision = None
+        if precision is None or not (0 <= precision <= 15):
+            raise QueryError(detail='Invalid parameter for "%s": %r' % (PRECISION_PARAM, self.request.GET[PRECISION_PARAM]))
+        return precision
+
+    def get_geometry_tolerance(self, zoom=None):
+        """
+        Get the tolerance (in degrees) to simplify lines and polygons to, or
+        None to leave them as they are. For a map at a given zoom level,
+        details smaller than a pixel are simplified away.
+        """
+        if SIMPLIFY_PARAM not in self.request.GET:
+            if zoom is None:
+                return None
+            return 360.0 / (self.tile_size * 2 ** zoom)
+
+        try:
+            tolerance = float(self.request.GET[SIMPLIFY_PARAM])
+        except ValueError:
+            tolerance = None
+        if tolerance is None or not (0 <= tolerance <= 360):
+            raise QueryError(detail='Invalid parameter for "%s": %r' % (SIMPLIFY_PARAM, self.request.GET[SIMPLIFY_PARAM]))
+        return tolerance
+
 
 class OwnedResourceMixin (ClientAuthenticationMixin, CorsEnabledMixin):
     """
@@ -418,15 +632,15 @@ class OwnedResourceMixin (ClientAuthenticationMixin, CorsEnabledMixin):
                 owner_username = self.kwargs[self.owner_username_kwarg]
                 dataset_slug = self.kwargs[self.dataset_slug_kwarg]
 
-                self._dataset = (
-                    self._get_dataset_from_cache(owner_username, dataset_slug) or
-                    self._get_dataset_from_db(owner_username, dataset_slug)
-                )
+                self._dataset = self._get_dataset_from_cache(owner_username, dataset_slug)
+
+                # Only write the dataset back to the cache if it wasn't there
+                if self._dataset is None:
+                    self._dataset = self._get_dataset_from_db(owner_username, dataset_slug)
+                    self._save_dataset_in_cache(self._dataset, owner_username, dataset_slug)
 
                 # Remember the owner in case we don't already
                 self._owner = self._dataset.owner
-
-                self._save_dataset_in_cache(self._dataset, owner_username, dataset_slug)
             else:
                 self._dataset = None
         return self._dataset
@@ -468,7 +682,37 @@ class ProtectedOwnedResourceMixin (OwnedResourceMixin):
     permission_classes = (IsLoggedInOwnerOrPublicDataOnly,) + OwnedResourceMixin.permission_classes
 
 
+class CachedResponse (Response):
+    """
+    A response whose content has already been rendered (e.g., a response that
+    was loaded from the cache). The response still goes through content
+    negotiation and the view's finalization (so CORS headers and the like are
+    still applied), but the content is not rendered again.
+
+    """
+    def __init__(self, content, status=None, headers=None, stale=False):
+        super(CachedResponse, self).__init__(None, status=status, headers=headers)
+        self.cached_content = content
+        self.stale = stale
+
+    @property
+    def rendered_content(self):
+        return self.cached_content
+
+
 class CachedResourceMixin (object):
+    # Matches Accept-Encoding values that allow gzipped content. This is the
+    # same check that Django's GZipMiddleware uses.
+    accepts_gzip_re = re.compile(r'\bgzip\b')
+
+    # Responses rendered by these renderers are never cached.
+    uncacheable_renderer_classes = (BrowsableAPIRenderer,)
+
+    # How many seconds past its expiry a cached response may still be served
+    # while another worker rebuilds it. If None, API_CACHE_STALE_TIMEOUT is
+    # used; if 0, requests wait for the rebuilt response instead.
+    cache_stale_timeout = None
+
     @property
     def cache_prefix(self):
         return self.request.path
@@ -487,92 +731,475 @@ class CachedResourceMixin (object):
             return super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
 
         self.request = request
+        key = self.get_cache_key(request, *args, **kwargs)
+        self.record_cache_request(request, *args, **kwargs)
+
+        # Check whether the client already has the cached representation.
+        # We still go through the regular dispatch so that the request is
+        # authenticated and checked for permission.
+        response_data = self.get_cached_data(key)
+        etag = self.get_cache_etag(key, response_data)
+        last_modified = self.get_cache_last_modified()
+
+        if self.is_not_modified(request, etag, last_modified):
+            cache_metrics.incr('not_modified', self.get_cache_metrics_label())
+            not_modified_response = CachedResponse('', status=status.HTTP_304_NOT_MODIFIED)
+            not_modified_response['ETag'] = etag
+            response = self.dispatch_with_response(not_modified_response, request, *args, **kwargs)
+        else:
+            response = self.dispatch_from_cache(key, response_data, request, *args, **kwargs)
+
+            # If the entity tag wasn't known until the response was rebuilt,
+            # the client may still have the content already; if so, at least
+            # don't send it again.
+            if self.is_response_not_modified(request, response):
+                cache_metrics.incr('not_modified', self.get_cache_metrics_label())
+                self.strip_response_content(response)
+
+        # Save all the buffered data to the cache
+        cache_buffer.flush()
 
+        # Disable client-side caching. Cause IE wrongly assumes that it should
+        # cache. Clients may still revalidate what they have using the ETag
+        # or Last-Modified headers.
+        response['Cache-Control'] = 'no-cache'
+        return self.set_validator_headers(response, last_modified)
+
+    def get_cached_data(self, key):
         # Check whether the response data is in the cache.
-        key = self.get_cache_key(request, *args, **kwargs)
         response_data = django_cache.cache.get(key) or None
 
         # Also check whether the request cache key is managed in the cache.
         # This is important, because if it's not managed, then we'll never
         # know when to invalidate it. If it's not managed we should just
         # assume that it's invalid.
-        metakey = self.get_cache_metakey()
-        keyset = django_cache.cache.get(metakey) or set()
+        if (response_data is not None) and self.is_cache_key_managed(key):
+            return response_data
+        return None
 
-        if (response_data is not None) and (key in keyset):
+    def dispatch_from_cache(self, key, response_data, request, *args, **kwargs):
+        if response_data is not None:
+            cache_metrics.incr('hits', self.get_cache_metrics_label())
             cached_response = self.respond_from_cache(response_data)
-            handler_name = request.method.lower()
+            return self.dispatch_with_response(cached_response, request, *args, **kwargs)
+
+        # When a popular response is invalidated, many requests for it may
+        # miss at once. Only let one of them rebuild the response; the others
+        # get the previous version of the response if it's recent enough, or
+        # wait for the rebuilt one. We can only tell when a rebuilt response
+        # is ready if the key is managed by a dataset generation, and there's
+        # only anything to wait for if the response will be cached.
+        lock_key = key + ':lock'
+        coalesce = (self.get_cache_generation() is not None and
+                    self.is_request_cacheable(request, *args, **kwargs))
+        has_lock = coalesce and django_cache.cache.add(lock_key, True, self.get_cache_lock_timeout())
+
+        if coalesce and not has_lock:
+            stale_data = django_cache.cache.get(self.get_stale_cache_key(key))
+            if stale_data is not None and self.get_cache_stale_timeout():
+                cache_metrics.incr('stale_hits', self.get_cache_metrics_label())
+                cached_response = self.respond_from_cache(stale_data, stale=True)
+                return self.dispatch_with_response(cached_response, request, *args, **kwargs)
+
+            response_data = self.wait_for_cached_data(key, lock_key)
+            if response_data is not None:
+                cache_metrics.incr('coalesced_hits', self.get_cache_metrics_label())
+                cached_response = self.respond_from_cache(response_data)
+                return self.dispatch_with_response(cached_response, request, *args, **kwargs)
+
+        cache_metrics.incr('misses', self.get_cache_metrics_label())
+        start_time = time.time()
 
-            def cached_handler(*args, **kwargs):
-                return cached_response
-
-            # Patch the HTTP method
-            with patch.object(self, handler_name, new=cached_handler):
-                response = super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
-        else:
+        try:
             response = super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
 
-            # Only cache on OK resposne
-            if response.status_code == 200:
+            # Only cache on OK resposne, and only for renderers whose output
+            # is the same for every request with the same cache key.
+            if (request.method.upper() == 'GET' and response.status_code == 200 and
+                    self.is_response_cacheable(response)):
                 self.cache_response(key, response)
+                cache_metrics.observe('rebuild_seconds', self.get_cache_metrics_label(), time.time() - start_time)
+        finally:
+            if has_lock:
+                django_cache.cache.delete(lock_key)
 
-        # Save all the buffered data to the cache
-        cache_buffer.flush()
-
-        # Disable client-side caching. Cause IE wrongly assumes that it should
-        # cache.
-        response['Cache-Control'] = 'no-cache'
         return response
 
+    def wait_for_cached_data(self, key, lock_key):
+        """
+        Wait for the worker holding the lock at lock_key to cache the response
+        at the given key. Return None if it doesn't show up within
+        API_CACHE_LOCK_WAIT seconds, or if the lock is released without it
+        (e.g., because the response was an error).
+        """
+        deadline = time.time() + getattr(settings, 'API_CACHE_LOCK_WAIT', 0.5)
+        while time.time() < deadline:
+            time.sleep(0.05)
+            values = django_cache.cache.get_many([key, lock_key])
+            if values.get(key) is not None:
+                return values[key]
+            if lock_key not in values:
+                return None
+        return None
+
+    def get_cache_metrics_label(self):
+        return self.__class__.__name__
+
+    def record_cache_request(self, request, *args, **kwargs):
+        """
+        Count anonymous requests for responses in a dataset, so that the most
+        popular ones can be warmed when the dataset changes. Responses for
+        authenticated users vary by user, so they are not warmed.
+        """
+        from ..cache import DataSetCache
+        if not DataSetCache.is_warming_enabled():
+            return
+        if request.method.upper() != 'GET' or self.get_cache_generation() is None:
+            return
+        if hasattr(request, 'user') and request.user.is_authenticated():
+            return
+        if getattr(request, 'is_cache_warming', False):
+            return
+
+        ds_cache = DataSetCache()
+
+        request_info = {
+            'path': request.path,
+            'path_info': request.path_info,
+            'query': self.get_cache_querystring(request),
+            'accept': self.get_cache_contenttype(request, *args, **kwargs),
+            'host': request.get_host(),
+            'secure': request.is_secure(),
+        }
+        ds_cache.record_request(request_info,
+            owner_username=self.kwargs['owner_username'],
+            dataset_slug=self.kwargs['dataset_slug'])
+
+    def get_cache_lock_timeout(self):
+        # The lock should outlast any reasonable rebuild, but expire in case
+        # the worker holding it dies.
+        return getattr(settings, 'API_CACHE_LOCK_TIMEOUT', 30)
+
+    def get_cache_stale_timeout(self):
+        if self.cache_stale_timeout is not None:
+            return self.cache_stale_timeout
+        return getattr(settings, 'API_CACHE_STALE_TIMEOUT', 10)
+
+    def get_stale_cache_key(self, key):
+        # The last part of the cache key is the dataset generation. The stale
+        # copy of a response is kept across generations.
+        return 'stale:' + key.rsplit(':', 1)[0]
+
+    def dispatch_with_response(self, response, request, *args, **kwargs):
+        """
+        Dispatch the request as usual, but respond with the given response
+        instead of calling the view's handler.
+        """
+        handler_name = request.method.lower()
+
+        def patched_handler(*args, **kwargs):
+            return response
+
+        # Patch the HTTP method
+        with patch.object(self, handler_name, new=patched_handler):
+            return super(CachedResourceMixin, self).dispatch(request, *args, **kwargs)
+
     def get_cache_key(self, request, *args, **kwargs):
-        querystring = request.META.get('QUERY_STRING', '')
-        contenttype = request.META.get('HTTP_ACCEPT', '')
+        querystring = self.get_cache_querystring(request)
+        contenttype = self.get_cache_contenttype(request, *args, **kwargs)
+        groups = self.get_cache_groups(request)
+
+        generation = self.get_cache_generation()
+        generation = '' if generation is None else str(generation)
+
+        return ':'.join([self.cache_prefix, contenttype, querystring, groups, generation])
 
+    def get_cache_groups(self, request):
+        """
+        Get the name of the set of users whose responses may be shared, i.e.
+        the owners of the dataset or the members of a particular combination
+        of groups in the dataset.
+        """
         if not hasattr(request, 'user') or not request.user.is_authenticated():
-            groups = ''
-        else:
-            dataset = None
-            if hasattr(self, 'get_dataset'):
-                dataset = self.get_dataset()
+            return ''
 
-            if dataset:
-                if request.user.id == dataset.owner_id:
-                    groups = '__owners__'
-                else:
-                    group_set = []
-                    for group in request.user._groups.all():
-                        if group.dataset_id == dataset.id:
-                            group_set.append(group.name)
-                    groups = ','.join(group_set)
+        dataset = None
+        if hasattr(self, 'get_dataset'):
+            dataset = self.get_dataset()
+
+        if not dataset:
+            return ''
+
+        if request.user.id == dataset.owner_id:
+            return '__owners__'
+
+        group_set = []
+        for group in request.user._groups.all():
+            if group.dataset_id == dataset.id:
+                group_set.append(group.name)
+        return ','.join(group_set)
+
+    def get_cache_querystring(self, request, exclude=()):
+        """
+        Build a canonical version of the request's querystring, so that
+        equivalent querystrings share a cache key. Parameters are sorted by
+        name, and flag parameters are reduced to whether they're on or off.
+        Any parameters named in exclude are left out.
+        """
+        params = []
+        for name, values in sorted(request.GET.lists()):
+            # TODO: Eliminate the jQuery cache busting parameter for now. Get
+            # rid of this after the old API has been deprecated.
+            if name == '_' and all(value.isdigit() for value in values):
+                continue
+
+            if name in exclude:
+                continue
+
+            if name in FLAG_PARAMS:
+                # Some views only check whether a flag is present, while the
+                # serializers also check its (last) value, so keep both.
+                is_on = values[-1].lower() not in FLAG_OFF_VALUES
+                params.append((name, u'on' if is_on else u'off'))
             else:
-                groups = ''
+                params.extend((name, value) for value in values)
+
+        return urlencode([(name.encode('utf-8'), value.encode('utf-8')) for name, value in params])
+
+    def get_cache_renderer(self, request, *args, **kwargs):
+        """
+        Get the renderer and media type that the response will be rendered
+        with, or (None, None) if the request is not acceptable.
+        """
+        try:
+            return self.get_content_negotiator().select_renderer(
+                Request(request), self.get_renderers(), self.get_format_suffix(**kwargs))
+        except exceptions.NotAcceptable:
+            return None, None
+
+    def get_cache_contenttype(self, request, *args, **kwargs):
+        """
+        Get the media type that the response will be rendered as, so that
+        equivalent Accept headers share a cache key.
+        """
+        renderer, media_type = self.get_cache_renderer(request, *args, **kwargs)
+        if renderer is None:
+            # Let the view respond to this as usual.
+            return request.META.get('HTTP_ACCEPT', '')
+        return media_type
+
+    def is_request_cacheable(self, request, *args, **kwargs):
+        """
+        Check whether the response to the request will be cached, as long as
+        it's OK (see is_response_cacheable).
+        """
+        if request.method.upper() != 'GET':
+            return False
+
+        renderer, media_type = self.get_cache_renderer(request, *args, **kwargs)
+        return renderer is not None and not isinstance(renderer, self.uncacheable_renderer_classes)
 
-        # TODO: Eliminate the jQuery cache busting parameter for now. Get
-        # rid of this after the old API has been deprecated.
-        cache_buster_pattern = re.compile(r'&?_=\d+')
-        querystring = re.sub(cache_buster_pattern, '', querystring)
+    def get_cache_generation(self):
+        """
+        Get the generation number of the dataset that the requested resource
+        belongs to, or None if the resource does not belong to a dataset.
+        Responses within a dataset are keyed on the generation, so changing
+        anything in the dataset invalidates all of them at once.
+        """
+        kwargs = getattr(self, 'kwargs', None) or {}
+        if 'owner_username' not in kwargs or 'dataset_slug' not in kwargs:
+            return None
+
+        from ..cache import DataSetCache
+        ds_cache = DataSetCache()
+
+        return ds_cache.get_generation(
+            owner_username=kwargs['owner_username'],
+            dataset_slug=kwargs['dataset_slug'])
+
+    def is_cache_key_managed(self, key):
+        # Keys within a dataset are managed by the dataset generation. Any
+        # other keys must be registered in the view's meta-key.
+        if self.get_cache_generation() is not None:
+            return True
+
+        metakey = self.get_cache_metakey()
+        return cache_buffer.contains(metakey, key)
+
+    def get_cache_etag(self, key, cached_data):
+        """
+        Get the entity tag of the cached representation, if there is one. The
+        tag is a digest of the rendered content (see cache_response), so it
+        only ever matches what a client was actually sent. Within a dataset,
+        the tag outlives the cached content (see get_etag_cache_key), so that
+        clients can still revalidate after the content expires.
+        """
+        if cached_data is not None:
+            _, _, headers, _ = cached_data
+            return dict(headers).get('ETag')
+
+        if self.get_cache_generation() is None:
+            return None
+        return django_cache.cache.get(self.get_etag_cache_key(key))
 
-        return ':'.join([self.cache_prefix, contenttype, querystring, groups])
+    def get_etag_cache_key(self, key):
+        # The cache key ends with the dataset generation, so the tag is
+        # invalidated along with the content, and can be kept for as long as
+        # API_CACHE_ETAG_TIMEOUT.
+        return key + ':etag'
 
-    def respond_from_cache(self, cached_data):
+    def get_content_etag(self, content):
+        return quote_etag(hashlib.md5(content).hexdigest())
+
+    def get_cache_last_modified(self):
+        kwargs = getattr(self, 'kwargs', None) or {}
+        if 'owner_username' not in kwargs or 'dataset_slug' not in kwargs:
+            return None
+
+        from ..cache import DataSetCache
+        ds_cache = DataSetCache()
+
+        return ds_cache.get_last_modified(
+            owner_username=kwargs['owner_username'],
+            dataset_slug=kwargs['dataset_slug'])
+
+    def is_not_modified(self, request, etag, last_modified):
+        if request.method.upper() not in ('GET', 'HEAD'):
+            return False
+
+        # If-None-Match takes precedence over If-Modified-Since.
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            if etag is None:
+                return False
+            etags = parse_etags(if_none_match)
+            return '*' in etags or unquote_etag(etag) in etags
+
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None:
+            if_modified_since = parse_http_date_safe(if_modified_since)
+            return (last_modified is not None and
+                    if_modified_since is not None and
+                    last_modified <= if_modified_since)
+
+        return False
+
+    def is_response_not_modified(self, request, response):
+        """
+        Check whether the client already has the content of a full response,
+        according to the response's entity tag.
+        """
+        if response.status_code != 200 or getattr(response, 'stale', False):
+            return False
+        if request.META.get('HTTP_IF_NONE_MATCH') is None or not response.has_header('ETag'):
+            return False
+
+        # A gzipped response's tag is weak (see respond_from_cache), but it's
+        # still a digest of the same content.
+        etag = response['ETag']
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        return self.is_not_modified(request, etag, None)
+
+    def strip_response_content(self, response):
+        """
+        Turn a full response into a 304, keeping the headers that the view
+        has already set on it.
+        """
+        response.status_code = status.HTTP_304_NOT_MODIFIED
+        response.content = ''
+        if response.has_header('Content-Encoding'):
+            del response['Content-Encoding']
+
+    def set_validator_headers(self, response, last_modified):
+        if response.status_code not in (200, 304):
+            return response
+
+        # A stale response does not match the current validators.
+        if getattr(response, 'stale', False):
+            return response
+
+        # The entity tag is set along with the content, when it's cached.
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def is_response_cacheable(self, response):
+        # The browsable API renders per-user content (e.g., CSRF tokens in
+        # forms), so we should never cache its output.
+        renderer = getattr(response, 'accepted_renderer', None)
+        return not isinstance(renderer, self.uncacheable_renderer_classes)
+
+    def respond_from_cache(self, cached_data, stale=False):
         # Given some cached data, construct a response.
-        content, status, headers = cached_data
-        response = Response(content, status=status, headers=dict(headers))
+        content, status, headers, compressed = cached_data
+        headers = dict(headers)
+
+        # A stale response does not match the current validators.
+        if stale:
+            headers.pop('ETag', None)
+
+        if compressed:
+            accept_encoding = self.request.META.get('HTTP_ACCEPT_ENCODING', '')
+            if self.accepts_gzip_re.search(accept_encoding):
+                response = CachedResponse(content, status=status, headers=headers, stale=stale)
+                response['Content-Encoding'] = 'gzip'
+                patch_vary_headers(response, ('Accept-Encoding',))
+
+                # The entity tag is a digest of the uncompressed content.
+                if response.has_header('ETag'):
+                    response['ETag'] = 'W/' + response['ETag']
+                return response
+
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+
+        response = CachedResponse(content, status=status, headers=headers, stale=stale)
         return response
 
     def cache_response(self, key, response):
-        data = response.data
+        # Render the response now, so that cache hits can skip serialization
+        # and rendering altogether. The cache key varies on the content type
+        # and query string, so the rendered content is specific to the
+        # negotiated renderer (and JSONP callback).
+        response.render()
+
+        # Tag the response with a digest of its content, so that clients can
+        # revalidate it against the cache without it being rendered again.
+        response['ETag'] = self.get_content_etag(response.content)
+
+        content = response.content
         status = response.status_code
         headers = response.items()
 
-        # Cache enough info to recreate the response.
-        django_cache.cache.set(key, (data, status, headers), settings.API_CACHE_TIMEOUT)
+        compressed = getattr(settings, 'API_CACHE_COMPRESS', False)
+        if compressed:
+            content = compress_string(content)
 
-        # Also, add the key to the set of pages cached from this view.
-        meta_key = self.get_cache_metakey()
-        keys = django_cache.cache.get(meta_key) or set()
-        keys.add(key)
-        django_cache.cache.set(meta_key, keys, settings.API_CACHE_TIMEOUT)
+        # Cache enough info to recreate the response.
+        cached_data = (content, status, headers, compressed)
+        django_cache.cache.set(key, cached_data, settings.API_CACHE_TIMEOUT)
+
+        # Keep the tag longer than the content, so that clients can still be
+        # told that they have the current content once it has expired.
+        if self.get_cache_generation() is not None:
+            django_cache.cache.set(self.get_etag_cache_key(key), response['ETag'],
+                                   getattr(settings, 'API_CACHE_ETAG_TIMEOUT', settings.API_CACHE_TIMEOUT))
+
+        cache_metrics.incr('stores', self.get_cache_metrics_label())
+        cache_metrics.incr('bytes_stored', self.get_cache_metrics_label(), len(content))
+
+        # Keep a copy around a bit longer, to serve while the response is
+        # being rebuilt after it expires or is invalidated.
+        stale_timeout = self.get_cache_stale_timeout()
+        if stale_timeout:
+            stale_key = self.get_stale_cache_key(key)
+            django_cache.cache.set(stale_key, cached_data, settings.API_CACHE_TIMEOUT + stale_timeout)
+
+        # Also, add the key to the set of pages cached from this view, unless
+        # it is already managed by a dataset generation.
+        if self.get_cache_generation() is None:
+            meta_key = self.get_cache_metakey()
+            cache_buffer.add(meta_key, [key])
 
         return response
 
@@ -648,6 +1275,11 @@ class QueryError(exceptions.APIException):
         self.detail = detail or self.default_detail
 
 
+class NotSupported(exceptions.APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = 'This request is not supported by the server.'
+
+
 ###############################################################################
 #
 # Resource Views
@@ -688,7 +1320,7 @@ class ShareaboutsAPIRootView (views.APIView):
         return Response(response_data)
 
 
-class PlaceInstanceView (Sanitizer, CachedResourceMixin, LocatedResourceMixin, OwnedResourceMixin, FilteredResourceMixin, generics.RetrieveUpdateDestroyAPIView):
+class PlaceInstanceView (Sanitizer, CachedResourceMixin, LocatedResourceMixin, OwnedResourceMixin, FilteredResourceMixin, EncodedGeometryMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET
     ---
@@ -720,6 +1352,21 @@ class PlaceInstanceView (Sanitizer, CachedResourceMixin, LocatedResourceMixin, O
 
         Show private places.
 
+      * `precision=<digits>`
+
+        Round the coordinates of the place geometry to the given number of
+        decimal places.
+
+      * `simplify=<tolerance>`
+
+        Simplify lines and polygons to within the given tolerance, in
+        degrees.
+
+      * `zoom=<z>`
+
+        Round and simplify the place geometry for display on a map at the
+        given zoom level, unless `precision` or `simplify` are given.
+
     PUT
     ---
     Update a place
@@ -772,15 +1419,17 @@ class PlaceInstanceView (Sanitizer, CachedResourceMixin, LocatedResourceMixin, O
     def get_object_or_none(self, pk=None):
         if pk is None:
             pk = self.kwargs['place_id']
+        queryset = self.model.objects\
+            .filter(pk=pk)\
+            .select_related('dataset', 'dataset__owner', 'submitter')\
+            .prefetch_related('submitter__social_auth',
+                              'submissions',
+                              'submissions__attachments',
+                              'attachments')
+        queryset = self.encode_geometries(queryset)
+
         try:
-            return self.model.objects\
-                .filter(pk=pk)\
-                .select_related('dataset', 'dataset__owner', 'submitter')\
-                .prefetch_related('submitter__social_auth',
-                                  'submissions',
-                                  'submissions__attachments',
-                                  'attachments')\
-                .get()
+            return queryset.get()
         except self.model.DoesNotExist:
             return None
 
@@ -809,7 +1458,42 @@ class CompletePlaceListRequestView (OwnedResourceMixin, generics.RetrieveAPIView
 
 
 class PlaceListMixin (object):
-    pass
+    """
+    A view mixin for the places in a dataset that match the request's query
+    parameters. Invisible and private places are left out unless they are
+    explicitly requested.
+    """
+    def get_place_queryset(self):
+        dataset = self.get_dataset()
+        queryset = self.locate_queryset(
+            self.filter_queryset(models.Place.objects.all())
+        )
+
+        # If the user is not allowed to request invisible data then we won't
+        # be here in the first place.
+        if INCLUDE_INVISIBLE_PARAM not in self.request.GET:
+            queryset = queryset.filter(visible=True)
+
+        if INCLUDE_PRIVATE_PLACES_PARAM not in self.request.GET:
+            queryset = queryset.filter(
+                private=False,
+            )
+
+        return queryset.filter(dataset=dataset)
+
+    def get_requested_attr_names(self):
+        """
+        Get the names of the data attributes requested with the attrs
+        parameter. Private attributes may only be requested along with
+        private fields.
+        """
+        attr_names = [attr_name.strip()
+                      for attr_name in self.request.GET.get(ATTRS_PARAM, '').split(',')
+                      if attr_name.strip()]
+        for attr_name in attr_names:
+            if attr_name.startswith('private') and INCLUDE_PRIVATE_FIELDS_PARAM not in self.request.GET:
+                raise QueryError(detail='Invalid parameter for "%s": %r is a private attribute' % (ATTRS_PARAM, attr_name))
+        return attr_names
 
 
 class PlaceListView (
@@ -818,6 +1502,8 @@ class PlaceListView (
         LocatedResourceMixin,
         OwnedResourceMixin,
         FilteredResourceMixin,
+        PlaceListMixin,
+        EncodedGeometryMixin,
         EmailTemplateMixin,
         bulk_generics.ListCreateBulkUpdateAPIView
 ):
@@ -865,6 +1551,11 @@ class PlaceListView (
         [WKT](http://en.wikipedia.org/wiki/Well-known_text), or as a
         comma-separated latitude and longitude, if it is a point.
 
+      * `limit=<count>`
+
+        When used in conjunction with the `near` parameter, return just the
+        given number of nearest places, without paginating the results.
+
       * `distance_lt=<distance>`
 
         When used in conjunction with the `near` parameter, can filter the
@@ -880,11 +1571,44 @@ class PlaceListView (
         comma-separated list of 4 numeric values: western longitude, northern
         latitude, eastern longitude, southern latitude.
 
+      * `snap_to_tiles`
+
+        When used in conjunction with the `bounds` parameter, fetch the
+        places by the web map tiles that cover the bounds, so that the places
+        on each tile can be cached and shared by requests for nearby bounds.
+        All of the places within the bounds are returned, unpaginated, as
+        long as there are at most 1000 near the bounds. Cannot be combined
+        with `near`, `limit`, or `order_by`.
+
       * `<attr>=<value>`
 
         Filter the place list to only return the places where the attribute is
         equal to the given value. *The attribute should be indexed.*
 
+      * `precision=<digits>`
+
+        Round the coordinates of the place geometries to the given number of
+        decimal places.
+
+      * `simplify=<tolerance>`
+
+        Simplify lines and polygons to within the given tolerance, in
+        degrees.
+
+      * `zoom=<z>`
+
+        Round and simplify the place geometries for display on a map at the
+        given zoom level, unless `precision` or `simplify` are given.
+
+      * `grid=<cell_size>` or `cluster=<zoom>`
+
+        Instead of the places, return clusters of places: the places are
+        aggregated into the cells of a grid, either with the given cell size
+        (in degrees), or sized for a map at the given zoom level. Each cluster
+        is a feature with the centroid of its places as the geometry, and
+        the number of places (`count`) and their `bounds` as properties. All
+        of the filters above apply.
+
     POST
     ----
 
@@ -900,6 +1624,186 @@ class PlaceListView (
     renderer_classes = (renderers.GeoJSONRenderer, renderers.GeoJSONPRenderer) + OwnedResourceMixin.renderer_classes[2:]
     parser_classes = (parsers.GeoJSONParser,) + OwnedResourceMixin.parser_classes[1:]
 
+    # The number of grid cells across a map tile when clustering for a zoom
+    # level.
+    cluster_cells_per_tile = 8
+
+    # The most places that can be requested with the limit parameter
+    max_limit = 1000
+
+    # When snapping the bounds to tiles, the highest zoom level to use, and
+    # the most tiles across (or down) the bounds may span.
+    max_snap_zoom = 18
+    snap_tiles_across = 2
+
+    # The most places that can be listed at once when snapping to tiles,
+    # since they are not paginated.
+    max_snap_places = 1000
+
+    def list(self, request, *args, **kwargs):
+        cell_size = self.get_cluster_cell_size()
+        if cell_size is not None:
+            # Aggregate the places in the database, instead of listing them.
+            clusters = self.get_place_queryset().grid_clusters(cell_size)
+            return Response({'type': 'FeatureCollection', 'features': clusters})
+
+        if SNAP_TO_TILES_PARAM in request.GET and BBOX_PARAM in request.GET:
+            return self.list_by_tiles()
+
+        limit = self.get_limit()
+        if limit is not None:
+            # Just get the nearest places, without counting all the places
+            # for the paginator.
+            places = self.get_queryset()[:limit]
+            serializer = self.get_serializer(places, many=True)
+            return Response({'type': 'FeatureCollection', 'features': serializer.data})
+
+        return super(PlaceListView, self).list(request, *args, **kwargs)
+
+    def get_bounds(self):
+        # When snapping the bounds to tiles, places are fetched by tile
+        # instead (see list_by_tiles).
+        if SNAP_TO_TILES_PARAM in self.request.GET:
+            return None
+        return super(PlaceListView, self).get_bounds()
+
+    def list_by_tiles(self):
+        """
+        List the places within the requested bounds by way of the web map
+        tiles that cover the bounds. The places on each tile are cached, so
+        that requests for nearby bounds can share them. The places from the
+        tiles are then clipped to the bounds.
+        """
+        for param in (NEAR_PARAM, ORDER_BY_PARAM, LIMIT_PARAM):
+            if param in self.request.GET:
+                raise QueryError(detail='The "%s" parameter cannot be used with "%s"' % (param, SNAP_TO_TILES_PARAM))
+
+        west, south, east, north = super(PlaceListView, self).get_bounds()
+        z, tiles = self.get_covering_tiles(west, south, east, north)
+        places = self.get_queryset()
+
+        features = []
+        feature_ids = set()
+        for x, y in tiles:
+            for (xmin, ymin, xmax, ymax), feature in self.get_tile_features(places, z, x, y):
+                if feature['id'] in feature_ids:
+                    continue
+                if west <= xmin and xmax <= east and south <= ymin and ymax <= north:
+                    feature_ids.add(feature['id'])
+                    features.append(feature)
+
+        if len(features) > self.max_snap_places:
+            raise self.too_many_snapped_places()
+
+        # Most recently updated first, as in the place list
+        features.sort(key=lambda feature: feature['updated_datetime'], reverse=True)
+        return Response({'type': 'FeatureCollection', 'features': features})
+
+    def too_many_snapped_places(self):
+        return QueryError(detail='There are more than %s places near the "%s"; use smaller bounds, or leave out "%s"' % (
+            self.max_snap_places, BBOX_PARAM, SNAP_TO_TILES_PARAM))
+
+    def get_covering_tiles(self, west, south, east, north):
+        """
+        Get the zoom level and the tiles at that level to fetch places by,
+        for the given bounds. The zoom level is the highest at which the
+        bounds span at most snap_tiles_across tiles in each direction.
+        """
+        # Start from the zoom level at which the bounds' width would span
+        # that many tiles, and compare the ranges of tiles at each level, so
+        # that the tiles are only listed once there are few enough of them.
+        width = max(east - west, 360.0 / 2 ** self.max_snap_zoom)
+        z = int(math.floor(math.log(self.snap_tiles_across * 360.0 / width, 2)))
+        for z in range(max(0, min(self.max_snap_zoom, z)), -1, -1):
+            (min_x, max_x), (min_y, max_y) = utils.tile_ranges_covering(z, west, south, east, north)
+            if (max_x - min_x < self.snap_tiles_across and
+                max_y - min_y < self.snap_tiles_across):
+                return z, utils.tiles_covering(z, west, south, east, north)
+        return 0, [(0, 0)]
+
+    def get_tile_features(self, places, z, x, y):
+        """
+        Get the serialized places that overlap the given tile, each along
+        with the extent of its geometry, from the cache if possible.
+        """
+        cache_key = self.get_tile_cache_key(z, x, y)
+        entries = django_cache.cache.get(cache_key) if cache_key else None
+
+        if entries is None:
+            tile_area = Polygon.from_bbox(utils.tile_lnglat_bounds(z, x, y))
+            tile_area.srid = 4326
+            tile_places = list(places.filter(geometry__bboverlaps=tile_area)[:self.max_snap_places + 1])
+            if len(tile_places) > self.max_snap_places:
+                raise self.too_many_snapped_places()
+            serializer = self.get_serializer(tile_places, many=True)
+            entries = [(place.geometry.extent, feature)
+                       for place, feature in zip(tile_places, serializer.data)]
+
+            if cache_key:
+                django_cache.cache.set(cache_key, entries, settings.API_CACHE_TIMEOUT)
+
+        return entries
+
+    def get_tile_cache_key(self, z, x, y):
+        """
+        Get the cache key for the places on a tile. The key varies on all the
+        parameters that the response would, except for the bounds.
+        """
+        generation = self.get_cache_generation()
+        if generation is None:
+            return None
+
+        querystring = self.get_cache_querystring(
+            self.request, exclude=(BBOX_PARAM, FORMAT_PARAM, PAGE_PARAM, PAGE_SIZE_PARAM(), CALLBACK_PARAM(self)))
+        return ':'.join([
+            'tile', self.cache_prefix, self.request.accepted_renderer.format,
+            querystring, self.get_cache_groups(self.request), str(generation),
+            '%s/%s/%s' % (z, x, y)])
+
+    def get_limit(self):
+        """
+        Get the number of nearest places requested, or None if the places
+        should be paginated as usual.
+        """
+        if LIMIT_PARAM not in self.request.GET:
+            return None
+
+        if NEAR_PARAM not in self.request.GET:
+            raise QueryError(detail='You must specify a "%s" parameter when using "%s"' % (NEAR_PARAM, LIMIT_PARAM))
+
+        try:
+            limit = int(self.request.GET[LIMIT_PARAM])
+        except ValueError:
+            limit = None
+        if limit is None or not (0 < limit <= self.max_limit):
+            raise QueryError(detail='Invalid parameter for "%s": %r' % (LIMIT_PARAM, self.request.GET[LIMIT_PARAM]))
+        return limit
+
+    def get_cluster_cell_size(self):
+        """
+        Get the grid cell size (in degrees) to cluster the places by, or None
+        if clusters were not requested.
+        """
+        if GRID_PARAM in self.request.GET:
+            try:
+                cell_size = float(self.request.GET[GRID_PARAM])
+            except ValueError:
+                cell_size = None
+            if cell_size is None or not (0 < cell_size <= 360):
+                raise QueryError(detail='Invalid parameter for "%s": %r' % (GRID_PARAM, self.request.GET[GRID_PARAM]))
+            return cell_size
+
+        if CLUSTER_PARAM in self.request.GET:
+            try:
+                zoom = int(self.request.GET[CLUSTER_PARAM])
+            except ValueError:
+                zoom = None
+            if zoom is None or not (0 <= zoom <= 30):
+                raise QueryError(detail='Invalid parameter for "%s": %r' % (CLUSTER_PARAM, self.request.GET[CLUSTER_PARAM]))
+            return 360.0 / 2 ** zoom / self.cluster_cells_per_tile
+
+        return None
+
     # Overriding create so we can sanitize submitted fields, which may
     # contain raw HTML intended to be rendered in the client
     def create(self, request, *args, **kwargs):
@@ -926,12 +1830,6 @@ class PlaceListView (
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def get_cache_metakey(self):
-        metakey_kwargs = self.kwargs.copy()
-        metakey_kwargs.pop('pk_list', None)
-        prefix = reverse('place-list', kwargs=metakey_kwargs)
-        return prefix + '_keys'
-
     def post_save(self, obj, created):
         # Get all place/add webhooks since we just added a place.
         if not created:
@@ -945,15 +1843,9 @@ class PlaceListView (
         self.send_email_notification(obj, submission_set_name='places')
 
     def get_queryset(self):
-        dataset = self.get_dataset()
-        queryset = self.locate_queryset(
-            self.filter_queryset(models.Place.objects.all())
-        )
+        queryset = self.get_place_queryset()
 
-        # If the user is not allowed to request invisible data then we won't
-        # be here in the first place.
-        if INCLUDE_INVISIBLE_PARAM not in self.request.GET:
-            queryset = queryset.filter(visible=True)
+        queryset = self.encode_geometries(queryset)
 
         # If we're updating, limit the queryset to the items that are being
         # updated.
@@ -962,16 +1854,18 @@ class PlaceListView (
             ids = [obj['id'] for obj in data if 'id' in obj]
             queryset = queryset.filter(pk__in=ids)
 
-        queryset = queryset.filter(dataset=dataset)\
+        queryset = queryset\
             .select_related('dataset', 'dataset__owner', 'submitter')\
             .prefetch_related(
                 'submitter__social_auth',
                 'submitter___groups',
                 'submitter___groups__dataset',
                 'submitter___groups__dataset__owner',
-                'submissions',
                 'attachments')
 
+        # Submission set summaries are counted for the whole page at once
+        # (see PlaceListSerializer), so the submissions themselves are only
+        # loaded when they're to be included.
         if INCLUDE_SUBMISSIONS_PARAM in self.request.GET:
             queryset = queryset.prefetch_related(
                 'submissions',
@@ -986,11 +1880,6 @@ class PlaceListView (
                 'tags__submitter',
             )
 
-        if INCLUDE_PRIVATE_PLACES_PARAM not in self.request.GET:
-            queryset = queryset.filter(
-                private=False,
-            )
-
         return queryset
 
     def trigger_webhooks(self, webhooks, obj):
@@ -1025,6 +1914,118 @@ class PlaceListView (
                 logger.error(e)
 
 
+class PlaceFacetView (CachedResourceMixin, LocatedResourceMixin, OwnedResourceMixin, FilteredResourceMixin, PlaceListMixin, generics.GenericAPIView):
+    """
+
+    GET
+    ---
+    Count the places in a dataset by their values of indexed attributes
+
+    **Authentication**: Basic, session, or key auth *(optional)*
+
+    **Request Parameters**:
+
+      * `attrs=<attr>,<attr>,...` *(required)*
+
+        The attributes to count values of. *The attributes should be
+        indexed.*
+
+    All of the filter parameters of the place list are also supported, so
+    that the counts are of the places that the place list would return.
+
+    **Response**:
+
+    For each attribute, the values that places have and the number of
+    places that have each value, most common first:
+
+        {
+          "status": [
+            {"value": "open", "count": 12},
+            {"value": "closed", "count": 3}
+          ]
+        }
+
+    ------------------------------------------------------------
+    """
+    renderer_classes = (JSONRenderer, JSONPRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, *args, **kwargs):
+        attr_names = self.get_requested_attr_names()
+        if not attr_names:
+            raise QueryError(detail='You must specify the attributes to count with the "%s" parameter' % (ATTRS_PARAM,))
+
+        attr_names_by_index_id = {}
+        for attr_name in attr_names:
+            index = self.get_dataset_indexes().get(attr_name)
+            if index is None:
+                raise QueryError(detail='Invalid parameter for "%s": %r is not an indexed attribute' % (ATTRS_PARAM, attr_name))
+            if index.is_building:
+                raise QueryError(detail='Invalid parameter for "%s": %r is still being indexed; try again in a few moments' % (ATTRS_PARAM, attr_name))
+            attr_names_by_index_id[index.id] = attr_name
+
+        # Count the values within the database, in one query over the
+        # indexed values of the matching places.
+        places = self.get_place_queryset().order_by()
+        value_counts = models.IndexedValue.objects\
+            .filter(index_id__in=attr_names_by_index_id.keys(),
+                    thing_id__in=places.values('pk'))\
+            .values('index_id', 'value')\
+            .annotate(count=Count('pk'))\
+            .order_by('index_id', '-count', 'value')
+
+        facets = dict((attr_name, []) for attr_name in attr_names)
+        for value_count in value_counts:
+            facets[attr_names_by_index_id[value_count['index_id']]].append({
+                'value': value_count['value'],
+                'count': value_count['count'],
+            })
+        return Response(facets)
+
+
+class PlaceTileView (CachedResourceMixin, LocatedResourceMixin, OwnedResourceMixin, FilteredResourceMixin, PlaceListMixin, generics.GenericAPIView):
+    """
+
+    GET
+    ---
+    Get the places in a dataset that fall on a web map tile, as a Mapbox
+    Vector Tile, with a layer named "places"
+
+    **Authentication**: Basic, session, or key auth *(optional)*
+
+    **Request Parameters**:
+
+      * `attrs=<attr>,<attr>,...`
+
+        The data attributes to include as properties of the features, in
+        addition to the place id. Values are included as text.
+
+    All of the filter parameters of the place list are also supported.
+
+    ------------------------------------------------------------
+    """
+    renderer_classes = (renderers.MVTRenderer,)
+
+    # The highest zoom level that tiles are served for
+    max_zoom = 30
+
+    def get(self, request, *args, **kwargs):
+        z, x, y = [int(self.kwargs[coord]) for coord in ('z', 'x', 'y')]
+        if z > self.max_zoom or x >= 2 ** z or y >= 2 ** z:
+            raise Http404
+
+        places = self.get_place_queryset()
+        if not places.supports_vector_tiles():
+            raise NotSupported(detail='Vector tiles require PostGIS %s or later.' %
+                               '.'.join(map(str, places.vector_tile_postgis_version)))
+
+        try:
+            tile = places.as_vector_tile(
+                z, x, y, attr_names=self.get_requested_attr_names())
+        except ValueError as e:
+            raise QueryError(detail='Invalid parameter for "%s": %s' % (ATTRS_PARAM, e))
+        return Response(tile)
+
+
 class SubmissionInstanceView (CachedResourceMixin, OwnedResourceMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     GET
@@ -1134,12 +2135,6 @@ class SubmissionListView (CachedResourceMixin, OwnedResourceMixin, FilteredResou
     place_id_kwarg = 'place_id'
     submission_set_name_kwarg = 'submission_set_name'
 
-    def get_cache_metakey(self):
-        metakey_kwargs = self.kwargs.copy()
-        metakey_kwargs.pop('pk_list', None)
-        prefix = reverse('submission-list', kwargs=metakey_kwargs)
-        return prefix + '_keys'
-
     def get_place_model(self, dataset):
         place_id = self.kwargs[self.place_id_kwarg]
         place = get_object_or_404(models.Place, dataset=dataset, id=place_id)
@@ -1230,12 +2225,6 @@ class DataSetSubmissionListView (CachedResourceMixin, ProtectedOwnedResourceMixi
 
     submission_set_name_kwarg = 'submission_set_name'
 
-    def get_cache_metakey(self):
-        metakey_kwargs = self.kwargs.copy()
-        metakey_kwargs.pop('pk_list', None)
-        prefix = reverse('dataset-submission-list', kwargs=metakey_kwargs)
-        return prefix + '_keys'
-
     def get_queryset(self):
         dataset = self.get_dataset()
         submission_set_name = self.kwargs[self.submission_set_name_kwarg]
@@ -1840,6 +2829,23 @@ class CurrentUserInstanceView (CorsEnabledMixin, views.APIView):
         return HttpResponse(status=204)
 
 
+class CacheMetricsView (views.APIView):
+    """
+    GET
+    ---
+    Get the cache metrics recorded by the worker process that handles the
+    request.
+
+    **Authentication**: Session *(required, staff only)*
+
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(cache_metrics.snapshot())
+
+
 class SessionKeyView (CorsEnabledMixin, views.APIView):
     renderer_classes = (JSONRenderer, JSONPRenderer, BrowsableAPIRenderer)
     content_negotiation_class = ShareaboutsContentNegotiation
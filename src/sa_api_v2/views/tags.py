@@ -1,6 +1,5 @@
 from .. import models
 from rest_framework.response import Response
-from django.core.urlresolvers import reverse
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from .base_views import (
@@ -172,12 +171,6 @@ class PlaceTagListView (CachedResourceMixin, OwnedResourceMixin,
         place = get_object_or_404(models.Place, dataset=dataset, id=place_id)
         return place
 
-    def get_cache_metakey(self):
-        metakey_kwargs = self.kwargs.copy()
-        metakey_kwargs.pop('pk_list', None)
-        prefix = reverse('place-tag-list', kwargs=metakey_kwargs)
-        return prefix + '_keys'
-
     def get_queryset(self):
         dataset = self.get_dataset()
         place = self.get_place_model(dataset)